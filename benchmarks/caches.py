@@ -0,0 +1,132 @@
+"""
+Compare the hit rate and latency of the cache backends when several worker processes share the load.
+
+Each worker serves requests for random users, with a few popular users asking far more often than the rest (a Zipf
+distribution). A request looks the user up in the cache, and on a miss spends --miss-ms computing a list of
+recommendations and stores it. Every worker has its own LRUCache with the 'local' backend, while with 'sqlite' they
+all share one SqliteCache file. Like a gunicorn gevent worker, which runs each request in a new greenlet, every request
+is served by a new thread, so the timings include anything a backend sets up per thread rather than per process.
+
+    python -m benchmarks.caches --workers 1 4 8 --users 100000 --cache-size 10000 --requests 20000
+"""
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import timeit
+
+import numpy as np
+
+from eggsnspam.common.caches import LRUCache, SqliteCache
+
+
+BACKENDS = ('local', 'sqlite')
+
+
+def make_cache(task):
+    if task['backend'] == 'local':
+        return LRUCache(task['cache_size'])
+    return SqliteCache(task['path'], 'benchmark', task['cache_size'])
+
+
+def run_worker(task):
+    """Serve a worker's share of the requests, returning its hit and miss counts and the seconds each lookup and
+    request took"""
+    cache = make_cache(task)
+    random = np.random.RandomState(task['seed'])
+    user_ids = (random.zipf(task['zipf'], task['requests']) % task['users']).tolist()
+
+    get_seconds, request_seconds = [], []
+
+    def serve(user_id):
+        started = timeit.default_timer()
+        recommendations = cache.get(('recommendations', user_id))
+        get_seconds.append(timeit.default_timer() - started)
+
+        if recommendations is None:
+            time.sleep(task['miss_ms'] / 1000.0)
+            recommendations = [{'breakfast_id': i, 'score': 1.0 / (i + 1)} for i in range(task['limit'])]
+            cache.set(('recommendations', user_id), recommendations)
+        request_seconds.append(timeit.default_timer() - started)
+
+    for user_id in user_ids:
+        thread = threading.Thread(target=serve, args=(user_id,))
+        thread.start()
+        thread.join()
+
+    return cache.hits, cache.misses, get_seconds, request_seconds
+
+
+def run(backend, workers, args, path):
+    """Run every worker at once against the backend, and summarize their results"""
+    if os.path.exists(path):
+        os.remove(path)
+    tasks = [{
+        'backend': backend,
+        'path': path,
+        'cache_size': args.cache_size,
+        'users': args.users,
+        'zipf': args.zipf,
+        'requests': args.requests // workers,
+        'miss_ms': args.miss_ms,
+        'limit': args.limit,
+        'seed': args.seed + i,
+    } for i in range(workers)]
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        started = timeit.default_timer()
+        results = pool.map(run_worker, tasks)
+        elapsed = timeit.default_timer() - started
+    finally:
+        pool.close()
+        pool.join()
+
+    hits = sum(r[0] for r in results)
+    misses = sum(r[1] for r in results)
+    get_us = np.concatenate([r[2] for r in results]) * 1e6
+    request_ms = np.concatenate([r[3] for r in results]) * 1e3
+    return {
+        'hit_rate': float(hits) / (hits + misses),
+        'get_p50_us': np.percentile(get_us, 50),
+        'get_p99_us': np.percentile(get_us, 99),
+        'request_mean_ms': request_ms.mean(),
+        'requests_per_sec': len(request_ms) / elapsed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8], help='numbers of workers to run')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--users', type=int, default=100000, help='distinct users asking for recommendations')
+    parser.add_argument('--zipf', type=float, default=1.2, help='skew of how often each user asks')
+    parser.add_argument('--cache-size', type=int, default=10000, help='most users each cache keeps')
+    parser.add_argument('--requests', type=int, default=20000, help='requests split between the workers')
+    parser.add_argument('--miss-ms', type=float, default=2.0, help='milliseconds to compute a missed result')
+    parser.add_argument('--limit', type=int, default=10, help='recommendations per result')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='eggsnspam-benchmark-')
+    try:
+        print('{:>8} {:>8} {:>9} {:>12} {:>12} {:>16} {:>13}'.format(
+            'backend', 'workers', 'hit rate', 'get p50 us', 'get p99 us', 'request mean ms', 'requests/sec'))
+        for workers in args.workers:
+            for backend in args.backends:
+                result = run(backend, workers, args, os.path.join(work_dir, 'cache.db'))
+                print('{:>8} {:>8} {:>9.1%} {:>12.1f} {:>12.1f} {:>16.2f} {:>13.0f}'.format(
+                    backend, workers, result['hit_rate'], result['get_p50_us'], result['get_p99_us'],
+                    result['request_mean_ms'], result['requests_per_sec']))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
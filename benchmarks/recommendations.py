@@ -0,0 +1,264 @@
+"""
+Benchmark every recommendation implementation against synthetic catalogs of growing size.
+
+For each combination of --breakfasts, --ingredients and --preferences a SQLite database is generated, and each
+implementation is timed recommending breakfasts for random users, both end-to-end through the Flask test client
+('http') and by calling the view or model method directly ('function'). Each implementation runs in its own process,
+so its peak memory can be measured.
+
+    python -m benchmarks.recommendations --breakfasts 100 1000 10000 100000 --ingredients 10 100 1000 10000 \\
+        --preferences 5 50 --output results.json
+
+Results are printed and written as JSON. Pass --baseline with the JSON from an earlier run, e.g. of the previous
+release, to compare the latencies.
+"""
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+from sqlalchemy.orm import joinedload
+
+from eggsnspam.app import create_app
+from eggsnspam.common.catalog import catalog_cache
+from eggsnspam.extensions import db
+from eggsnspam.oop_orm.models import User
+from eggsnspam.oop_phrasebook.models import UserModel
+from eggsnspam.settings.base import BaseConfig
+from eggsnspam.simple_phrasebook import views as simple_phrasebook_views
+
+from .synthetic import write_database
+
+
+LEVELS = ('function', 'http')
+
+# The columns which identify a result, to match it up with the same result in another run
+RESULT_KEY = ('breakfasts', 'ingredients', 'ingredients_per_breakfast', 'preferences_per_user', 'implementation',
+              'level')
+
+
+class BenchmarkConfig(BaseConfig):
+    """The app's default configuration, pointed at a generated database by run_implementation()."""
+
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def _time(func, *args, **kwargs):
+    """Return how many seconds calling func took"""
+    started = timeit.default_timer()
+    func(*args, **kwargs)
+    return timeit.default_timer() - started
+
+
+def time_simple_phrasebook(app, user_id, limit):
+    with app.test_request_context(query_string={'limit': limit}):
+        return _time(simple_phrasebook_views.get_breakfast_preferences, user_id)
+
+
+def time_oop_phrasebook(app, user_id, limit):
+    user = UserModel()
+    user.load_by_id_with_preferences(user_id)
+    return _time(user.get_recommendations, limit=limit)
+
+
+def time_oop_orm(app, user_id, limit):
+    user = User.query.options(joinedload('preferences')).filter_by(id=user_id).one()
+    return _time(user.get_recommendations, limit=limit)
+
+
+# The URL each implementation serves recommendations at, and a function timing its method for one user, not counting
+# loading the user
+IMPLEMENTATIONS = {
+    'simple_phrasebook': ('/simple_phrasebook/user/{}/breakfast_recommendations', time_simple_phrasebook),
+    'oop_phrasebook': ('/oop_phrasebook/user/{}/breakfast_recommendations', time_oop_phrasebook),
+    'oop_orm': ('/oop_orm/user/{}/breakfast_recommendations', time_oop_orm),
+}
+
+
+def peak_rss_mb():
+    """Return the most memory the process has had resident so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB and macOS bytes
+    return peak / 1024.0 ** (2 if sys.platform == 'darwin' else 1)
+
+
+def summarize(seconds):
+    """Return the latency percentiles of a list of timings, in milliseconds"""
+    milliseconds = np.array(seconds) * 1000
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99]).tolist()
+    return {'mean_ms': float(milliseconds.mean()), 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99}
+
+
+def write_scenario_database(task):
+    write_database(task['database'], task['breakfasts'], task['ingredients'], task['ingredients_per_breakfast'],
+                   task['users'], task['preferences_per_user'], seed=task['seed'])
+    return task['database']
+
+
+def run_implementation(task):
+    """Time one implementation against one scenario's database, at each of the task's levels.
+
+    The first request of each level loads the catalog, so it is reported separately as first_ms rather than being
+    counted in the percentiles.
+    """
+    os.environ['FLASK_CONFIG'] = 'benchmarks.recommendations.BenchmarkConfig'
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + task['database']
+    url, time_function = IMPLEMENTATIONS[task['implementation']]
+    client = app.test_client()
+
+    random = np.random.RandomState(task['seed'])
+    user_ids = random.randint(1, task['users'] + 1, task['requests'] + 1).tolist()
+
+    results = []
+    with app.app_context():
+        baseline_rss = peak_rss_mb()
+
+        for level in task['levels']:
+            catalog_cache.invalidate()
+            seconds = []
+            for user_id in user_ids:
+                if level == 'http':
+                    started = timeit.default_timer()
+                    response = client.get(url.format(user_id), query_string={'limit': task['limit']})
+                    seconds.append(timeit.default_timer() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError('{} returned {}'.format(url.format(user_id), response.status_code))
+                else:
+                    seconds.append(time_function(app, user_id, task['limit']))
+                    db.session.remove()
+
+            result = {key: task[key] for key in ('breakfasts', 'ingredients', 'ingredients_per_breakfast', 'users',
+                                                 'preferences_per_user', 'implementation', 'requests', 'limit')}
+            result.update(level=level, first_ms=seconds[0] * 1000, **summarize(seconds[1:]))
+            results.append(result)
+
+    # Memory is measured for the implementation as a whole, since every level shares the catalog
+    peak_rss = peak_rss_mb()
+    for result in results:
+        result.update(peak_rss_mb=peak_rss, rss_growth_mb=peak_rss - baseline_rss)
+    return results
+
+
+def build_tasks(args, work_dir):
+    """Build a task for each scenario's database, and for each implementation to time against it"""
+    scenarios = sorted(set(
+        (breakfasts, ingredients, min(preferences, ingredients))
+        for breakfasts, ingredients, preferences in itertools.product(args.breakfasts, args.ingredients,
+                                                                      args.preferences)))
+
+    database_tasks, implementation_tasks = [], []
+    for breakfasts, ingredients, preferences in scenarios:
+        scenario = {
+            'breakfasts': breakfasts,
+            'ingredients': ingredients,
+            'ingredients_per_breakfast': min(args.ingredients_per_breakfast, ingredients),
+            'users': args.users,
+            'preferences_per_user': preferences,
+            'seed': args.seed,
+            'database': os.path.join(work_dir, 'benchmark-{}-{}-{}.db'.format(breakfasts, ingredients, preferences)),
+        }
+        database_tasks.append(scenario)
+        implementation_tasks.extend(dict(scenario, implementation=implementation, levels=args.levels,
+                                         requests=args.requests, limit=args.limit)
+                                    for implementation in args.implementations)
+    return database_tasks, implementation_tasks
+
+
+def compare(results, baseline):
+    """Print how each result's latencies changed from the same result in a baseline run"""
+    baseline_results = {tuple(r[key] for key in RESULT_KEY): r for r in baseline['results']}
+    print('\nChange from baseline ({}):'.format(baseline['meta']['started_at']))
+    for result in results:
+        old = baseline_results.get(tuple(result[key] for key in RESULT_KEY))
+        if old is None:
+            continue
+        changes = ['{} {:+.0%}'.format(stat, result[stat] / old[stat] - 1) for stat in ('p50_ms', 'p95_ms', 'p99_ms')
+                   if old[stat]]
+        print('{:>7} {:>6} {:>4} {:<18} {:<9} {}'.format(
+            result['breakfasts'], result['ingredients'], result['preferences_per_user'], result['implementation'],
+            result['level'], '  '.join(changes)))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--breakfasts', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help='catalog sizes to generate')
+    parser.add_argument('--ingredients', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help='numbers of ingredients')
+    parser.add_argument('--preferences', type=int, nargs='+', default=[5, 50],
+                        help='ingredient preferences per user (at most the number of ingredients)')
+    parser.add_argument('--ingredients-per-breakfast', type=int, default=10)
+    parser.add_argument('--users', type=int, default=1000, help='users to generate')
+    parser.add_argument('--requests', type=int, default=200, help='requests to time per implementation and level')
+    parser.add_argument('--limit', type=int, default=10, help='breakfasts to recommend per request')
+    parser.add_argument('--implementations', nargs='+', choices=sorted(IMPLEMENTATIONS),
+                        default=sorted(IMPLEMENTATIONS))
+    parser.add_argument('--levels', nargs='+', choices=LEVELS, default=list(LEVELS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help='directory to generate the databases in (default: a temporary one)')
+    parser.add_argument('--output', default='benchmark-results.json', help='file to write the results to')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='eggsnspam-benchmark-')
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+
+    meta = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'options': vars(args),
+    }
+    database_tasks, implementation_tasks = build_tasks(args, work_dir)
+
+    # Start a fresh process for every task, so each one's peak memory is its own
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    results = []
+    try:
+        for database in pool.imap(write_scenario_database, database_tasks, chunksize=1):
+            print('Generated {}'.format(database))
+
+        print('\n{:>7} {:>6} {:>4} {:<18} {:<9} {:>9} {:>8} {:>8} {:>8} {:>9}'.format(
+            'bfasts', 'ingred', 'pref', 'implementation', 'level', 'first ms', 'p50 ms', 'p95 ms', 'p99 ms',
+            'peak MB'))
+        for implementation_results in pool.imap(run_implementation, implementation_tasks, chunksize=1):
+            for r in implementation_results:
+                print('{:>7} {:>6} {:>4} {:<18} {:<9} {:>9.2f} {:>8.2f} {:>8.2f} {:>8.2f} {:>9.1f}'.format(
+                    r['breakfasts'], r['ingredients'], r['preferences_per_user'], r['implementation'], r['level'],
+                    r['first_ms'], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['peak_rss_mb']))
+            results.extend(implementation_results)
+    finally:
+        pool.close()
+        pool.join()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+    print('\nWrote {} results to {}'.format(len(results), args.output))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
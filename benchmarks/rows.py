@@ -0,0 +1,77 @@
+"""
+Compare how fast each of SqlBaseDao's row formats, and fetch_columns(), read the breakfast ingredient table, and how
+big each row is.
+
+    python -m benchmarks.rows --breakfasts 100000 --ingredients-per-breakfast 10
+
+Bytes per row only counts the dict or tuple holding a row's values, since the values themselves are the same objects
+whichever format holds them. For columns it is the size of a row's values in the arrays.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from sqlalchemy import create_engine
+
+from eggsnspam.common.catalog import BreakfastCatalog
+from eggsnspam.common.daos import SqlBaseDao
+from eggsnspam.oop_phrasebook.daos import BreakfastIngredientDao
+
+from .synthetic import write_database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--breakfasts', type=int, default=100000)
+    parser.add_argument('--ingredients', type=int, default=1000)
+    parser.add_argument('--ingredients-per-breakfast', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='eggsnspam-benchmark-')
+    try:
+        path = os.path.join(work_dir, 'rows.db')
+        write_database(path, args.breakfasts, args.ingredients, args.ingredients_per_breakfast, 1, 1)
+        conn = create_engine('sqlite:///' + path).connect()
+
+        row_count = sum(1 for _ in BreakfastIngredientDao(conn=conn).list_all())
+        print('{} breakfast ingredient rows'.format(row_count))
+        print('{:>8} {:>12} {:>20} {:>10}'.format('format', 'rows/sec', 'catalog rows/sec', 'bytes/row'))
+
+        for row_format in SqlBaseDao.ROW_FORMATS:
+            dao = BreakfastIngredientDao(conn=conn, row_format=row_format)
+
+            # Take the best of a few runs to leave out noise from the rest of the machine
+            read_seconds = min(timeit.repeat(lambda: list(dao.list_all()), number=1, repeat=3))
+            row_size = sys.getsizeof(next(iter(dao.list_all())))
+
+            # Tuples can't be read by column name, so they can't build a catalog
+            catalog_rate = ''
+            if row_format != 'tuple':
+                catalog_seconds = min(timeit.repeat(lambda: BreakfastCatalog.from_rows(dao.list_all()),
+                                                    number=1, repeat=3))
+                catalog_rate = '{:.0f}'.format(row_count / catalog_seconds)
+
+            print('{:>8} {:>12.0f} {:>20} {:>10}'.format(row_format, row_count / read_seconds, catalog_rate, row_size))
+
+        # Columns skip making an object per row altogether
+        dao = BreakfastIngredientDao(conn=conn)
+        read_seconds = min(timeit.repeat(dao.list_all_columns, number=1, repeat=3))
+        catalog_seconds = min(timeit.repeat(lambda: BreakfastCatalog.from_columns(*dao.list_all_columns()),
+                                            number=1, repeat=3))
+        row_size = sum(column.itemsize for column in dao.list_all_columns())
+        print('{:>8} {:>12.0f} {:>20.0f} {:>10}'.format('columns', row_count / read_seconds,
+                                                        row_count / catalog_seconds, row_size))
+
+        conn.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Compare the cost of each scoring strategy on a synthetic catalog.
+
+    python -m benchmarks.scoring --breakfasts 100000 --ingredients 1000 --preferences 20
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+import numpy as np
+
+from eggsnspam.common.catalog import BreakfastCatalog
+from eggsnspam.common.recommendations import SCORING_STRATEGIES, score_breakfasts
+
+from .synthetic import breakfast_ingredients, user_preferences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--breakfasts', type=int, default=100000)
+    parser.add_argument('--ingredients', type=int, default=1000)
+    parser.add_argument('--ingredients-per-breakfast', type=int, default=20)
+    parser.add_argument('--preferences', type=int, default=20, help='ingredient preferences per user')
+    parser.add_argument('--users', type=int, default=200, help='users to score with each strategy')
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    random = np.random.RandomState(0)
+    catalog = BreakfastCatalog.from_columns(
+        *breakfast_ingredients(args.breakfasts, args.ingredients, args.ingredients_per_breakfast, random))
+    users = user_preferences(args.users, args.ingredients, args.preferences, random)
+    print('{} breakfasts, {} coefficients, {} users with {} preferences each'.format(
+        len(catalog), len(catalog.data), len(users), args.preferences))
+
+    for strategy in sorted(SCORING_STRATEGIES):
+        # Take the best of a few runs to leave out noise from the rest of the machine
+        seconds = min(timeit.repeat(
+            lambda: [score_breakfasts(catalog, user, limit=args.limit, strategy=strategy) for user in users],
+            number=1, repeat=5))
+        print('{:>12}: {:.3f} ms per user'.format(strategy, seconds * 1000 / len(users)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare building and compiling a DAO's SQL on every call with reusing the statement from common.daos.statement().
+
+    python -m benchmarks.statements --calls 20000
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from sqlalchemy import create_engine
+from sqlalchemy.sql.expression import text
+
+from eggsnspam.common.daos import statement
+from eggsnspam.oop_phrasebook.daos import UserDao, UserPreferenceDao
+
+from .synthetic import write_database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000, help='calls to time each way')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='eggsnspam-benchmark-')
+    try:
+        path = os.path.join(work_dir, 'statements.db')
+        write_database(path, 100, 10, 5, 100, 5)
+        conn = create_engine('sqlite:///' + path).connect()
+
+        user_dao = UserDao(conn=conn)
+        preference_dao = UserPreferenceDao(conn=conn)
+        calls = [
+            ('UserDao.get_by_id', user_dao, """
+            SELECT id, first_name, last_name FROM tblUser
+            WHERE id=:id;
+            """, {'id': 1}),
+            ('UserPreferenceDao.get_by_user_ingredient', preference_dao, """
+            SELECT id, user_id, ingredient_id, coefficient FROM tblUserPreference
+            WHERE user_id=:user_id AND ingredient_id=:ingredient_id;
+            """, {'user_id': 1, 'ingredient_id': 1}),
+        ]
+
+        print('{:<42} {:>12} {:>12} {:>8}'.format('query', 'text() us', 'statement us', 'saved'))
+        for name, dao, sql, params in calls:
+            # Take the best of a few runs to leave out noise from the rest of the machine
+            built = min(timeit.repeat(lambda: dao.fetchone(text(sql), **params), number=args.calls, repeat=3))
+            cached = min(timeit.repeat(lambda: dao.fetchone(statement(sql), **params), number=args.calls, repeat=3))
+            print('{:<42} {:>12.1f} {:>12.1f} {:>7.0%}'.format(
+                name, built * 1e6 / args.calls, cached * 1e6 / args.calls, 1 - cached / built))
+
+        conn.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Synthetic breakfast catalogs and users to benchmark against."""
+
+import os
+import sqlite3
+
+import numpy as np
+
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                           'eggsnspam', 'table_defs', 'eggsnspam.sqlite3.sql')
+
+
+def _sample_ingredients(owner_count, ingredient_count, per_owner, random):
+    """Pick up to per_owner distinct random ingredients for each of owner_count owners.
+
+    Returns parallel arrays of owner IDs and ingredient IDs, both starting from 1.
+    """
+    per_owner = min(per_owner, ingredient_count)
+    owner_ids = np.repeat(np.arange(1, owner_count + 1), per_owner)
+
+    if ingredient_count <= 4 * per_owner:
+        # Dense enough to shuffle every ingredient for each owner and take the first per_owner of them
+        ingredient_ids = np.argsort(random.random_sample((owner_count, ingredient_count)), axis=1)[:, :per_owner] + 1
+        return owner_ids, ingredient_ids.ravel()
+
+    # Otherwise pick at random and drop the few repeats
+    ingredient_ids = random.randint(1, ingredient_count + 1, len(owner_ids))
+    _, first = np.unique(owner_ids * (ingredient_count + 1) + ingredient_ids, return_index=True)
+    first.sort()
+    return owner_ids[first], ingredient_ids[first]
+
+
+def breakfast_ingredients(breakfast_count, ingredient_count, ingredients_per_breakfast, random):
+    """Return parallel arrays of breakfast IDs, ingredient IDs and coefficients between 0 and 1"""
+    breakfast_ids, ingredient_ids = _sample_ingredients(breakfast_count, ingredient_count,
+                                                        ingredients_per_breakfast, random)
+    return breakfast_ids, ingredient_ids, random.random_sample(len(breakfast_ids))
+
+
+def user_preferences(user_count, ingredient_count, preferences_per_user, random):
+    """Return a map of ingredient ID to coefficient between 0 and 1 for each user, in user ID order"""
+    user_ids, ingredient_ids = _sample_ingredients(user_count, ingredient_count, preferences_per_user, random)
+    preferences = [{} for _ in range(user_count)]
+    for user_id, ingredient_id, coefficient in zip(user_ids.tolist(), ingredient_ids.tolist(),
+                                                   random.random_sample(len(user_ids)).tolist()):
+        preferences[user_id - 1][ingredient_id] = coefficient
+    return preferences
+
+
+def write_database(path, breakfast_count, ingredient_count, ingredients_per_breakfast, user_count,
+                   preferences_per_user, seed=0):
+    """Create a SQLite database at path with the app's tables, filled with a synthetic catalog and users.
+
+    Users have IDs from 1 to user_count. Any existing file at path is replaced.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    random = np.random.RandomState(seed)
+    conn = sqlite3.connect(path)
+    try:
+        with open(SCHEMA_PATH) as schema_file:
+            conn.executescript(schema_file.read())
+        # The oop_orm models read users' preferences from their own table name
+        conn.execute('CREATE VIEW tblUserPreferences AS '
+                     'SELECT user_id, ingredient_id, coefficient FROM tblUserPreference')
+
+        conn.executemany('INSERT INTO tblIngredient (id, name) VALUES (?, ?)',
+                         ((i, 'Ingredient {}'.format(i)) for i in range(1, ingredient_count + 1)))
+        conn.executemany('INSERT INTO tblBreakfast (id, name) VALUES (?, ?)',
+                         ((i, 'Breakfast {}'.format(i)) for i in range(1, breakfast_count + 1)))
+        conn.executemany('INSERT INTO tblUser (id, first_name, last_name) VALUES (?, ?, ?)',
+                         ((i, 'User', str(i)) for i in range(1, user_count + 1)))
+
+        columns = breakfast_ingredients(breakfast_count, ingredient_count, ingredients_per_breakfast, random)
+        conn.executemany('INSERT INTO tblBreakfastIngredient (breakfast_id, ingredient_id, coefficient) '
+                         'VALUES (?, ?, ?)', zip(*[column.tolist() for column in columns]))
+
+        preferences = user_preferences(user_count, ingredient_count, preferences_per_user, random)
+        conn.executemany('INSERT INTO tblUserPreference (user_id, ingredient_id, coefficient) VALUES (?, ?, ?)',
+                         ((user_id, ingredient_id, coefficient)
+                          for user_id, user_prefs in enumerate(preferences, 1)
+                          for ingredient_id, coefficient in sorted(user_prefs.items())))
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,2 @@
+#!/bin/bash
+env FLASK_CONFIG='eggsnspam.settings.local.LocalConfig' python -m eggsnspam.commands rebuild_recommendations
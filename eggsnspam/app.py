@@ -9,6 +9,7 @@ import wtforms_json
 
 from flask import Flask
 
+from .common.invalidation import invalidation_bus
 from .extensions import db
 from .oop_orm import oop_orm
 from .oop_phrasebook import oop_phrasebook
@@ -27,6 +28,8 @@ DEFAULT_BLUEPRINTS = (
     home
 )
 
+_wtforms_json_initialized = False
+
 
 def create_app():
     """Create a Flask app."""
@@ -34,6 +37,7 @@ def create_app():
     configure_app(app)
     configure_blueprints(app, DEFAULT_BLUEPRINTS)
     configure_extensions(app)
+    configure_invalidation(app)
     configure_logging(app)
 
     return app
@@ -59,8 +63,17 @@ def configure_extensions(app):
     db.init_app(app)
 
     # wtforms_json
-    # this extends wtforms to use json request bodies
-    wtforms_json.init()
+    # this extends wtforms to use json request bodies. It monkey patches wtforms again on every call, so only call it
+    # for the first app made in the process.
+    global _wtforms_json_initialized
+    if not _wtforms_json_initialized:
+        wtforms_json.init()
+        _wtforms_json_initialized = True
+
+
+def configure_invalidation(app):
+    """Pick up what the other workers have invalidated before serving each request."""
+    app.before_request(invalidation_bus.poll)
 
 
 def configure_logging(app):
@@ -0,0 +1,200 @@
+"""
+Maintenance tasks which run outside of a web request.
+
+Run them with the same FLASK_CONFIG as the app, e.g.:
+
+    env FLASK_CONFIG='eggsnspam.settings.local.LocalConfig' python -m eggsnspam.commands rebuild_recommendations
+"""
+
+from __future__ import print_function
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+
+from flask import current_app
+
+from .app import create_app
+from .common.catalog import BreakfastCatalog, catalog_cache
+from .common.catalog_snapshot import write_snapshot
+from .extensions import db
+from .oop_phrasebook.collections import UserCollection
+from .oop_phrasebook.daos import BreakfastIngredientDao, UserDao
+from .oop_orm.models import UserRecommendationStore as OrmUserRecommendationStore
+from .oop_phrasebook.models import UserRecommendationStore as PhrasebookUserRecommendationStore
+
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+
+# Every implementation's recommendation store. Each keeps its users' recommendations under its own namespace.
+RECOMMENDATION_STORES = (PhrasebookUserRecommendationStore, OrmUserRecommendationStore)
+
+
+def rebuild_recommendations(args):
+    """Rescore every user's stored recommendations against the current catalog, for every implementation."""
+    for store_class in RECOMMENDATION_STORES:
+        store = store_class()
+        count = store.rebuild_all()
+        print('Rebuilt stored {} recommendations for {} users'.format(store.namespace, count))
+
+
+def write_catalog_snapshot(args):
+    """Save the current catalog as the snapshot workers start from (needs CATALOG_SNAPSHOT_DIR)."""
+    snapshot_dir = current_app.config.get('CATALOG_SNAPSHOT_DIR')
+    if not snapshot_dir:
+        print('CATALOG_SNAPSHOT_DIR is not set')
+        return
+
+    storage = current_app.config.get('CATALOG_COEFFICIENT_STORAGE', 'float64')
+    catalog = BreakfastCatalog.from_columns(*BreakfastIngredientDao().list_all_columns(), coefficient_storage=storage)
+    path = write_snapshot(catalog, snapshot_dir)
+    print('Wrote a snapshot of {} breakfasts to {}'.format(len(catalog), path))
+
+
+def export_recommendations(args):
+    """Score every user and write their recommendations to one file per shard of user IDs."""
+    id_range = UserDao().get_id_range()
+    if id_range is None:
+        print('No users to export')
+        return
+
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    shard_count = args.shards or args.workers * 4
+    tasks = [{
+        'path': os.path.join(args.output_dir, 'recommendations-{:04d}.{}'.format(i, args.format)),
+        'format': args.format,
+        'start_id': start_id,
+        'end_id': end_id,
+        'batch_size': args.batch_size,
+        'limit': args.limit,
+        'min_score': args.min_score,
+    } for i, (start_id, end_id) in enumerate(split_id_range(id_range[0], id_range[1], shard_count))]
+
+    started = time.time()
+    total = 0
+    if args.workers == 1:
+        results = (export_shard(task) for task in tasks)
+    else:
+        # Connections can't be shared with the worker processes, which open their own
+        db.engine.dispose()
+        pool = multiprocessing.Pool(args.workers, initializer=_init_export_worker)
+        results = pool.imap_unordered(export_shard, tasks)
+
+    try:
+        for i, (path, count) in enumerate(results):
+            total += count
+            print('[{}/{}] Wrote {} users to {}'.format(i + 1, len(tasks), count, path))
+    finally:
+        if args.workers != 1:
+            pool.close()
+            pool.join()
+
+    elapsed = time.time() - started
+    print('Exported {} users in {:.1f}s ({:.0f} users/sec)'.format(total, elapsed, total / max(elapsed, 1e-6)))
+
+
+def split_id_range(min_id, max_id, shard_count):
+    """Split the IDs from min_id to max_id inclusive into up to shard_count contiguous (start, end) ranges"""
+    shard_size = max(1, -(-(max_id - min_id + 1) // shard_count))
+    return [(start, min(start + shard_size - 1, max_id)) for start in range(min_id, max_id + 1, shard_size)]
+
+
+def export_shard(task):
+    """Score the users in one shard of IDs a batch at a time, streaming them to the shard's file.
+
+    Returns the path written and the number of users in it.
+    """
+    user_dao = UserDao()
+    count = 0
+    with open(task['path'], 'w') as f:
+        write = _jsonl_writer(f) if task['format'] == 'jsonl' else _csv_writer(f)
+
+        start_id = task['start_id']
+        while start_id <= task['end_id']:
+            ids = user_dao.list_ids_between(start_id, task['end_id'], limit=task['batch_size'])
+            if not ids:
+                break
+
+            users = UserCollection(dao=user_dao)
+            users.load_by_ids_with_preferences(ids)
+            recommendations = users.get_recommendations(limit=task['limit'], min_score=task['min_score'])
+            for user, user_recommendations in zip(users.models, recommendations):
+                write(user.id, user_recommendations)
+
+            count += len(users.models)
+            start_id = ids[-1] + 1
+
+    return task['path'], count
+
+
+def _jsonl_writer(f):
+    """Write each user as a JSON object on its own line"""
+    def write(user_id, recommendations):
+        f.write(json.dumps({'user_id': user_id, 'breakfast_recs': recommendations}))
+        f.write('\n')
+    return write
+
+
+def _csv_writer(f):
+    """Write a row for each of a user's recommendations"""
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(['user_id', 'rank', 'breakfast_id', 'score'])
+
+    def write(user_id, recommendations):
+        writer.writerows([user_id, rank, r['breakfast_id'], repr(r['score'])]
+                         for rank, r in enumerate(recommendations, 1))
+    return write
+
+
+def _init_export_worker():
+    """Give an export worker process its own app, database connections and catalog.
+
+    The catalog is loaded once and kept for the rest of the job, so every shard is scored against the same one. A newly
+    forked worker has nothing cached, so it opens the current catalog snapshot if there is one.
+    """
+    app = create_app()
+    app.config['CATALOG_CACHE_TTL'] = None
+    app.app_context().push()
+    catalog_cache.get(BreakfastIngredientDao().list_all_columns)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    rebuild_parser = subparsers.add_parser('rebuild_recommendations', help=rebuild_recommendations.__doc__)
+    rebuild_parser.set_defaults(func=rebuild_recommendations)
+
+    snapshot_parser = subparsers.add_parser('write_catalog_snapshot', help=write_catalog_snapshot.__doc__)
+    snapshot_parser.set_defaults(func=write_catalog_snapshot)
+
+    export_parser = subparsers.add_parser('export_recommendations', help=export_recommendations.__doc__)
+    export_parser.add_argument('output_dir', help='directory to write the shard files to')
+    export_parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl')
+    export_parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                               help='worker processes to score users with (default: one per CPU)')
+    export_parser.add_argument('--shards', type=int,
+                               help='number of user ID ranges to split the users into (default: 4 per worker)')
+    export_parser.add_argument('--batch-size', type=int, default=500, help='users to score at once')
+    export_parser.add_argument('--limit', type=int, help='only export the top N breakfasts for each user')
+    export_parser.add_argument('--min-score', type=float, help='only export breakfasts scoring at least this much')
+    export_parser.set_defaults(func=export_recommendations)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        args.func(args)
+
+
+if __name__ == '__main__':
+    main()
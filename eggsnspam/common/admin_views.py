@@ -0,0 +1,38 @@
+"""
+Utility views for operators to manage what each worker process keeps in memory.
+
+NOTE: Each request only reaches the one worker which serves it. The other workers pick up changes at their next
+scheduled refresh, or at their next request if INVALIDATION_BUS_ENABLED is set.
+"""
+
+from flask import jsonify
+
+from . import responses
+from .invalidation import invalidation_bus
+from .query_cache import query_cache
+from .reference_data import reference_data_cache
+
+
+def reload_reference_data():
+    """Reload this worker's snapshot of the breakfasts and ingredients, and return its version and size."""
+    if not reference_data_cache.enabled:
+        return responses.invalid_request("The reference data snapshot is not enabled")
+
+    reference_data_cache.reload()
+    return jsonify(reference_data_cache.stats())
+
+
+def query_cache_stats():
+    """Return the size and hit rate of this worker's query cache."""
+    if not query_cache.enabled:
+        return responses.invalid_request("The query cache is not enabled")
+
+    return jsonify(query_cache.stats())
+
+
+def invalidation_bus_stats():
+    """Return how many invalidations this worker has published and received."""
+    if not invalidation_bus.enabled:
+        return responses.invalid_request("The invalidation bus is not enabled")
+
+    return jsonify(invalidation_bus.stats())
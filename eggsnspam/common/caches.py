@@ -0,0 +1,213 @@
+"""
+Cache backends for the app's caches.
+
+Every backend is a size bounded map from keys to values with the same methods as CacheBackend. LRUCache keeps its
+entries in the process, so each worker has its own. SqliteCache keeps them in a SQLite file which every worker on the
+host opens, so a value one worker stores is served to all of them and only takes up memory once. CACHE_BACKEND picks
+which one the app's caches use, through create_cache().
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from flask import current_app
+
+
+class CacheBackend(object):
+    """A size bounded map that expires keys after ttl seconds. A ttl of None keeps keys until they are evicted.
+
+    hits and misses count the results of get(). shared is True for backends whose keys every worker sees.
+    """
+
+    __metaclass__ = ABCMeta
+
+    shared = False
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def __len__(self):
+        """Return the number of keys stored"""
+
+    @abstractmethod
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is missing or has expired"""
+
+    @abstractmethod
+    def set(self, key, value):
+        """Store a value, evicting keys if the cache is full"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Forget a key, if it is cached"""
+
+    @abstractmethod
+    def clear(self):
+        """Forget every key and reset the counters"""
+
+    def stats(self):
+        """Return the cache's size and hit/miss counters as a dict"""
+        return {'size': len(self), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+class LRUCache(CacheBackend):
+    """A thread safe map in this process that evicts the least recently used keys."""
+
+    def __init__(self, max_size, ttl=None):
+        super(LRUCache, self).__init__(max_size, ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is missing or has expired"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or (self.ttl is not None and time.time() - entry[0] >= self.ttl):
+                self.misses += 1
+                return default
+
+            # Move the key to the most recently used end
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used keys if the cache is full"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Forget a key, if it is cached"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Forget every key and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class SqliteCache(CacheBackend):
+    """A map in a SQLite file, shared by every process which opens the same path and name.
+
+    Keys are stored as JSON, so they should be tuples of strings and numbers, and values are pickled, so they must be
+    picklable. Reading a key doesn't write to the file, so when the cache is full the keys stored longest ago are
+    evicted, rather than the least recently used. hits and misses only count this process's gets.
+    """
+
+    shared = True
+
+    # Seconds to wait for another process's write to finish
+    TIMEOUT = 5
+
+    def __init__(self, path, name, max_size, ttl=None):
+        if not re.match(r'^\w+$', name):
+            raise ValueError("Invalid cache name: {}".format(name))
+        super(SqliteCache, self).__init__(max_size, ttl)
+        self.path = path
+        self.table = 'cache_{}'.format(name)
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _execute(self, sql, params=()):
+        """Run a statement on this process's connection to the file, and return its first row.
+
+        Each process opens one connection, at first use after a fork, and every thread and greenlet shares it, so
+        setting it up is only paid for once and it stays open between requests.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            # A lock held by another thread when the process forked would never be released in this one
+            self._lock = threading.Lock()
+            self._conn = None
+            self._pid = pid
+
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            return self._conn.execute(sql, params).fetchone()
+
+    def _connect(self):
+        # Autocommit, and don't wait for the disk, since losing the cache in a crash only costs a few misses
+        conn = sqlite3.connect(self.path, timeout=self.TIMEOUT, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('CREATE TABLE IF NOT EXISTS {} ('
+                     'id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, value BLOB NOT NULL, '
+                     'stored_at REAL NOT NULL)'.format(self.table))
+        return conn
+
+    @staticmethod
+    def _key(key):
+        # Unlike repr(), JSON gives byte and unicode strings with the same text the same key
+        return json.dumps(key, separators=(',', ':'), default=repr)
+
+    @staticmethod
+    def _dump(value):
+        return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def __len__(self):
+        return self._execute('SELECT COUNT(*) FROM {}'.format(self.table))[0]
+
+    def get(self, key, default=None):
+        row = self._execute('SELECT value, stored_at FROM {} WHERE key=?'.format(self.table), (self._key(key),))
+        if row is None or (self.ttl is not None and time.time() - row[1] >= self.ttl):
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return pickle.loads(bytes(row[0]))
+
+    def set(self, key, value):
+        self._execute('INSERT OR REPLACE INTO {} (key, value, stored_at) VALUES (?, ?, ?)'.format(self.table),
+                      (self._key(key), self._dump(value), time.time()))
+        # Replacing a key gives it the next id, so only the newest max_size ids can still be stored
+        self._execute('DELETE FROM {0} WHERE id <= (SELECT MAX(id) FROM {0}) - ?'.format(self.table),
+                      (self.max_size,))
+
+    def delete(self, key):
+        self._execute('DELETE FROM {} WHERE key=?'.format(self.table), (self._key(key),))
+
+    def clear(self):
+        self._execute('DELETE FROM {}'.format(self.table))
+        self.hits = 0
+        self.misses = 0
+
+
+def create_cache(name, max_size, ttl=None):
+    """Create the CACHE_BACKEND backend for one of the app's caches. name keeps each cache's keys apart."""
+    backend = current_app.config.get('CACHE_BACKEND', 'local')
+    if backend == 'local':
+        return LRUCache(max_size, ttl)
+    elif backend == 'sqlite':
+        return SqliteCache(current_app.config['CACHE_SQLITE_PATH'], name, max_size, ttl)
+    raise ValueError("Unknown cache backend: {}".format(backend))
+
+
+def cache_settings(max_size, ttl):
+    """Return everything create_cache() builds a cache from, to tell when the app's config has changed"""
+    return current_app.config.get('CACHE_BACKEND', 'local'), current_app.config.get('CACHE_SQLITE_PATH'), max_size, ttl
@@ -0,0 +1,426 @@
+"""
+A process-wide cache of the breakfast ingredient catalog.
+
+Every recommendation request scores a user against every breakfast, which means reading all of
+tblBreakfastIngredient. The catalog changes rarely, so each worker process loads it once and keeps it in memory
+until it is invalidated or reaches CATALOG_CACHE_TTL seconds old. With INVALIDATION_BUS_ENABLED set, invalidating
+the catalog in one worker invalidates it in every worker.
+
+If CATALOG_SNAPSHOT_DIR is set, the catalog is also saved there as a snapshot which every worker maps into memory,
+so the workers share one copy and only the first of them to start has to scan the table.
+"""
+
+import hashlib
+import itertools
+import os
+import threading
+import time
+
+import numpy as np
+
+from flask import current_app
+
+from .daos import Record
+
+from .catalog_snapshot import get_current_snapshot, write_snapshot
+from .invalidation import invalidation_bus
+
+
+class BreakfastCatalog(object):
+    """The breakfast ingredient matrix, stored in compressed sparse row (CSR) form.
+
+    Row i is the breakfast breakfast_ids[i]. Its ingredients are the columns indices[indptr[i]:indptr[i + 1]]
+    with coefficients data[indptr[i]:indptr[i + 1]], and column j is the ingredient ingredient_ids[j]. Breakfasts
+    and each breakfast's ingredients are kept in ascending ID order.
+
+    Coefficients can be stored in one of the COEFFICIENT_STORAGE types to save memory, at the cost of some precision.
+    Scores are always summed in float64, and for preferences p the error in a score is at most:
+
+    * float64: none
+    * float32: sum(|p|) * 2 ** -24 (about 6e-8 per unit of preference), coefficients being at most 1
+    * uint8: sum(|p|) / 510 (about 0.002 per unit of preference), since coefficients between 0 and 1 are rounded to
+      the nearest 1/255
+
+    so breakfasts whose scores are closer than that may swap places in the rankings.
+    """
+
+    # The most coefficient products score_many() holds in memory at once
+    SCORE_CHUNK_SIZE = 1 << 22
+
+    # Records from_rows() transposes into columns at a time
+    RECORD_CHUNK_SIZE = 10000
+
+    # How coefficients can be stored. uint8 stores round(coefficient * 255), clipped to the range 0 to 1.
+    COEFFICIENT_STORAGE = {'float64': np.float64, 'float32': np.float32, 'uint8': np.uint8}
+
+    # Row and column numbers fit in 32 bits, which halves the size of the index arrays
+    INDEX_DTYPE = np.int32
+
+    # The arrays a catalog is made of, including the ones derived from the CSR matrix, as saved in a snapshot
+    ARRAY_NAMES = ('breakfast_ids', 'ingredient_ids', 'indptr', 'indices', 'data',
+                   'rows', 'column_indptr', 'column_rows', 'column_data', 'inverse_norms')
+    DERIVED_ARRAY_NAMES = ('rows', 'column_indptr', 'column_rows', 'column_data', 'inverse_norms')
+
+    def __init__(self, breakfast_ids, ingredient_ids, indptr, indices, data, derived=None, version=None):
+        """Wrap the CSR arrays of a catalog.
+
+        derived and version are only passed when reopening a saved catalog, to reuse its already derived arrays and
+        version rather than recomputing them.
+        """
+        self.breakfast_ids = breakfast_ids
+        self.ingredient_ids = ingredient_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+        # Dense column index for each ingredient ID
+        self.ingredient_index = {ingredient_id: i for i, ingredient_id in enumerate(ingredient_ids.tolist())}
+
+        if derived is None:
+            derived = self._derive_arrays()
+        self.rows = derived['rows']
+        self.column_indptr = derived['column_indptr']
+        self.column_rows = derived['column_rows']
+        self.column_data = derived['column_data']
+        self.inverse_norms = derived['inverse_norms']
+
+        # Identifies the catalog's contents, so anything derived from it can tell when it is out of date
+        if version is None:
+            # The arrays' names are included so a snapshot saved with different arrays is never mistaken for this one
+            fingerprint = hashlib.sha1(repr(self.ARRAY_NAMES).encode('utf-8'))
+            for array in (breakfast_ids, ingredient_ids, indptr, indices, data):
+                fingerprint.update(np.ascontiguousarray(array).tobytes())
+            version = fingerprint.hexdigest()
+        self.version = version
+
+    def _derive_arrays(self):
+        # The row of every stored coefficient, used to sum products back into per-breakfast scores
+        rows = np.repeat(np.arange(len(self.breakfast_ids), dtype=self.INDEX_DTYPE), np.diff(self.indptr))
+
+        # The same matrix by column (CSC): the breakfasts using ingredient column j are
+        # column_rows[column_indptr[j]:column_indptr[j + 1]], with coefficients in column_data
+        column_order = np.argsort(self.indices, kind='mergesort')
+        column_indptr = np.zeros(len(self.ingredient_ids) + 1, dtype=np.int64)
+        if len(self.indices):
+            np.cumsum(np.bincount(self.indices, minlength=len(self.ingredient_ids)), out=column_indptr[1:])
+
+        # One over the length of each breakfast's vector of real coefficients, for cosine scoring, so scores can be
+        # multiplied rather than divided. Breakfasts with no nonzero coefficients get 0.
+        coefficients = np.multiply(self.data, self.coefficient_scale, dtype=np.float64)
+        norms = np.zeros(len(self.breakfast_ids))
+        if len(rows):
+            norms = np.sqrt(np.bincount(rows, weights=coefficients * coefficients, minlength=len(norms)))
+        inverse_norms = np.divide(1.0, norms, out=np.zeros(len(norms)), where=norms > 0)
+
+        return {
+            'rows': rows,
+            'column_indptr': column_indptr,
+            'column_rows': rows[column_order],
+            'column_data': self.data[column_order],
+            'inverse_norms': inverse_norms,
+        }
+
+    def save(self, path):
+        """Save the catalog's arrays to .npy files in the directory path"""
+        for name in self.ARRAY_NAMES:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+
+    @classmethod
+    def open(cls, path, version=None):
+        """Open a catalog saved with save(), mapping its arrays read-only rather than reading them into memory.
+
+        Many processes opening the same files share a single copy in the page cache.
+        """
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in cls.ARRAY_NAMES}
+        derived = {name: arrays.pop(name) for name in cls.DERIVED_ARRAY_NAMES}
+        return cls(derived=derived, version=version, **arrays)
+
+    def __len__(self):
+        return len(self.breakfast_ids)
+
+    @property
+    def coefficient_scale(self):
+        """What to multiply the stored coefficients by to get the real ones"""
+        return 1.0 / 255 if self.data.dtype == np.uint8 else 1.0
+
+    @property
+    def nbytes(self):
+        """The memory used by the catalog's arrays"""
+        return sum(getattr(self, name).nbytes for name in self.ARRAY_NAMES)
+
+    @classmethod
+    def from_rows(cls, rows, coefficient_storage='float64'):
+        """Build a catalog from records with breakfast_id, ingredient_id and coefficient keys"""
+        breakfast_ids, ingredient_ids, coefficients = [], [], []
+        rows = iter(rows)
+        for row in rows:
+            if isinstance(row, Record):
+                # Records are tuples underneath, so rather than looking up each value by name, transpose them a chunk
+                # at a time
+                positions = [row._positions[key] for key in ('breakfast_id', 'ingredient_id', 'coefficient')]
+                rows = itertools.chain([row], rows)
+                chunk = list(itertools.islice(rows, cls.RECORD_CHUNK_SIZE))
+                while chunk:
+                    columns = list(zip(*chunk))
+                    breakfast_ids.extend(columns[positions[0]])
+                    ingredient_ids.extend(columns[positions[1]])
+                    coefficients.extend(columns[positions[2]])
+                    chunk = list(itertools.islice(rows, cls.RECORD_CHUNK_SIZE))
+                break
+
+            breakfast_ids.append(row['breakfast_id'])
+            ingredient_ids.append(row['ingredient_id'])
+            coefficients.append(row['coefficient'])
+        return cls.from_columns(breakfast_ids, ingredient_ids, coefficients, coefficient_storage=coefficient_storage)
+
+    @classmethod
+    def from_columns(cls, breakfast_ids, ingredient_ids, coefficients, coefficient_storage='float64'):
+        """Build a catalog from parallel sequences of breakfast IDs, ingredient IDs and coefficients.
+
+        coefficient_storage is the name of one of the COEFFICIENT_STORAGE types to keep the coefficients in.
+        """
+        if coefficient_storage not in cls.COEFFICIENT_STORAGE:
+            raise ValueError("Unknown coefficient storage: {}".format(coefficient_storage))
+
+        breakfast_ids = np.asarray(breakfast_ids, dtype=np.int64)
+        ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+        coefficients = np.asarray(coefficients, dtype=np.float64)
+
+        # Sort by breakfast then ingredient. The sort is stable, so if an ingredient is listed twice for the same
+        # breakfast the last row wins, just like assigning into a dict would.
+        order = np.lexsort((ingredient_ids, breakfast_ids))
+        breakfast_ids = breakfast_ids[order]
+        ingredient_ids = ingredient_ids[order]
+        coefficients = coefficients[order]
+        is_last = np.ones(len(order), dtype=bool)
+        is_last[:-1] = (breakfast_ids[1:] != breakfast_ids[:-1]) | (ingredient_ids[1:] != ingredient_ids[:-1])
+        breakfast_ids = breakfast_ids[is_last]
+        ingredient_ids = ingredient_ids[is_last]
+        coefficients = coefficients[is_last]
+
+        unique_breakfast_ids, rows = np.unique(breakfast_ids, return_inverse=True)
+        unique_ingredient_ids, indices = np.unique(ingredient_ids, return_inverse=True)
+        indptr = np.zeros(len(unique_breakfast_ids) + 1, dtype=np.int64)
+        if len(rows):
+            np.cumsum(np.bincount(rows), out=indptr[1:])
+
+        if coefficient_storage == 'uint8':
+            coefficients = np.round(np.clip(coefficients, 0, 1) * 255)
+        coefficients = coefficients.astype(cls.COEFFICIENT_STORAGE[coefficient_storage])
+
+        return cls(unique_breakfast_ids, unique_ingredient_ids, indptr, indices.astype(cls.INDEX_DTYPE), coefficients)
+
+    def preference_matrix(self, preferences_list):
+        """Convert maps of ingredient ID to coefficient into a dense matrix, one row per map.
+
+        Preferences for ingredients that no breakfast uses can't affect a score, so they are dropped.
+        """
+        matrix = np.zeros((len(preferences_list), len(self.ingredient_ids)))
+        for row, preferences in enumerate(preferences_list):
+            for ingredient_id, coefficient in preferences.items():
+                column = self.ingredient_index.get(ingredient_id)
+                if column is not None:
+                    matrix[row, column] = coefficient
+        return matrix
+
+    def ingredient_column(self, ingredient_id):
+        """Return the rows of the breakfasts using an ingredient, and the ingredient's stored coefficient in each"""
+        column = self.ingredient_index.get(ingredient_id)
+        if column is None:
+            return np.zeros(0, dtype=self.INDEX_DTYPE), np.zeros(0, dtype=self.data.dtype)
+        start, end = self.column_indptr[column], self.column_indptr[column + 1]
+        return self.column_rows[start:end], self.column_data[start:end]
+
+    def ingredient_mask(self, exclude_ingredients=(), require_ingredients=()):
+        """Return a boolean array marking the breakfasts using all of require_ingredients and none of
+        exclude_ingredients.
+
+        A breakfast uses an ingredient if it has a nonzero coefficient for it. The mask is built from the ingredients'
+        columns, so it costs time proportional to the number of breakfasts using them.
+        """
+        def using(ingredient_id):
+            rows, coefficients = self.ingredient_column(ingredient_id)
+            return rows[coefficients != 0]
+
+        require_ingredients = set(require_ingredients)
+        if require_ingredients:
+            # Count how many of the required ingredients each breakfast uses
+            counts = np.zeros(len(self), dtype=np.int64)
+            for ingredient_id in require_ingredients:
+                counts[using(ingredient_id)] += 1
+            mask = counts == len(require_ingredients)
+        else:
+            mask = np.ones(len(self), dtype=bool)
+
+        for ingredient_id in set(exclude_ingredients):
+            mask[using(ingredient_id)] = False
+        return mask
+
+    def score_sparse(self, preferences, return_products=False):
+        """Score only the breakfasts that use at least one of the ingredients in preferences.
+
+        Ingredients the user has no preference for add nothing to a score, so only the columns of the preferred
+        ingredients are read, and the cost grows with the number of preferences rather than the size of the catalog.
+        Every other breakfast scores 0. Returns the rows of the scored breakfasts, in ascending order, and their
+        scores, which are exactly those score() gives.
+
+        preferences can also map ingredients to changes in a user's coefficients, giving the change in each score.
+
+        If return_products is True, the products the scores were summed from are returned too, as a tuple of
+        parallel arrays of each product's row, ingredient ID and value.
+        """
+        # Read columns in ingredient order so every score is summed in the same order as score() sums it
+        ingredient_ids = sorted(i for i in preferences if i in self.ingredient_index)
+        if not ingredient_ids:
+            empty_rows, empty_scores = np.zeros(0, dtype=self.INDEX_DTYPE), np.zeros(0)
+            if return_products:
+                return empty_rows, empty_scores, (empty_rows, np.zeros(0, dtype=np.int64), empty_scores)
+            return empty_rows, empty_scores
+
+        columns = [self.ingredient_column(ingredient_id) for ingredient_id in ingredient_ids]
+        rows = np.concatenate([column_rows for column_rows, _ in columns])
+        products = np.concatenate([
+            np.multiply(column_data, float(preferences[ingredient_id]) * self.coefficient_scale, dtype=np.float64)
+            for ingredient_id, (_, column_data) in zip(ingredient_ids, columns)])
+
+        # A breakfast can use more than one of the ingredients, so add up its products
+        scored_rows, positions = np.unique(rows, return_inverse=True)
+        scores = np.bincount(positions, weights=products, minlength=len(scored_rows))
+
+        if return_products:
+            product_ingredient_ids = np.repeat(ingredient_ids, [len(column_rows) for column_rows, _ in columns])
+            return scored_rows, scores, (rows, product_ingredient_ids, products)
+        return scored_rows, scores
+
+    def score(self, preferences):
+        """Return the dot product of every breakfast with the preferences, in one sparse matrix-vector product"""
+        return self.score_many([preferences])[0]
+
+    def score_many(self, preferences_list):
+        """Score many users' preferences against every breakfast with one sparse matrix-matrix product.
+
+        Returns an array with a row per map of preferences and a column per breakfast. Users are processed in
+        chunks of up to SCORE_CHUNK_SIZE products at a time to bound memory.
+        """
+        scores = np.zeros((len(preferences_list), len(self)))
+        if not len(self.data):
+            return scores
+
+        matrix = self.preference_matrix(preferences_list)
+        if self.coefficient_scale != 1.0:
+            matrix *= self.coefficient_scale
+        chunk_rows = max(1, self.SCORE_CHUNK_SIZE // len(self.data))
+        for start in range(0, len(matrix), chunk_rows):
+            chunk = matrix[start:start + chunk_rows]
+            products = chunk[:, self.indices] * self.data
+
+            # Give each user's breakfasts their own bins, so one bincount sums every user's products. bincount adds
+            # in order, giving exactly the same sums as dot_product().
+            bins = np.arange(len(chunk))[:, np.newaxis] * len(self) + self.rows
+            scores[start:start + len(chunk)] = np.bincount(
+                bins.ravel(), weights=products.ravel(), minlength=len(chunk) * len(self)).reshape(len(chunk), -1)
+
+        return scores
+
+
+class CatalogCache(object):
+    """Hold a single BreakfastCatalog for the whole process."""
+
+    def __init__(self):
+        self._catalog = None
+        self._loaded_at = None
+        self._generation = 0
+        # When the catalog was last invalidated, by this process or another, or None if it hasn't been
+        self._invalidated_at = None
+        self._lock = threading.Lock()
+
+    def _within_ttl(self, loaded_at):
+        ttl = current_app.config.get('CATALOG_CACHE_TTL')
+        return ttl is None or time.time() - loaded_at < ttl
+
+    def _is_fresh(self):
+        """Return True if a catalog is loaded and has not outlived CATALOG_CACHE_TTL"""
+        return self._catalog is not None and self._within_ttl(self._loaded_at)
+
+    def get(self, loader):
+        """Return the cached catalog, calling loader() to fetch breakfast ingredient rows if it needs loading.
+
+        loader() can also return a tuple of breakfast ID, ingredient ID and coefficient columns.
+        """
+        if self._is_fresh():
+            return self._catalog
+
+        with self._lock:
+            # Another request may have loaded the catalog while we were waiting for the lock
+            if self._is_fresh():
+                return self._catalog
+
+            generation = self._generation
+            catalog, loaded_at = self._load(loader)
+
+            # Don't keep a catalog that was invalidated while it was being loaded
+            if generation == self._generation:
+                self._catalog = catalog
+                self._loaded_at = loaded_at
+
+        return catalog
+
+    def _load(self, loader):
+        """Load the catalog, from the current snapshot if there is a usable one.
+
+        Returns the catalog and the time it was read from the database.
+        """
+        storage = current_app.config.get('CATALOG_COEFFICIENT_STORAGE', 'float64')
+        snapshot_dir = current_app.config.get('CATALOG_SNAPSHOT_DIR')
+        if not snapshot_dir:
+            return self._build(loader, storage), time.time()
+
+        # Use the current snapshot unless it was written before the catalog was last invalidated, or is too old. After
+        # an invalidation only the first worker to load the catalog rescans the table, and the rest open its snapshot.
+        snapshot = get_current_snapshot(snapshot_dir)
+        invalidated_at = self._invalidated_at
+        if (snapshot is not None and (invalidated_at is None or snapshot[1] > invalidated_at) and
+                self._within_ttl(snapshot[1])):
+            try:
+                catalog = BreakfastCatalog.open(snapshot[0], version=os.path.basename(snapshot[0]))
+            except IOError:
+                # The snapshot was replaced and removed while we were opening it
+                pass
+            else:
+                # A snapshot written before CATALOG_COEFFICIENT_STORAGE changed is rebuilt
+                if catalog.data.dtype == BreakfastCatalog.COEFFICIENT_STORAGE[storage]:
+                    return catalog, snapshot[1]
+
+        loaded_at = time.time()
+        catalog = self._build(loader, storage)
+        path = write_snapshot(catalog, snapshot_dir)
+
+        # Reopen the catalog from the snapshot, so this process shares its memory with the other workers
+        return BreakfastCatalog.open(path, version=catalog.version), loaded_at
+
+    def _build(self, loader, storage):
+        """Build a catalog from what loader() returns"""
+        loaded = loader()
+        if isinstance(loaded, tuple):
+            return BreakfastCatalog.from_columns(*loaded, coefficient_storage=storage)
+        return BreakfastCatalog.from_rows(loaded, coefficient_storage=storage)
+
+    def invalidate(self):
+        """Drop the cached catalog so the next request reloads it, and tell the other workers to drop theirs"""
+        invalidated_at = time.time()
+        self._drop(invalidated_at)
+        invalidation_bus.publish('catalog', invalidated_at)
+
+    def _drop(self, invalidated_at=None):
+        """Drop the cached catalog, which was invalidated at invalidated_at, or if it is None at an unknown time"""
+        if invalidated_at is None:
+            invalidated_at = time.time()
+        self._generation += 1
+        if self._invalidated_at is None or invalidated_at > self._invalidated_at:
+            self._invalidated_at = invalidated_at
+        self._catalog = None
+
+
+# One catalog per process, shared by every recommendation implementation
+catalog_cache = CatalogCache()
+invalidation_bus.subscribe('catalog', catalog_cache._drop)
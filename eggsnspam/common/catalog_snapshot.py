@@ -0,0 +1,77 @@
+"""
+On-disk snapshots of the breakfast catalog, shared by every worker process.
+
+A snapshot is a directory, named after the catalog's version, holding each of the catalog's arrays as a .npy file.
+Workers open the files with mmap, so they all share one copy in the page cache, and a newly started worker can serve
+recommendations without scanning tblBreakfastIngredient. The 'current' symlink points at the newest snapshot and is
+replaced atomically, so readers always see a complete snapshot.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+
+CURRENT_LINK = 'current'
+
+# How many older snapshots to keep alongside the current one. Processes still using a deleted snapshot are unaffected,
+# since their mappings keep the files alive.
+KEEP_OLD_SNAPSHOTS = 1
+
+
+def write_snapshot(catalog, snapshot_dir):
+    """Save a catalog under snapshot_dir and make it the current snapshot. Returns the snapshot's path."""
+    try:
+        os.makedirs(snapshot_dir)
+    except OSError:
+        if not os.path.isdir(snapshot_dir):
+            raise
+
+    path = os.path.join(snapshot_dir, catalog.version)
+    if not os.path.isdir(path):
+        # Write to a temporary directory first so no one can open a half written snapshot
+        temp_path = tempfile.mkdtemp(prefix='.tmp-', dir=snapshot_dir)
+        try:
+            catalog.save(temp_path)
+        except Exception:
+            # Nothing else removes temporary directories, so don't leave a half written one behind
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            # Unless another process saved the same version first, there is no snapshot to point at
+            if not os.path.isdir(path):
+                raise
+
+    # Renaming a new link over the old one swaps it atomically
+    temp_link = os.path.join(snapshot_dir, '.{}-{}-{}'.format(
+        CURRENT_LINK, os.getpid(), threading.current_thread().ident))
+    os.symlink(catalog.version, temp_link)
+    os.rename(temp_link, os.path.join(snapshot_dir, CURRENT_LINK))
+
+    _remove_old_snapshots(snapshot_dir, catalog.version)
+    return path
+
+
+def get_current_snapshot(snapshot_dir):
+    """Find the current snapshot. Returns a (path, written_at) tuple, or None if there is no snapshot."""
+    link = os.path.join(snapshot_dir, CURRENT_LINK)
+    try:
+        return os.path.join(snapshot_dir, os.readlink(link)), os.lstat(link).st_mtime
+    except OSError:
+        return None
+
+
+def _remove_old_snapshots(snapshot_dir, current_version):
+    snapshots = [os.path.join(snapshot_dir, name) for name in os.listdir(snapshot_dir)
+                 if not name.startswith('.') and name not in (CURRENT_LINK, current_version)]
+    try:
+        snapshots.sort(key=os.path.getmtime, reverse=True)
+    except OSError:
+        # Another process is already cleaning up
+        return
+    for path in snapshots[KEEP_OLD_SNAPSHOTS:]:
+        shutil.rmtree(path, ignore_errors=True)
@@ -1,12 +1,124 @@
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy.sql.expression import text
+
+from .query_cache import query_cache, statement_tables
 from ..extensions import db
 
 
+_STRING_TYPES = (str, type(u''))
+
+# The clauses statement() has built, by their SQL, and the compiled form of each for every dialect it has run on
+_statements = {}
+_compiled_statements = {}
+
+
+def statement(sql):
+    """Get the text() clause for some SQL, building it only the first time it is asked for.
+
+    Statements from here are also compiled only once per dialect and set of bind parameter names, rather than on
+    every execute. Every statement is kept for the life of the process, so only use this for SQL from a fixed set of
+    strings.
+    """
+    clause = _statements.get(sql)
+    if clause is None:
+        clause = _statements.setdefault(sql, text(sql))
+    return clause
+
+
+def _is_statement(query):
+    """Return True if a query is a clause from statement()"""
+    return _statements.get(getattr(query, 'text', None)) is query
+
+
+class Record(tuple):
+    """A row's values in a tuple, which can also be read like a dict by column name.
+
+    Each set of column names gets its own subclass from record_class(), which looks up the columns' positions once, so
+    a row costs no more than a tuple. Iterating over a record gives its values, like a tuple, but `in` checks its
+    column names, like a dict. dict(record) converts it to a dict.
+    """
+
+    __slots__ = ()
+
+    # The column names, and the position of each name in the tuple
+    _fields = ()
+    _positions = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, _STRING_TYPES):
+            return tuple.__getitem__(self, self._positions[key])
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __repr__(self):
+        return 'Record({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in zip(self._fields, self)))
+
+    def get(self, key, default=None):
+        position = self._positions.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return list(zip(self._fields, self))
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
+
+    def __reduce__(self):
+        # Each record class is made on the fly, so pickle the column names to find it again when unpickling
+        return _make_record, (self._fields, tuple(self))
+
+
+_record_classes = {}
+
+
+def record_class(keys):
+    """Get the Record subclass for rows with these column names"""
+    keys = tuple(keys)
+    cls = _record_classes.get(keys)
+    if cls is None:
+        cls = _record_classes[keys] = type('Record', (Record,), {
+            '__slots__': (),
+            '_fields': keys,
+            '_positions': {key: i for i, key in enumerate(keys)},
+        })
+    return cls
+
+
+def _make_record(keys, values):
+    return record_class(keys)(values)
+
+
 class SqlBaseDao(object):
 
     MAX_RESULTS_SIZE = 500
 
-    def __init__(self, conn=None):
+    # Most values to bind into a single IN (...) clause. SQLite allows at most 999 bind parameters per statement.
+    MAX_IN_CLAUSE_SIZE = 500
+
+    # Rows iterate() and fetch_columns() fetch from the database at a time
+    CHUNK_SIZE = 1000
+
+    # What rows are returned as: a 'dict', a 'record' which reads like a dict but is only a tuple underneath, or a
+    # plain 'tuple' of the values in the order they were selected
+    ROW_FORMATS = ('dict', 'record', 'tuple')
+    ROW_FORMAT = 'dict'
+
+    def __init__(self, conn=None, chunk_size=None, row_format=None):
         self._conn = conn
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.row_format = row_format or self.ROW_FORMAT
+        if self.row_format not in self.ROW_FORMATS:
+            raise ValueError("Unknown row format: {}".format(self.row_format))
 
     @property
     def conn(self):
@@ -14,34 +126,158 @@ class SqlBaseDao(object):
             self._conn = db.session.connection()
         return self._conn
 
-    def _row_to_dict(self, row):
-        return dict(zip(row.keys(), row))
+    def _row_converter(self, result):
+        """Get a function converting the rows of a result to the DAO's row format, looking up the columns only once"""
+        if self.row_format == 'tuple':
+            return tuple
+        if self.row_format == 'record':
+            return record_class(result.keys())
+
+        keys = result.keys()
+        return lambda row: dict(zip(keys, row))
+
+    def chunks(self, values):
+        """Split a list of values into lists small enough to bind into an IN (...) clause"""
+        for start in range(0, len(values), self.MAX_IN_CLAUSE_SIZE):
+            yield values[start:start + self.MAX_IN_CLAUSE_SIZE]
+
+    def bind_list(self, name, values):
+        """Build the placeholders and bind parameters for an IN (...) clause.
+
+        For example, bind_list('id', [4, 5]) returns (':id_0, :id_1', {'id_0': 4, 'id_1': 5}).
+        """
+        names = ['{}_{}'.format(name, i) for i in range(len(values))]
+        placeholders = ', '.join(':' + n for n in names)
+        return placeholders, dict(zip(names, values))
+
+    def _connection(self, query, **options):
+        """Get the connection to execute a query on, with any execution options.
+
+        Queries from statement() are compiled through the process-wide cache of compiled statements.
+        """
+        if _is_statement(query):
+            options['compiled_cache'] = _compiled_statements
+        return self.conn.execution_options(**options) if options else self.conn
+
+    def fetch_by_ids(self, query_format, ids, key='id'):
+        """Fetch the rows for a list of IDs, a chunk of IDs at a time.
+
+        query_format is SQL with an IN ({}) clause for the IDs to be bound into. Rows are returned in the order of ids,
+        once each even if an ID is asked for more than once. IDs with no row are left out.
+        """
+        ids = list(OrderedDict.fromkeys(ids))
+        rows = {}
+        for chunk in self.chunks(ids):
+            placeholders, params = self.bind_list('id', chunk)
+            result = self.execute(text(query_format.format(placeholders)), **params)
+            # Read the key before converting the rows, since rows in the 'tuple' format have no column names
+            convert = self._row_converter(result)
+            for row in result:
+                rows[row[key]] = convert(row)
+        return [rows[id] for id in ids if id in rows]
 
     def execute(self, query, *args, **kwargs):
-        """Execute a query on the database"""
-        result = self.conn.execute(query, *args, **kwargs)
+        """Execute a query on the database.
+
+        Writes stop the query cache serving results from the tables written to, and again once the session commits.
+        """
+        result = self._connection(query).execute(query, *args, **kwargs)
+        if query_cache.enabled:
+            tables, writes = self._tables(query)
+            if writes:
+                query_cache.invalidate_tables(tables, db.session)
         return result
 
+    def _tables(self, query):
+        """Get the tables a query reads or writes, and whether it writes, as given by statement_tables()"""
+        if _is_statement(query):
+            return query_cache.tables(query.text)
+        sql = getattr(query, 'text', query)
+        if not isinstance(sql, _STRING_TYPES):
+            return (), False
+        return statement_tables(sql)
+
+    def _through_cache(self, fetch, query, args, kwargs):
+        """Call fetch(query, *args, **kwargs), or return its result from the query cache if it is enabled.
+
+        Only reads from statement() with keyword bind parameters are cached.
+        """
+        if args or not _is_statement(query) or not query_cache.enabled:
+            return fetch(query, *args, **kwargs)
+
+        tables, writes = query_cache.tables(query.text)
+        if writes:
+            return fetch(query, **kwargs)
+
+        key = (query.text, fetch.__name__, self.row_format, tuple(sorted(kwargs.items())))
+        return query_cache.get_or_fetch(key, tables, lambda: fetch(query, **kwargs))
+
     def fetchone(self, query, *args, **kwargs):
-        """Fetch one record from the database"""
-        row = self.execute(query, *args, **kwargs).fetchone()
+        """Fetch one record from the database, or from the query cache"""
+        return self._through_cache(self._fetchone, query, args, kwargs)
+
+    def _fetchone(self, query, *args, **kwargs):
+        result = self.execute(query, *args, **kwargs)
+        row = result.fetchone()
         if row:
-            return self._row_to_dict(row)
+            return self._row_converter(result)(row)
         else:
             return None
 
     def fetchmany(self, query, *args, **kwargs):
         """Fetch up to MAX_RESULTS_SIZE rows"""
-        results = []
-        rows = self.execute(query, *args, **kwargs).fetchmany(size=self.MAX_RESULTS_SIZE)
-        for row in rows:
-            results.append(self._row_to_dict(row))
-        return results
+        result = self.execute(query, *args, **kwargs)
+        convert = self._row_converter(result)
+        return [convert(row) for row in result.fetchmany(size=self.MAX_RESULTS_SIZE)]
 
     def fetchall(self, query, *args, **kwargs):
-        """Fetch all rows"""
-        results = []
-        rows = self.execute(query, *args, **kwargs).fetchall()
-        for row in rows:
-            results.append(self._row_to_dict(row))
-        return results
+        """Fetch all rows, from the database or the query cache"""
+        return self._through_cache(self._fetchall, query, args, kwargs)
+
+    def _fetchall(self, query, *args, **kwargs):
+        result = self.execute(query, *args, **kwargs)
+        convert = self._row_converter(result)
+        return [convert(row) for row in result.fetchall()]
+
+    def iterate(self, query, *args, **kwargs):
+        """Yield every row, fetching chunk_size rows at a time so the results are never all held in memory at once.
+
+        Drivers that support it read the rows from a server-side cursor. The query isn't run until the first row is
+        asked for, and its cursor is closed when the rows run out or the generator is closed.
+        """
+        result = self._connection(query, stream_results=True).execute(query, *args, **kwargs)
+        try:
+            convert = self._row_converter(result)
+            while True:
+                rows = result.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield convert(row)
+        finally:
+            result.close()
+
+    def fetch_columns(self, query, dtypes, *args, **kwargs):
+        """Read every row into a NumPy array per column, in the order the columns are selected.
+
+        dtypes gives the type of each column's array. Rows are fetched chunk_size at a time, and each chunk is copied
+        into arrays before the next is fetched. Returns a tuple of the arrays.
+        """
+        result = self._connection(query, stream_results=True).execute(query, *args, **kwargs)
+        try:
+            if len(result.keys()) != len(dtypes):
+                raise ValueError("Selected {} columns but got {} dtypes".format(len(result.keys()), len(dtypes)))
+
+            chunks = [[] for _ in dtypes]
+            while True:
+                # Read through the result rather than its cursor, since some drivers' results buffer rows ahead
+                rows = result.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                for column_chunks, dtype, values in zip(chunks, dtypes, zip(*rows)):
+                    column_chunks.append(np.array(values, dtype=dtype))
+        finally:
+            result.close()
+
+        return tuple(np.concatenate(column_chunks) if column_chunks else np.zeros(0, dtype=dtype)
+                     for column_chunks, dtype in zip(chunks, dtypes))
@@ -0,0 +1,75 @@
+"""Forms shared by every implementation of the API."""
+
+from flask import current_app
+from wtforms import Form
+from wtforms import fields
+from wtforms import validators
+from wtforms import widgets
+
+from .recommendations import SCORING_STRATEGIES
+
+
+class IntegerListField(fields.Field):
+    """A field for a comma separated list of integers, like 1,2,3. Its data is a tuple."""
+
+    widget = widgets.TextInput()
+
+    def __init__(self, label=None, validators=None, **kwargs):
+        kwargs.setdefault('default', ())
+        super(IntegerListField, self).__init__(label, validators, **kwargs)
+
+    def _value(self):
+        return u','.join(str(value) for value in self.data) if self.data else u''
+
+    def process_formdata(self, valuelist):
+        self.data = ()
+        if valuelist and valuelist[0]:
+            try:
+                self.data = tuple(int(value) for value in valuelist[0].split(','))
+            except ValueError:
+                raise ValueError(self.gettext('Not a valid list of integers'))
+
+
+class IdListForm(Form):
+    """Form for the query string options of a request listing records."""
+
+    MAX_IDS = 1000
+
+    ids = IntegerListField(u'IDs', [validators.Length(max=MAX_IDS)])
+
+
+class RecommendationForm(Form):
+    """Form for the query string options of a breakfast recommendations request."""
+
+    limit = fields.IntegerField(u'Limit', [validators.Optional(), validators.NumberRange(min=1)])
+    min_score = fields.FloatField(u'Minimum Score', [validators.Optional()])
+    strategy = fields.StringField(u'Scoring Strategy', [validators.Optional(), validators.AnyOf(SCORING_STRATEGIES)])
+    explain = fields.BooleanField(u'Explain', false_values=('false', '0', ''))
+    exclude_ingredients = IntegerListField(u'Exclude Ingredients')
+    require_ingredients = IntegerListField(u'Require Ingredients')
+
+    @property
+    def scoring_strategy(self):
+        """The requested scoring strategy, or the app's RECOMMENDATION_SCORING_STRATEGY if none was requested"""
+        return self.strategy.data or current_app.config.get('RECOMMENDATION_SCORING_STRATEGY', 'dot_product')
+
+    @property
+    def scoring_options(self):
+        """The options to score breakfasts with, as keyword arguments for score_breakfasts()"""
+        return {
+            'limit': self.limit.data,
+            'min_score': self.min_score.data,
+            'strategy': self.scoring_strategy,
+            'explain': self.explain.data,
+            'exclude_ingredients': self.exclude_ingredients.data,
+            'require_ingredients': self.require_ingredients.data,
+        }
+
+    @property
+    def plain_scores(self):
+        """True if the request only needs dot product scores, with no explanations or ingredient filters.
+
+        Stored recommendations and the 'sql' scoring mode can only serve these requests.
+        """
+        return (self.scoring_strategy == 'dot_product' and not self.explain.data and
+                not self.exclude_ingredients.data and not self.require_ingredients.data)
@@ -0,0 +1,173 @@
+"""
+A bus which tells every worker on the host when something they keep in memory has changed.
+
+Each worker keeps its own catalog, reference data snapshot and, with the 'local' CACHE_BACKEND, its own recommendation
+and query caches. A write served by one worker drops that worker's copy straight away, but the other workers would
+serve stale data until their copy expired. With INVALIDATION_BUS_ENABLED set, the caches also publish each
+invalidation as a line appended to the file at INVALIDATION_BUS_PATH. Before every request a worker stats the file,
+and only if it has grown reads the new lines, passing the ones published by other workers to the handlers subscribed
+to their topic.
+
+The file is replaced with an empty one once it reaches INVALIDATION_BUS_MAX_SIZE bytes. A worker which sees the file
+replaced can't tell what it missed, so its handlers are called with a key of None, meaning everything on their topic
+may have changed.
+"""
+
+import errno
+import fcntl
+import json
+import os
+import tempfile
+import threading
+
+from flask import current_app, has_app_context
+
+
+class InvalidationBus(object):
+    """Publish invalidations to the other workers, and pass on theirs to this worker's handlers.
+
+    A message is a topic, such as 'catalog', and a key within it, such as a user or table, or None for the whole topic.
+    Keys must be JSON serializable, and lists are passed to handlers as tuples. published and received count this
+    process's messages.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        # The inode and size of the file when it was last read, or None if it hasn't been read yet
+        self._position = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.received = 0
+        self.resets = 0
+
+    @property
+    def enabled(self):
+        """Return True if the app is configured to use the bus. Code run outside of an app never uses it."""
+        return has_app_context() and current_app.config.get('INVALIDATION_BUS_ENABLED', False)
+
+    def subscribe(self, topic, handler):
+        """Call handler(key) for every message on topic published by another worker"""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic, key=None):
+        """Tell the other workers that key, or everything on topic if it is None, has changed"""
+        if not self.enabled:
+            return
+
+        line = json.dumps([os.getpid(), topic, key], separators=(',', ':')) + '\n'
+        self._append(current_app.config['INVALIDATION_BUS_PATH'], line.encode('utf-8'))
+        self.published += 1
+
+    def _append(self, path, data):
+        """Append data to the file, replacing the file first if it has reached INVALIDATION_BUS_MAX_SIZE"""
+        max_size = current_app.config.get('INVALIDATION_BUS_MAX_SIZE')
+        while True:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # Appends are atomic on their own, but replacing the file must wait for them to finish
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                stat = os.fstat(fd)
+                if not self._is_current(path, stat):
+                    # Another process replaced the file while we were waiting for the lock
+                    continue
+                if max_size is not None and stat.st_size >= max_size:
+                    self._replace(path)
+                    continue
+                os.write(fd, data)
+                return
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _is_current(path, stat):
+        try:
+            return os.stat(path).st_ino == stat.st_ino
+        except OSError:
+            return False
+
+    @staticmethod
+    def _replace(path):
+        """Atomically replace the file with an empty one"""
+        fd, temp_path = tempfile.mkstemp(prefix='.{}-'.format(os.path.basename(path)), dir=os.path.dirname(path))
+        os.close(fd)
+        os.chmod(temp_path, 0o644)
+        os.rename(temp_path, path)
+
+    def poll(self):
+        """Pass every message other workers have published since the last poll to this worker's handlers.
+
+        This only costs a stat() unless there are new messages.
+        """
+        if not self.enabled:
+            return
+
+        path = current_app.config['INVALIDATION_BUS_PATH']
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            inode, size = None, 0
+        else:
+            inode, size = stat.st_ino, stat.st_size
+
+        position = self._position
+        if position is not None and position[0] == inode and position[1] == size:
+            return
+
+        with self._lock:
+            if self._position is None:
+                # A new worker has nothing cached yet, so only needs the messages published from now on
+                self._position = (inode, size)
+                return
+
+            if self._position[0] is None:
+                # Every message in a file created since the last poll is new
+                self._position = (inode, 0)
+            if self._position[0] != inode or self._position[1] > size:
+                # The file was replaced, so there may have been messages we missed
+                self._position = (inode, size)
+                self._reset()
+            elif self._position[1] < size:
+                self._read(path, inode)
+
+    def _read(self, path, inode):
+        """Read the lines appended since the last poll, and pass them on"""
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_ino != inode:
+                # The file was replaced since we stat()ed it, so pick up the new one next time
+                return
+            f.seek(self._position[1])
+            data = f.read()
+
+        # Leave a line which is still being written for the next poll
+        data = data[:data.rfind(b'\n') + 1]
+        self._position = (inode, self._position[1] + len(data))
+
+        pid = os.getpid()
+        for line in data.splitlines():
+            sender, topic, key = json.loads(line.decode('utf-8'))
+            if sender != pid:
+                self._dispatch(topic, tuple(key) if isinstance(key, list) else key)
+
+    def _dispatch(self, topic, key):
+        self.received += 1
+        for handler in self._handlers.get(topic, ()):
+            handler(key)
+
+    def _reset(self):
+        """Tell every handler that anything may have changed, after missing messages"""
+        self.resets += 1
+        for topic in self._handlers:
+            for handler in self._handlers[topic]:
+                handler(None)
+
+    def stats(self):
+        """Return the counters, and where in the file this worker has read up to, as a dict"""
+        position = self._position
+        return {'published': self.published, 'received': self.received, 'resets': self.resets,
+                'position': position[1] if position is not None else None}
+
+
+# One bus per process, shared by every cache
+invalidation_bus = InvalidationBus()
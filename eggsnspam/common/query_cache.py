@@ -0,0 +1,182 @@
+"""
+A cache of DAO query results.
+
+Many phrasebook reads are repeated verbatim across requests, such as loading a user with their preferences. With
+QUERY_CACHE_ENABLED set, SqlBaseDao.fetchone() and fetchall() keep the results of statement() queries in a cache
+(CACHE_BACKEND), keyed by the statement and its bind parameters. Each result is tagged with the tables its statement
+reads, and with the generation each table was at when it was read. Every write a DAO executes gives the tables it
+writes to a new generation, so only the results read from those tables stop being served. The generations are kept
+in the same cache as the results, so with a shared backend a write in one worker is seen by all of them. With the
+'local' backend and INVALIDATION_BUS_ENABLED set, the tables written to are published to the other workers instead.
+
+A write's tables get a new generation again once its transaction commits or rolls back, since until then other
+connections still read the old rows, which would otherwise be cached under the new generation.
+
+The tables are found from the FROM, JOIN, INTO and UPDATE clauses of the SQL. Writes the ORM flushes invalidate the
+tables of the objects they add, change or delete. Other writes, such as those by other hosts, are only picked up once
+results are QUERY_CACHE_TTL seconds old.
+"""
+
+import re
+import uuid
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .caches import cache_settings, create_cache
+from .invalidation import invalidation_bus
+
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+[\["\'`]?(\w+)', re.IGNORECASE)
+_WRITE_KEYWORDS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# Where a session keeps the tables written to in its transaction
+_PENDING_TABLES = 'query_cache_pending_tables'
+
+
+def statement_tables(sql):
+    """Return the names of the tables some SQL reads or writes, sorted and in lower case, and whether it writes"""
+    tables = tuple(sorted(set(table.lower() for table in _TABLE_PATTERN.findall(sql))))
+    words = sql.split(None, 1)
+    return tables, bool(words) and words[0].upper() in _WRITE_KEYWORDS
+
+
+class QueryCache(object):
+    """Cache query results tagged with the tables they were read from.
+
+    hits and misses count the lookups made by get_or_fetch(), and invalidations the writes which changed a table.
+    """
+
+    def __init__(self):
+        self._cache = None
+        self._cache_settings = None
+        self._statement_tables = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        """Return True if the app is configured to use the cache. DAOs used outside of an app never use it."""
+        return has_app_context() and current_app.config.get('QUERY_CACHE_ENABLED', False)
+
+    @property
+    def cache(self):
+        """The cache backend holding the results and table generations, chosen and sized from the app config"""
+        max_size = current_app.config.get('QUERY_CACHE_SIZE', 10000)
+        ttl = current_app.config.get('QUERY_CACHE_TTL')
+        settings = cache_settings(max_size, ttl)
+        if self._cache is None or self._cache_settings != settings:
+            self._cache = create_cache('queries', max_size, ttl)
+            self._cache_settings = settings
+        return self._cache
+
+    def tables(self, sql):
+        """Return statement_tables() for some SQL, only parsing it the first time.
+
+        Every statement's tables are kept for the life of the process, so only use this for SQL from statement().
+        """
+        tables = self._statement_tables.get(sql)
+        if tables is None:
+            tables = self._statement_tables[sql] = statement_tables(sql)
+        return tables
+
+    def get_or_fetch(self, key, tables, fetch):
+        """Return the cached result for key, or call fetch() and cache what it returns, tagged with tables.
+
+        Results are shared between requests, so callers must not modify them.
+        """
+        # Take the generations before fetching, so a result read while one of its tables was written to is refetched
+        generations = tuple(self._generation(table) for table in tables)
+
+        entry = self.cache.get(('result',) + key)
+        if entry is not None and entry[0] == generations:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        result = fetch()
+        self.cache.set(('result',) + key, (generations, result))
+        return result
+
+    def _generation(self, table):
+        """Get a table's current generation.
+
+        Generations are random rather than counted, so two workers writing at once can't give the table the same
+        generation twice. A table whose generation has been evicted or has expired gets a new one, so results read
+        before then can't match it.
+        """
+        generation = self.cache.get(('generation', table))
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.cache.set(('generation', table), generation)
+        return generation
+
+    def invalidate_tables(self, tables, session=None):
+        """Stop serving every result read from any of these tables, in every worker.
+
+        Pass the session of a write that hasn't been committed yet to invalidate the tables again once it commits or
+        rolls back.
+        """
+        self._new_generations(tables)
+        self.invalidations += 1
+        if session is not None:
+            session.info.setdefault(_PENDING_TABLES, set()).update(tables)
+
+    def _new_generations(self, tables):
+        cache = self.cache
+        for table in tables:
+            cache.set(('generation', table), uuid.uuid4().hex)
+            if not cache.shared:
+                invalidation_bus.publish('tables', table)
+
+    def _drop(self, table):
+        """Stop serving the results this worker read from a table, or every result if table is None"""
+        if self._cache is None or self._cache.shared:
+            return
+        if table is None:
+            self._cache.clear()
+        else:
+            self._cache.set(('generation', table), uuid.uuid4().hex)
+
+    def clear(self):
+        """Drop every cached result, from every worker if the cache is shared, and reset the counters"""
+        if self._cache is not None:
+            self._cache.clear()
+        self._cache = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def stats(self):
+        """Return the cache's size, counters and hit rate as a dict. The size counts table generations too"""
+        lookups = self.hits + self.misses
+        return {'size': len(self.cache), 'max_size': self.cache.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0, 'invalidations': self.invalidations}
+
+
+# One cache per process, shared by every DAO
+query_cache = QueryCache()
+invalidation_bus.subscribe('tables', query_cache._drop)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_pending_tables(session):
+    """Invalidate the tables written to in a transaction again once it has ended"""
+    tables = session.info.pop(_PENDING_TABLES, None)
+    if tables and query_cache.enabled:
+        query_cache._new_generations(sorted(tables))
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_flushed_tables(session, flush_context):
+    """Invalidate the tables of the objects the ORM has just written"""
+    if not query_cache.enabled:
+        return
+    tables = set()
+    for obj in set(session.new) | set(session.dirty) | set(session.deleted):
+        tables.update(table.name.lower() for table in inspect(obj).mapper.tables)
+    if tables:
+        query_cache.invalidate_tables(sorted(tables), session)
@@ -0,0 +1,117 @@
+"""
+A cache of computed recommendations.
+
+Users tend to ask for their recommendations again before their preferences change, so the results computed can be
+kept in a cache, either in each worker or shared by every worker on the host (CACHE_BACKEND). Results are stored under
+the user along with the versions of the preferences and catalog they were scored from, and are only served while both
+versions still match, so a stale list is never returned. The preference write paths also drop the user's entry
+straight away, and with INVALIDATION_BUS_ENABLED set and the 'local' backend, from every worker's cache.
+
+The cache is off unless RECOMMENDATION_CACHE_ENABLED is set.
+"""
+
+import hashlib
+
+from flask import current_app
+
+from .caches import cache_settings, create_cache
+from .invalidation import invalidation_bus
+
+
+def preference_version(preferences):
+    """Return a fingerprint of a map of ingredient ID to coefficient"""
+    return hashlib.sha1(repr(sorted(preferences.items())).encode('utf-8')).hexdigest()
+
+
+class RecommendationCache(object):
+    """Cache recommendation lists per user. namespace keeps the different implementations' users apart.
+
+    hits and misses count the lookups made by get_or_score().
+    """
+
+    # Most different combinations of options to keep results for, per user
+    MAX_OPTIONS_PER_USER = 8
+
+    def __init__(self):
+        self._cache = None
+        self._cache_settings = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        """Return True if the app is configured to use the cache"""
+        return current_app.config.get('RECOMMENDATION_CACHE_ENABLED', False)
+
+    @property
+    def cache(self):
+        """The cache backend holding the results, chosen and sized from the app config"""
+        max_size = current_app.config.get('RECOMMENDATION_CACHE_SIZE', 10000)
+        ttl = current_app.config.get('RECOMMENDATION_CACHE_TTL')
+        settings = cache_settings(max_size, ttl)
+        if self._cache is None or self._cache_settings != settings:
+            self._cache = create_cache('recommendations', max_size, ttl)
+            self._cache_settings = settings
+        return self._cache
+
+    def get_or_score(self, namespace, user_id, preferences, catalog, options, score):
+        """Return the user's cached results for these options, or call score() and cache what it returns.
+
+        options is a dict of everything besides the preferences and catalog that the results depend on, such as the
+        limit. Results are shared between requests, so callers must not modify them.
+        """
+        if not self.enabled:
+            return score()
+
+        key = (namespace, user_id)
+        version = (preference_version(preferences), catalog.version)
+        options = tuple(sorted(options.items()))
+
+        entry = self.cache.get(key)
+        if entry is not None and entry['version'] == version and options in entry['results']:
+            self.hits += 1
+            return entry['results'][options]
+
+        if entry is None or entry['version'] != version or len(entry['results']) >= self.MAX_OPTIONS_PER_USER:
+            entry = {'version': version, 'results': {}}
+
+        self.misses += 1
+        results = entry['results'][options] = score()
+        self.cache.set(key, entry)
+        return results
+
+    def invalidate(self, namespace, user_id):
+        """Drop a user's cached results after their preferences have changed, and tell the other workers to drop
+        theirs unless the cache is shared with them"""
+        # A worker which hasn't used the cache yet still has to delete from a shared one, and tell the others
+        if self.enabled or self._cache is not None:
+            cache = self.cache
+            cache.delete((namespace, user_id))
+            if not cache.shared:
+                invalidation_bus.publish('recommendations', [namespace, user_id])
+
+    def _drop(self, key):
+        """Drop a user's results from this worker's cache, or every user's if key is None"""
+        if self._cache is None or self._cache.shared:
+            return
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.delete(key)
+
+    def clear(self):
+        """Drop every cached result, from every worker if the cache is shared, and reset the counters"""
+        if self._cache is not None:
+            self._cache.clear()
+        self._cache = None
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Return the number of users cached and the hit/miss counters as a dict"""
+        return {'size': len(self.cache), 'max_size': self.cache.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+# One cache per process, shared by every recommendation implementation
+recommendation_cache = RecommendationCache()
+invalidation_bus.subscribe('recommendations', recommendation_cache._drop)
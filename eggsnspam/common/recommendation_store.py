@@ -0,0 +1,215 @@
+"""
+A materialized store of every user's ranked breakfast recommendations.
+
+Recommendations are read far more often than preferences change, so rather than scoring a user on every request
+their full ranked list can be written to tblUserRecommendation whenever their preferences change, and read back with
+a single indexed query. Each user's list records the catalog version it was scored against, so lists scored against
+an older catalog are recomputed the next time they are read. Every implementation scores users its own way, so each
+stores its lists under its own namespace.
+
+The store is off unless RECOMMENDATION_STORE_ENABLED is set.
+"""
+
+from abc import ABCMeta, abstractmethod
+
+from flask import current_app
+
+from .daos import SqlBaseDao, statement
+from ..extensions import db
+
+
+class RecommendationStoreDao(SqlBaseDao):
+    """Reads and writes stored recommendations. namespace keeps the different implementations' users apart."""
+
+    def get_for_user(self, namespace, user_id, limit=None, min_score=None):
+        """Get a user's stored recommendations, best first.
+
+        Returns a (catalog_version, recommendations) tuple, or None if nothing is stored for the user.
+        """
+        params = {'namespace': namespace, 'user_id': user_id}
+        score_filter = ''
+        limit_clause = ''
+        if min_score is not None:
+            score_filter = 'AND tblUserRecommendation.score >= :min_score'
+            params['min_score'] = min_score
+        if limit is not None:
+            limit_clause = 'LIMIT :limit'
+            params['limit'] = limit
+
+        query = statement("""
+        SELECT
+            tblUserRecommendationVersion.catalog_version as catalog_version,
+            tblUserRecommendation.breakfast_id as breakfast_id,
+            tblUserRecommendation.score as score
+        FROM tblUserRecommendationVersion
+        LEFT OUTER JOIN tblUserRecommendation ON
+            tblUserRecommendation.namespace = tblUserRecommendationVersion.namespace
+            AND tblUserRecommendation.user_id = tblUserRecommendationVersion.user_id
+            {score_filter}
+        WHERE tblUserRecommendationVersion.namespace=:namespace AND tblUserRecommendationVersion.user_id=:user_id
+        ORDER BY tblUserRecommendation.score DESC, tblUserRecommendation.breakfast_id
+        {limit_clause};
+        """.format(score_filter=score_filter, limit_clause=limit_clause))
+        result = self.fetchall(query, **params)
+
+        if len(result) == 0:
+            return None
+
+        recommendations = [{'breakfast_id': r['breakfast_id'], 'score': r['score']}
+                           for r in result if r['breakfast_id'] is not None]
+        return result[0]['catalog_version'], recommendations
+
+    def replace_for_user(self, namespace, user_id, catalog_version, recommendations):
+        """Replace a user's stored recommendations"""
+        self._delete_for_user(namespace, user_id)
+
+        if recommendations:
+            query = statement("""
+            INSERT INTO tblUserRecommendation
+                (namespace, user_id, breakfast_id, score)
+            VALUES
+                (:namespace, :user_id, :breakfast_id, :score);
+            """)
+            self.execute(query, [{'namespace': namespace, 'user_id': user_id, 'breakfast_id': r['breakfast_id'],
+                                  'score': r['score']} for r in recommendations])
+
+        query = statement("""
+        INSERT INTO tblUserRecommendationVersion
+            (namespace, user_id, catalog_version)
+        VALUES
+            (:namespace, :user_id, :catalog_version);
+        """)
+        self.execute(query, namespace=namespace, user_id=user_id, catalog_version=catalog_version)
+        db.session.commit()
+
+    def add_to_scores(self, namespace, user_id, score_changes):
+        """Add to some of a user's stored scores. score_changes is a list of (breakfast_id, change) pairs."""
+        if score_changes:
+            query = statement("""
+            UPDATE tblUserRecommendation SET
+                score=score + :change
+            WHERE
+                namespace=:namespace AND user_id=:user_id AND breakfast_id=:breakfast_id
+            """)
+            self.execute(query, [{'namespace': namespace, 'user_id': user_id, 'breakfast_id': breakfast_id,
+                                  'change': change} for breakfast_id, change in score_changes])
+        db.session.commit()
+
+    def delete_for_user(self, namespace, user_id):
+        """Delete a user's stored recommendations"""
+        self._delete_for_user(namespace, user_id)
+        db.session.commit()
+
+    def _delete_for_user(self, namespace, user_id):
+        self.execute(statement("""
+        DELETE FROM tblUserRecommendation WHERE namespace=:namespace AND user_id=:user_id
+        """), namespace=namespace, user_id=user_id)
+        self.execute(statement("""
+        DELETE FROM tblUserRecommendationVersion WHERE namespace=:namespace AND user_id=:user_id
+        """), namespace=namespace, user_id=user_id)
+
+
+class BaseRecommendationStore(object):
+    """Keeps stored recommendations in step with a recommendation implementation.
+
+    Subclasses tell the store how to load the catalog, list users and score them, and which namespace to store their
+    users' recommendations under.
+    """
+
+    __metaclass__ = ABCMeta
+
+    DEFAULT_DAO = RecommendationStoreDao
+
+    # How many users rebuild_all() scores at once
+    REBUILD_BATCH_SIZE = 500
+
+    def __init__(self, namespace, dao=None):
+        if dao is None:
+            dao = self.DEFAULT_DAO()
+        self.namespace = namespace
+        self.dao = dao
+
+    @property
+    def enabled(self):
+        """Return True if the app is configured to use the store"""
+        return current_app.config.get('RECOMMENDATION_STORE_ENABLED', False)
+
+    @abstractmethod
+    def load_catalog(self):
+        """Return the current BreakfastCatalog"""
+
+    @abstractmethod
+    def list_user_ids(self):
+        """Return the IDs of every user"""
+
+    @abstractmethod
+    def recommend_many(self, user_ids):
+        """Return a map of user ID to that user's full ranked recommendations. Unknown users are left out."""
+
+    def get(self, user_id, limit=None, min_score=None):
+        """Get a user's recommendations, scoring and storing them first if they are missing or out of date.
+
+        Returns None if the user does not exist.
+        """
+        catalog_version = self.load_catalog().version
+        stored = self.dao.get_for_user(self.namespace, user_id, limit=limit, min_score=min_score)
+        if stored is not None and stored[0] == catalog_version:
+            return stored[1]
+
+        recommendations = self.refresh(user_id)
+        if recommendations is None:
+            return None
+
+        if min_score is not None:
+            recommendations = [r for r in recommendations if r['score'] >= min_score]
+        return recommendations[:limit]
+
+    def refresh(self, user_id):
+        """Rescore a user and store the results. Returns the new recommendations, or None if the user is gone."""
+        catalog_version = self.load_catalog().version
+        recommendations = self.recommend_many([user_id]).get(user_id)
+
+        if recommendations is None:
+            self.dao.delete_for_user(self.namespace, user_id)
+        else:
+            self.dao.replace_for_user(self.namespace, user_id, catalog_version, recommendations)
+
+        return recommendations
+
+    def apply_preference_changes(self, user_id, changes):
+        """Update a user's stored scores after some of their preference coefficients changed.
+
+        changes maps ingredient ID to how much the user's coefficient for it went up or down. Only the scores of
+        breakfasts using those ingredients are touched. Users whose stored recommendations are missing, empty or
+        scored against another catalog are rescored in full instead.
+
+        Repeated updates can drift from a full rescore by floating point rounding, which rebuild_all() resets.
+        """
+        catalog = self.load_catalog()
+        stored = self.dao.get_for_user(self.namespace, user_id, limit=1)
+        if stored is None or stored[0] != catalog.version or not stored[1]:
+            self.refresh(user_id)
+            return
+
+        rows, score_changes = catalog.score_sparse(changes)
+        score_changes = list(zip(catalog.breakfast_ids[rows].tolist(), score_changes.tolist()))
+        self.dao.add_to_scores(self.namespace, user_id, score_changes)
+
+    def delete(self, user_id):
+        """Forget a user's stored recommendations"""
+        self.dao.delete_for_user(self.namespace, user_id)
+
+    def rebuild_all(self):
+        """Rescore and store every user's recommendations, e.g. after the catalog has changed.
+
+        Returns the number of users stored.
+        """
+        user_ids = self.list_user_ids()
+        catalog_version = self.load_catalog().version
+
+        for start in range(0, len(user_ids), self.REBUILD_BATCH_SIZE):
+            recommendations = self.recommend_many(user_ids[start:start + self.REBUILD_BATCH_SIZE])
+            for user_id, user_recommendations in recommendations.items():
+                self.dao.replace_for_user(self.namespace, user_id, catalog_version, user_recommendations)
+
+        return len(user_ids)
@@ -1,6 +1,184 @@
+import math
+
+import numpy as np
+
+
+# The most ingredients to list for each breakfast when explaining its score
+EXPLAIN_SIZE = 5
+
+
 def dot_product(d1, d2, default_value=0):
     """Calcualte the dot product for the intersection of two dictionary objects.
 
     If the key does not exist in d2, default_value is used instead.
     """
     return sum(map(lambda x: float(d1[x]) * float(d2.get(x, default_value)), d1.keys()))
+
+
+def preference_norm(preferences):
+    """Return the length of a map of ingredient ID to coefficient, as a vector"""
+    return math.sqrt(sum(float(coefficient) ** 2 for coefficient in preferences.values()))
+
+
+def cosine_similarity(d1, d2):
+    """Calculate the cosine of the angle between two dictionary objects, as vectors.
+
+    Unlike the dot product, this doesn't grow with the number of keys. It is 0 if either dictionary has length 0.
+    """
+    norms = preference_norm(d1) * preference_norm(d2)
+    return dot_product(d1, d2) / norms if norms else 0.0
+
+
+def _dot_product_scores(catalog, rows, dot_products, preferences):
+    return dot_products
+
+
+def _cosine_scores(catalog, rows, dot_products, preferences):
+    # The breakfasts' norms were computed when the catalog was loaded, so only the user's is computed here
+    user_norm = preference_norm(preferences)
+    if not user_norm:
+        return np.zeros(len(dot_products))
+    return dot_products * catalog.inverse_norms[rows] * (1.0 / user_norm)
+
+
+# How a breakfast's score is derived from its dot product with the user's preferences. Each strategy is called with
+# the catalog, the rows of the scored breakfasts, their dot products and the user's preferences, and returns the
+# breakfasts' scores. A strategy must score 0 when the dot product is 0, and keep the sign of the dot product. It must
+# also scale each breakfast's dot product by a factor, so the products the dot product is summed from can be scaled by
+# the same strategy to explain the score.
+SCORING_STRATEGIES = {
+    'dot_product': _dot_product_scores,
+    'cosine': _cosine_scores,
+}
+
+
+def top_scores(scores, limit=None, min_score=None):
+    """Return the indexes of the highest scores, best first, with ties kept in index order.
+
+    Only scores of at least min_score are considered. When a limit is given, the limit-th best score is found with a
+    partial sort, so only the breakfasts that can make the cut are fully sorted.
+    """
+    if min_score is None:
+        candidates = np.arange(len(scores))
+    else:
+        candidates = np.flatnonzero(scores >= min_score)
+
+    if limit is not None and 0 < limit < len(candidates):
+        candidate_scores = scores[candidates]
+        threshold = -np.partition(-candidate_scores, limit - 1)[limit - 1]
+        candidates = candidates[candidate_scores >= threshold]
+
+    # mergesort is stable, which keeps tied breakfasts in ID order
+    order = candidates[np.argsort(-scores[candidates], kind='mergesort')]
+    return order[:limit]
+
+
+def explain_scores(catalog, rows, products, preferences, strategy='dot_product', size=EXPLAIN_SIZE):
+    """Find the ingredients contributing most to each of some breakfasts' scores.
+
+    products are the products returned by BreakfastCatalog.score_sparse(), scaled here by the scoring strategy, so
+    each breakfast's contributions add up to its score. Returns a list with up to `size` contributions for each of
+    rows, biggest first, as dicts of ingredient_id and score.
+    """
+    product_rows, ingredient_ids, values = products
+    explained = np.in1d(product_rows, rows)
+    product_rows, ingredient_ids = product_rows[explained], ingredient_ids[explained]
+    values = SCORING_STRATEGIES[strategy](catalog, product_rows, values[explained], preferences)
+
+    # Group the products by breakfast, biggest first, and keep the first `size` in each group
+    order = np.lexsort((-np.abs(values), product_rows))
+    product_rows, ingredient_ids, values = product_rows[order], ingredient_ids[order], values[order]
+    kept = np.arange(len(product_rows)) - np.searchsorted(product_rows, product_rows) < size
+
+    contributions = {}
+    for row, ingredient_id, value in zip(product_rows[kept].tolist(), ingredient_ids[kept].tolist(),
+                                         values[kept].tolist()):
+        contributions.setdefault(row, []).append({'ingredient_id': ingredient_id, 'score': value})
+    return [contributions.get(row, []) for row in rows.tolist()]
+
+
+def _build_results(breakfast_ids, scores, contributions=None):
+    """Build the recommendation dicts for parallel arrays of breakfast IDs and scores, and optionally contributions"""
+    results = [{'breakfast_id': breakfast_id, 'score': score}
+               for breakfast_id, score in zip(breakfast_ids.tolist(), scores.tolist())]
+    if contributions is not None:
+        for result, result_contributions in zip(results, contributions):
+            result['contributions'] = result_contributions
+    return results
+
+
+def _allowed_rows(catalog, exclude_ingredients, require_ingredients):
+    """Return the mask of breakfasts passing the ingredient filters, or None if there are no filters"""
+    if not exclude_ingredients and not require_ingredients:
+        return None
+    return catalog.ingredient_mask(exclude_ingredients=exclude_ingredients, require_ingredients=require_ingredients)
+
+
+def score_breakfasts(catalog, preferences, limit=None, min_score=None, strategy='dot_product', explain=False,
+                     exclude_ingredients=(), require_ingredients=()):
+    """Score every breakfast in a BreakfastCatalog against a user's ingredient preferences.
+
+    strategy names one of the SCORING_STRATEGIES. With 'dot_product', scores are the same dot products dot_product()
+    would give, and with 'cosine' they are the cosine_similarity() of the breakfast and the preferences.
+
+    Results are sorted by score, best first, with ties kept in breakfast ID order. Pass limit and min_score to only
+    get the top matches; results are only built for the breakfasts that are returned.
+
+    Only breakfasts using one of the user's ingredients are scored. The rest score 0, and are only added when they
+    could be among the results: when min_score allows 0 and there are too few positive scores to fill the limit.
+
+    If explain is True, each result also has the ingredients contributing most to its score, from explain_scores().
+    They are taken from the same products the scores are summed from.
+
+    Breakfasts using any of exclude_ingredients, or not using all of require_ingredients, are left out before the
+    top breakfasts are picked.
+    """
+    rows, scores, products = catalog.score_sparse(preferences, return_products=True)
+    scores = SCORING_STRATEGIES[strategy](catalog, rows, scores, preferences)
+
+    allowed = _allowed_rows(catalog, exclude_ingredients, require_ingredients)
+    if allowed is not None:
+        allowed_scored = allowed[rows]
+        rows, scores = rows[allowed_scored], scores[allowed_scored]
+
+    needs_zeros = min_score is None or min_score <= 0
+    if needs_zeros and limit is not None:
+        needs_zeros = np.count_nonzero(scores > 0) < limit
+
+    if needs_zeros:
+        all_scores = np.zeros(len(catalog))
+        all_scores[rows] = scores
+        rows = np.arange(len(catalog)) if allowed is None else np.flatnonzero(allowed)
+        scores = all_scores[rows]
+
+    order = top_scores(scores, limit=limit, min_score=min_score)
+    contributions = None
+    if explain:
+        contributions = explain_scores(catalog, rows[order], products, preferences, strategy=strategy)
+    return _build_results(catalog.breakfast_ids[rows[order]], scores[order], contributions)
+
+
+def score_breakfasts_many(catalog, preferences_list, limit=None, min_score=None, strategy='dot_product',
+                          explain=False, exclude_ingredients=(), require_ingredients=()):
+    """Score every breakfast against many users' preferences at once.
+
+    Returns a list of results, in the same order as preferences_list, each exactly what score_breakfasts() would
+    return for those preferences.
+    """
+    if explain:
+        # The matrix product doesn't keep the products making up each score, so explained users are scored one by one
+        return [score_breakfasts(catalog, preferences, limit=limit, min_score=min_score, strategy=strategy,
+                                 explain=True, exclude_ingredients=exclude_ingredients,
+                                 require_ingredients=require_ingredients)
+                for preferences in preferences_list]
+
+    rows = np.arange(len(catalog))
+    allowed = _allowed_rows(catalog, exclude_ingredients, require_ingredients)
+    allowed_rows = rows if allowed is None else np.flatnonzero(allowed)
+
+    results = []
+    for preferences, scores in zip(preferences_list, catalog.score_many(preferences_list)):
+        scores = SCORING_STRATEGIES[strategy](catalog, rows, scores, preferences)[allowed_rows]
+        order = top_scores(scores, limit=limit, min_score=min_score)
+        results.append(_build_results(catalog.breakfast_ids[allowed_rows[order]], scores[order]))
+    return results
@@ -0,0 +1,194 @@
+"""
+A per-process snapshot of the breakfast and ingredient reference tables.
+
+tblBreakfast and tblIngredient only change a few times a day, but are read on every breakfast and ingredient request.
+Each worker can instead keep both tables in memory indexed by ID, and serve those requests without querying the
+database. Once the snapshot is REFERENCE_DATA_REFRESH_INTERVAL seconds old, the next request starts a background
+thread to reread the tables, and requests are served from the old snapshot until the thread has finished. The tables
+have no column recording when they last changed, so a snapshot's version is a fingerprint of its rows, and the
+snapshot is only replaced when the version has changed. With INVALIDATION_BUS_ENABLED set, reloading or invalidating
+the snapshot in one worker also drops it in every other worker, so they reload it at their next request.
+
+The snapshot is off unless REFERENCE_DATA_SNAPSHOT_ENABLED is set.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from .daos import SqlBaseDao, statement
+from .invalidation import invalidation_bus
+
+
+class ReferenceDataDao(SqlBaseDao):
+    """Reads the reference tables. Columns are aliased so their keys don't depend on how the tables spell them."""
+
+    def list_breakfasts(self):
+        """Iterate over every breakfast, in ID order"""
+        query = statement("""
+        SELECT id AS id, name AS name FROM tblBreakfast
+        ORDER BY id;
+        """)
+        return self.iterate(query)
+
+    def list_ingredients(self):
+        """Iterate over every ingredient, in ID order"""
+        query = statement("""
+        SELECT id AS id, name AS name FROM tblIngredient
+        ORDER BY id;
+        """)
+        return self.iterate(query)
+
+
+class ReferenceData(object):
+    """The breakfasts and ingredients, each a dict of their columns by ID.
+
+    The dicts are shared between requests, so callers must not modify them.
+    """
+
+    def __init__(self, breakfasts, ingredients):
+        self.breakfasts = OrderedDict((row['id'], dict(row)) for row in breakfasts)
+        self.ingredients = OrderedDict((row['id'], dict(row)) for row in ingredients)
+
+        fingerprint = hashlib.sha1()
+        for rows in (self.breakfasts, self.ingredients):
+            fingerprint.update(repr(sorted(sorted(row.items()) for row in rows.values())).encode('utf-8'))
+        self.version = fingerprint.hexdigest()
+
+    @classmethod
+    def load(cls, dao=None):
+        """Read both tables from the database"""
+        if dao is None:
+            dao = ReferenceDataDao()
+        return cls(dao.list_breakfasts(), dao.list_ingredients())
+
+    @staticmethod
+    def _select(rows, ids):
+        """Return every row in ID order, or only the rows for a list of IDs in the order of ids.
+
+        Like the DAOs' get_by_ids(), each row is returned once even if its ID is asked for more than once, and IDs
+        with no row are left out.
+        """
+        if ids is None:
+            return list(rows.values())
+        return [rows[id] for id in OrderedDict.fromkeys(ids) if id in rows]
+
+    def get_breakfasts(self, ids=None):
+        """Return every breakfast, or the breakfasts for a list of IDs"""
+        return self._select(self.breakfasts, ids)
+
+    def get_ingredients(self, ids=None):
+        """Return every ingredient, or the ingredients for a list of IDs"""
+        return self._select(self.ingredients, ids)
+
+
+class ReferenceDataCache(object):
+    """Hold a single ReferenceData snapshot for the whole process."""
+
+    def __init__(self):
+        self._data = None
+        self._checked_at = None
+        self._generation = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """Return True if the app is configured to serve breakfasts and ingredients from the snapshot"""
+        return current_app.config.get('REFERENCE_DATA_SNAPSHOT_ENABLED', False)
+
+    def get(self):
+        """Return the snapshot, loading it if there isn't one yet.
+
+        Once it is due a refresh, a background thread is started to check the tables for changes, and the current
+        snapshot is returned without waiting for it.
+        """
+        data = self._data
+        if data is None:
+            with self._lock:
+                # Another request may have loaded the snapshot while we were waiting for the lock
+                if self._data is None:
+                    self._data = ReferenceData.load()
+                    self._checked_at = time.time()
+                return self._data
+
+        if self._is_due():
+            self._refresh_in_background()
+        return data
+
+    def _is_due(self):
+        """Return True if the snapshot has gone REFERENCE_DATA_REFRESH_INTERVAL seconds without being checked"""
+        interval = current_app.config.get('REFERENCE_DATA_REFRESH_INTERVAL')
+        return interval is not None and not self._refreshing and time.time() - self._checked_at >= interval
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            # Wait a whole interval before trying again, even if this refresh fails
+            self._checked_at = time.time()
+
+        thread = threading.Thread(target=self._refresh_with_app, args=(current_app._get_current_object(),))
+        thread.daemon = True
+        thread.start()
+
+    def _refresh_with_app(self, app):
+        """Run refresh() in its own app context, so the thread gets its own database session"""
+        try:
+            with app.app_context():
+                self.refresh()
+        except Exception:
+            app.logger.exception('Failed to refresh the reference data snapshot')
+        finally:
+            self._refreshing = False
+
+    def refresh(self):
+        """Reread the tables and replace the snapshot if their version has changed.
+
+        Returns True if the snapshot was replaced.
+        """
+        generation = self._generation
+        data = ReferenceData.load()
+
+        with self._lock:
+            self._checked_at = time.time()
+            # Don't replace a snapshot that was reloaded or invalidated while the tables were being read
+            if generation != self._generation or self._data is None or self._data.version == data.version:
+                return False
+            self._data = data
+            return True
+
+    def reload(self):
+        """Replace the snapshot with the tables' current rows straight away, and return it"""
+        data = ReferenceData.load()
+        with self._lock:
+            self._generation += 1
+            self._data = data
+            self._checked_at = time.time()
+        invalidation_bus.publish('reference_data')
+        return data
+
+    def invalidate(self):
+        """Drop the snapshot so the next request reloads it, and tell the other workers to drop theirs"""
+        self._drop()
+        invalidation_bus.publish('reference_data')
+
+    def _drop(self, key=None):
+        self._generation += 1
+        self._data = None
+
+    def stats(self):
+        """Return the loaded snapshot's version and size as a dict"""
+        data = self._data
+        if data is None:
+            return {'version': None, 'breakfasts': 0, 'ingredients': 0}
+        return {'version': data.version, 'breakfasts': len(data.breakfasts), 'ingredients': len(data.ingredients)}
+
+
+# One snapshot per process, shared by every implementation's breakfast and ingredient views
+reference_data_cache = ReferenceDataCache()
+invalidation_bus.subscribe('reference_data', reference_data_cache._drop)
@@ -1,10 +1,41 @@
 """SQLAlchemy model definitions."""
 
-from eggsnspam.common.recommendations import dot_product
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+from eggsnspam.common.catalog import catalog_cache
+from eggsnspam.common.recommendation_cache import recommendation_cache
+from eggsnspam.common.recommendation_store import BaseRecommendationStore
+from eggsnspam.common.recommendations import score_breakfasts
+from eggsnspam.common.reference_data import reference_data_cache
 from eggsnspam.extensions import db
 
 
-class Breakfast(db.Model):
+class GetByIdsMixin(object):
+    """Adds get_by_ids() to a model whose primary key is its id column."""
+
+    # Most IDs to bind into a single IN (...) clause. SQLite allows at most 999 bind parameters per statement.
+    MAX_IN_CLAUSE_SIZE = 500
+
+    @classmethod
+    def get_by_ids(cls, ids):
+        """Get the instances for a list of IDs with an IN (...) query per chunk of IDs.
+
+        Instances are returned in the order of ids, once each even if an ID is asked for more than once. IDs with no
+        row are left out.
+        """
+        ids = list(OrderedDict.fromkeys(ids))
+        instances = {}
+        for start in range(0, len(ids), cls.MAX_IN_CLAUSE_SIZE):
+            chunk = ids[start:start + cls.MAX_IN_CLAUSE_SIZE]
+            for instance in cls.query.with_hint(cls, "WITH (NOLOCK)").filter(cls.id.in_(chunk)):
+                instances[instance.id] = instance
+        return [instances[id] for id in ids if id in instances]
+
+
+class Breakfast(GetByIdsMixin, db.Model):
     """Defines the breakfast table."""
 
     __tablename__ = 'tblBreakfast'
@@ -26,7 +57,7 @@ class Breakfast(db.Model):
         return {k: v for k, v in self.__dict__.items() if k != "_sa_instance_state"}
 
 
-class Ingredient(db.Model):
+class Ingredient(GetByIdsMixin, db.Model):
     """Defines the ingredient table."""
 
     __tablename__ = 'tblIngredient'
@@ -49,7 +80,7 @@ class Ingredient(db.Model):
         return {k: v for k, v in self.__dict__.items() if k != "_sa_instance_state"}
 
 
-class User(db.Model):
+class User(GetByIdsMixin, db.Model):
     """Defines the user table."""
 
     __tablename__ = 'tblUser'
@@ -79,33 +110,26 @@ class User(db.Model):
             "last_name": self.last_name
         }
 
-    def get_recommendations(self):
-        """Get breakfast recommendations using dot_product"""
-        breakfasts = {}
-        breakfast_scores = {}
-        results = []
+    def get_recommendations(self, **options):
+        """Get breakfast recommendations scored by the dot product of ingredient coefficients
+
+        options are passed on to score_breakfasts(), e.g. limit and min_score to only get the top `limit` breakfasts
+        scoring at least `min_score`.
+        """
+        # A cached catalog never issues the query that would have autoflushed preferences added to the session
+        if db.session.autoflush:
+            db.session.flush()
 
         # Get all the user's ingredient preferences
         user_prefs = {p.ingredient_id: p.coefficient for p in self.preferences}
 
         # Get all breakfasts and their ingredients
-        for bi in BreakfastIngredient.query.with_hint(BreakfastIngredient, "WITH (NOLOCK)").all():
-            breakfasts.setdefault(bi.breakfast_id, {})
-            breakfasts[bi.breakfast_id][bi.ingredient_id] = bi.coefficient
-
-        # Use dot product to score similarity of breakfast ingredients and user's preferences
-        for breakfast, ingredients in breakfasts.items():
-            breakfast_scores[breakfast] = dot_product(ingredients, user_prefs)
+        catalog = catalog_cache.get(BreakfastIngredient.list_all)
 
-        # build the results object
-        for breakfast in breakfasts:
-            results.append({
-                'breakfast_id': breakfast,
-                'score': breakfast_scores[breakfast],
-            })
-
-        # sort the results by the dot product result
-        return sorted(results, reverse=True, key=lambda k: k['score'])
+        # Score the similarity of every breakfast's ingredients to the user's preferences, best match first, unless
+        # the results for the same preferences and catalog are cached
+        return recommendation_cache.get_or_score(
+            'oop_orm', self.id, user_prefs, catalog, options, lambda: score_breakfasts(catalog, user_prefs, **options))
 
 
 class BreakfastIngredient(db.Model):
@@ -116,6 +140,11 @@ class BreakfastIngredient(db.Model):
     ingredient_id = db.Column('ingredient_id', db.Integer, db.ForeignKey('tblIngredient.id'), primary_key=True)
     coefficient = db.Column('coefficient', db.Float, nullable=False)
 
+    @classmethod
+    def list_all(cls):
+        """Get all ingredients for all breakfasts as python dicts."""
+        return [bi.to_dict() for bi in cls.query.with_hint(cls, "WITH (NOLOCK)").all()]
+
     def to_dict(self):
         """Convert the object instance to a python dict."""
         return {
@@ -125,6 +154,35 @@ class BreakfastIngredient(db.Model):
         }
 
 
+def _invalidate_catalog(*args):
+    """Drop the cached breakfast catalog whenever a breakfast ingredient is flushed"""
+    catalog_cache.invalidate()
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(BreakfastIngredient, _event_name, _invalidate_catalog)
+
+
+def _invalidate_reference_data(*args):
+    """Drop this process's reference data snapshot whenever a breakfast or ingredient is flushed"""
+    reference_data_cache.invalidate()
+
+
+for _model in (Breakfast, Ingredient):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _invalidate_reference_data)
+
+
+@event.listens_for(Session, 'after_attach')
+def _invalidate_catalog_on_attach(session, instance):
+    """Drop the cached breakfast catalog as soon as a breakfast ingredient is added to a session.
+
+    Waiting for the flush isn't enough, since a cached catalog never issues the query that would autoflush it.
+    """
+    if isinstance(instance, BreakfastIngredient):
+        catalog_cache.invalidate()
+
+
 class UserPreference(db.Model):
 
     __tablename__ = 'tblUserPreferences'
@@ -140,3 +198,21 @@ class UserPreference(db.Model):
             'ingredient_id': self.ingredient_id,
             'coefficient': self.coefficient
         }
+
+
+class UserRecommendationStore(BaseRecommendationStore):
+    """Stores the recommendations User.get_recommendations gives for each user."""
+
+    def __init__(self, dao=None):
+        super(UserRecommendationStore, self).__init__('oop_orm', dao=dao)
+
+    def load_catalog(self):
+        return catalog_cache.get(BreakfastIngredient.list_all)
+
+    def list_user_ids(self):
+        return [user_id for (user_id,) in db.session.query(User.id).with_hint(User, "WITH (NOLOCK)")]
+
+    def recommend_many(self, user_ids):
+        users = User.query.options(joinedload('preferences')).with_hint(User, "WITH (NOLOCK)").filter(
+            User.id.in_(user_ids)).all()
+        return {user.id: user.get_recommendations() for user in users}
@@ -4,10 +4,14 @@ from sqlalchemy.orm import load_only, joinedload
 from sqlalchemy.exc import IntegrityError
 
 from .forms import UserForm, UserPreferenceForm, UserPreferenceUpdateForm
-from .models import Breakfast, Ingredient, User, UserPreference
+from .models import Breakfast, Ingredient, User, UserPreference, UserRecommendationStore
 
+from eggsnspam.common import admin_views
 from eggsnspam.common import healthcheck_views
 from eggsnspam.common import responses
+from eggsnspam.common.forms import IdListForm, RecommendationForm
+from eggsnspam.common.recommendation_cache import recommendation_cache
+from eggsnspam.common.reference_data import reference_data_cache
 from eggsnspam.extensions import db
 
 
@@ -16,7 +20,20 @@ oop_orm = Blueprint('oop_orm', __name__, url_prefix='/oop_orm')
 
 @oop_orm.route('/breakfast/', methods=["GET"])
 def list_breakfasts():
-    """List all breakfasts currently in the database"""
+    """List all breakfasts currently in the database, or the ones with the IDs given as ?ids=1,2,3 in full"""
+    form = IdListForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
+    if reference_data_cache.enabled:
+        reference_data = reference_data_cache.get()
+        if form.ids.data:
+            return jsonify(breakfasts=reference_data.get_breakfasts(form.ids.data))
+        return jsonify(breakfasts=[{"id": x} for x in reference_data.breakfasts])
+
+    if form.ids.data:
+        return jsonify(breakfasts=[x.to_dict() for x in Breakfast.get_by_ids(form.ids.data)])
+
     breakfasts = Breakfast.query.with_hint(Breakfast, "WITH (NOLOCK)").options(load_only("id")).all()
     return jsonify(breakfasts=[{"id": x.id} for x in breakfasts])
 
@@ -24,6 +41,12 @@ def list_breakfasts():
 @oop_orm.route('/breakfast/<int:breakfast_id>', methods=["GET"])
 def get_breakfast(breakfast_id):
     """Get a breakfast by its primary key"""
+    if reference_data_cache.enabled:
+        breakfast = reference_data_cache.get().breakfasts.get(breakfast_id)
+        if breakfast:
+            return jsonify(breakfast)
+        return "Does not exist", 404
+
     breakfast = Breakfast.query.with_hint(Breakfast, "WITH (NOLOCK)").get(breakfast_id)
     if breakfast:
         return jsonify(breakfast.to_dict())
@@ -33,7 +56,20 @@ def get_breakfast(breakfast_id):
 
 @oop_orm.route('/ingredient/', methods=["GET"])
 def list_ingredients():
-    """List all ingredients currently in the database"""
+    """List all ingredients currently in the database, or the ones with the IDs given as ?ids=1,2,3 in full"""
+    form = IdListForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
+    if reference_data_cache.enabled:
+        reference_data = reference_data_cache.get()
+        if form.ids.data:
+            return jsonify(ingredients=reference_data.get_ingredients(form.ids.data))
+        return jsonify(ingredients=[{"id": x} for x in reference_data.ingredients])
+
+    if form.ids.data:
+        return jsonify(ingredients=[x.to_dict() for x in Ingredient.get_by_ids(form.ids.data)])
+
     ingredients = Ingredient.query.with_hint(Ingredient, "WITH (NOLOCK)").options(load_only("id")).all()
     return jsonify(ingredients=[{"id": x.id} for x in ingredients])
 
@@ -41,6 +77,12 @@ def list_ingredients():
 @oop_orm.route('/ingredient/<int:ingredient_id>', methods=["GET"])
 def get_ingredient(ingredient_id):
     """Get a ingredient by its primary key"""
+    if reference_data_cache.enabled:
+        ingredient = reference_data_cache.get().ingredients.get(ingredient_id)
+        if ingredient:
+            return jsonify(ingredient)
+        return "Does not exist", 404
+
     ingredient = Ingredient.query.with_hint(Ingredient, "WITH (NOLOCK)").get(ingredient_id)
     if ingredient:
         return jsonify(ingredient.to_dict())
@@ -50,8 +92,15 @@ def get_ingredient(ingredient_id):
 
 @oop_orm.route('/user/', methods=["GET"])
 def list_user():
-    """List all users currently in the database"""
-    users = User.query.with_hint(User, "WITH (NOLOCK)").all()
+    """List all users currently in the database, or only the ones with the IDs given as ?ids=1,2,3"""
+    form = IdListForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
+    if form.ids.data:
+        users = User.get_by_ids(form.ids.data)
+    else:
+        users = User.query.with_hint(User, "WITH (NOLOCK)").all()
     return jsonify(users=[x.to_dict() for x in users])
 
 
@@ -79,6 +128,12 @@ def delete_user(user_id):
 
     db.session.delete(user)
     db.session.commit()
+
+    recommendation_cache.invalidate('oop_orm', user_id)
+    store = UserRecommendationStore()
+    if store.enabled:
+        store.delete(user_id)
+
     return responses.object_deleted()
 
 
@@ -95,10 +150,22 @@ def get_user(user_id):
 @oop_orm.route('/user/<int:user_id>/breakfast_recommendations', methods=["GET"])
 def get_user_breakfast_recs(user_id):
     """List all breakfasts currently in the database"""
+    form = RecommendationForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
+    store = UserRecommendationStore()
+    if store.enabled and form.plain_scores:
+        recommendations = store.get(user_id, limit=form.limit.data, min_score=form.min_score.data)
+        if recommendations is None:
+            return "Does not exist", 404
+        return jsonify({'breakfast_recs': recommendations})
+
     user = User.query.options(joinedload('preferences')).with_hint(User, "WITH (NOLOCK)").filter_by(id=user_id).one()
     if not user:
         return "Does not exist", 404
-    return jsonify({'breakfast_recs': user.get_recommendations()})
+    recommendations = user.get_recommendations(**form.scoring_options)
+    return jsonify({'breakfast_recs': recommendations})
 
 
 @oop_orm.route('/user/<int:user_id>', methods=["PUT"])
@@ -153,6 +220,7 @@ def create_user_preferences(user_id):
             # Attempted to create a duplicate user/ingredient relationship
             return responses.invalid_request()
         else:
+            _update_recommendations(user.id, {new_user_preference.ingredient_id: new_user_preference.coefficient})
             return jsonify(new_user_preference.to_dict()), 201
     return responses.invalid_request()
 
@@ -175,9 +243,11 @@ def update_user_preference(user_id, ingredient_id):
     if user_preference:
         form = UserPreferenceUpdateForm.from_json(request.get_json(force=True), user_preference)
         if form.validate():
+            old_coefficient = user_preference.coefficient
             form.populate_obj(user_preference)
             db.session.add(user_preference)
             db.session.commit()
+            _update_recommendations(user_id, {ingredient_id: user_preference.coefficient - old_coefficient})
             return jsonify(user_preference.to_dict())
         else:
             return responses.invalid_request()
@@ -193,12 +263,27 @@ def delete_user_preference(user_id, ingredient_id):
     if not user_preference:
         return "Does not exist", 404
 
+    coefficient = user_preference.coefficient
     db.session.delete(user_preference)
     db.session.commit()
+    _update_recommendations(user_id, {ingredient_id: -coefficient})
     return responses.object_deleted()
 
 
+def _update_recommendations(user_id, changes):
+    """Update a user's stored recommendations after their preference coefficients changed by the given amounts"""
+    recommendation_cache.invalidate('oop_orm', user_id)
+    store = UserRecommendationStore()
+    if store.enabled:
+        store.apply_preference_changes(user_id, changes)
+
+
 # Add healthcheck endpoints
 oop_orm.add_url_rule('/healthcheck', view_func=healthcheck_views.healthcheck)
 oop_orm.add_url_rule('/healthcheck/up', view_func=healthcheck_views.healthcheck_up)
 oop_orm.add_url_rule('/healthcheck/down', view_func=healthcheck_views.healthcheck_down)
+
+# Add admin endpoints
+oop_orm.add_url_rule('/admin/reference_data/reload', view_func=admin_views.reload_reference_data, methods=["POST"])
+oop_orm.add_url_rule('/admin/query_cache', view_func=admin_views.query_cache_stats)
+oop_orm.add_url_rule('/admin/invalidation_bus', view_func=admin_views.invalidation_bus_stats)
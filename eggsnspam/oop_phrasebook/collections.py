@@ -1,4 +1,8 @@
-from .daos import BreakfastDao, IngredientDao, UserDao, UserPreferenceDao
+from eggsnspam.common.catalog import catalog_cache
+from eggsnspam.common.recommendations import score_breakfasts_many
+from eggsnspam.common.reference_data import reference_data_cache
+
+from .daos import BreakfastDao, BreakfastIngredientDao, IngredientDao, UserDao, UserPreferenceDao
 from .models import BreakfastModel, IngredientModel, UserModel, UserPreferenceModel
 
 
@@ -30,8 +34,19 @@ class BreakfastCollection(BaseCollection):
     MODEL = BreakfastModel
 
     def load_all(self):
-        """Load all the records from the database"""
-        self.populate(self.dao.list_all())
+        """Load all the records, from the reference data snapshot if it is enabled"""
+        if reference_data_cache.enabled:
+            self.populate(reference_data_cache.get().get_breakfasts())
+        else:
+            self.populate(self.dao.list_all())
+        return True
+
+    def load_by_ids(self, ids):
+        """Load the records for a list of IDs, from the reference data snapshot if it is enabled"""
+        if reference_data_cache.enabled:
+            self.populate(reference_data_cache.get().get_breakfasts(ids))
+        else:
+            self.populate(self.dao.get_by_ids(ids))
         return True
 
 
@@ -41,8 +56,19 @@ class IngredientCollection(BaseCollection):
     MODEL = IngredientModel
 
     def load_all(self):
-        """Load all the records from the database"""
-        self.populate(self.dao.list_all())
+        """Load all the records, from the reference data snapshot if it is enabled"""
+        if reference_data_cache.enabled:
+            self.populate(reference_data_cache.get().get_ingredients())
+        else:
+            self.populate(self.dao.list_all())
+        return True
+
+    def load_by_ids(self, ids):
+        """Load the records for a list of IDs, from the reference data snapshot if it is enabled"""
+        if reference_data_cache.enabled:
+            self.populate(reference_data_cache.get().get_ingredients(ids))
+        else:
+            self.populate(self.dao.get_by_ids(ids))
         return True
 
 
@@ -56,6 +82,38 @@ class UserCollection(BaseCollection):
         self.populate(self.dao.list_all())
         return True
 
+    def load_by_ids(self, ids):
+        """Load the records for a list of IDs"""
+        self.populate(self.dao.get_by_ids(ids))
+        return True
+
+    def load_by_ids_with_preferences(self, ids):
+        """Load the records for a list of IDs, along with each user's ingredient preferences"""
+        self.populate(self.dao.get_by_ids_join_preferences(ids))
+        return True
+
+    def get_recommendations(self, breakfast_ingredient_dao=None, **options):
+        """Get every loaded user's best matching breakfasts, scoring all of them together.
+
+        options are passed on to score_breakfasts_many(). Returns a list with the recommendations for each model, in
+        the same order as self.models.
+        """
+        if breakfast_ingredient_dao is None:
+            breakfast_ingredient_dao = BreakfastIngredientDao()
+
+        if any(user.preferences is None for user in self.models):
+            raise ValueError("No preferences loaded")
+
+        # Like UserModel.get_recommendations, users with no preferences get no recommendations
+        preferences_list = [user.preferences for user in self.models if user.preferences]
+        if not preferences_list:
+            return [[] for user in self.models]
+
+        catalog = catalog_cache.get(breakfast_ingredient_dao.list_all_columns)
+        scored = iter(score_breakfasts_many(catalog, preferences_list, **options))
+
+        return [next(scored) if user.preferences else [] for user in self.models]
+
 
 class UserPreferenceCollection(BaseCollection):
 
@@ -1,6 +1,7 @@
+import numpy as np
 from sqlalchemy.sql.expression import text
 
-from eggsnspam.common.daos import SqlBaseDao
+from eggsnspam.common.daos import SqlBaseDao, statement
 
 from ..extensions import db
 
@@ -9,51 +10,72 @@ class BreakfastDao(SqlBaseDao):
 
     def get_by_id(self, id):
         """Retrieve a record from the database by ID"""
-        query = text("""
+        query = statement("""
         SELECT id, name FROM tblBreakfast
         WHERE id=:id;
         """)
         return self.fetchone(query, id=id)
 
+    def get_by_ids(self, ids):
+        """Retrieve the records for a list of IDs, in the order of ids. IDs with no record are left out."""
+        return self.fetch_by_ids("""
+        SELECT id, name FROM tblBreakfast
+        WHERE id IN ({});
+        """, ids)
+
     def list_all(self):
-        """Get all records from the database"""
-        query = text("""
+        """Iterate over all records in the database"""
+        query = statement("""
         SELECT id, name FROM tblBreakfast;
         """)
-        return self.fetchall(query)
+        return self.iterate(query)
 
 
 class IngredientDao(SqlBaseDao):
 
     def get_by_id(self, id):
         """Retrieve a record from the database by ID"""
-        query = text("""
+        query = statement("""
         SELECT id, name FROM tblIngredient
         WHERE id=:id;
         """)
         return self.fetchone(query, id=id)
 
+    def get_by_ids(self, ids):
+        """Retrieve the records for a list of IDs, in the order of ids. IDs with no record are left out."""
+        return self.fetch_by_ids("""
+        SELECT id, name FROM tblIngredient
+        WHERE id IN ({});
+        """, ids)
+
     def list_all(self):
-        """Get all records from the database"""
-        query = text("""
+        """Iterate over all records in the database"""
+        query = statement("""
         SELECT id, name FROM tblIngredient;
         """)
-        return self.fetchall(query)
+        return self.iterate(query)
 
 
 class UserDao(SqlBaseDao):
 
     def get_by_id(self, id):
         """Retrieve a record from the database by ID"""
-        query = text("""
+        query = statement("""
         SELECT id, first_name, last_name FROM tblUser
         WHERE id=:id;
         """)
         return self.fetchone(query, id=id)
 
+    def get_by_ids(self, ids):
+        """Retrieve the records for a list of IDs, in the order of ids. IDs with no record are left out."""
+        return self.fetch_by_ids("""
+        SELECT id, first_name, last_name FROM tblUser
+        WHERE id IN ({});
+        """, ids)
+
     def get_by_id_join_preferences(self, id):
         """Retrieve a record from the database by ID"""
-        query = text("""
+        query = statement("""
         SELECT
             tblUser.id as id,
             tblUser.first_name as first_name,
@@ -80,9 +102,62 @@ class UserDao(SqlBaseDao):
             'preferences': preferences
         }
 
+    def get_by_ids_join_preferences(self, ids):
+        """Retrieve the records for a list of IDs, each with its preferences like get_by_id_join_preferences.
+
+        Records are returned in the order of ids. IDs with no record are left out.
+        """
+        users = {}
+        for chunk in self.chunks(ids):
+            placeholders, params = self.bind_list('id', chunk)
+            query = text("""
+            SELECT
+                tblUser.id as id,
+                tblUser.first_name as first_name,
+                tblUser.last_name as last_name,
+                tblUserPreference.ingredient_id as ingredient_id,
+                tblUserPreference.coefficient as coefficient
+            FROM tblUser
+            LEFT OUTER JOIN tblUserPreference ON tblUser.id = tblUserPreference.user_id
+            WHERE tblUser.id IN ({});
+            """.format(placeholders))
+
+            for r in self.iterate(query, **params):
+                user = users.setdefault(r['id'], {
+                    'id': r['id'],
+                    'first_name': r['first_name'],
+                    'last_name': r['last_name'],
+                    'preferences': {}
+                })
+                if r['ingredient_id'] is not None:
+                    user['preferences'][r['ingredient_id']] = r['coefficient']
+
+        # Only return each user once, even if their ID was asked for more than once
+        return [users.pop(id) for id in ids if id in users]
+
+    def get_id_range(self):
+        """Get the lowest and highest user IDs as a tuple, or None if there are no users"""
+        query = statement("""
+        SELECT MIN(id) as min_id, MAX(id) as max_id FROM tblUser;
+        """)
+        result = self.fetchone(query)
+        if result is None or result['min_id'] is None:
+            return None
+        return result['min_id'], result['max_id']
+
+    def list_ids_between(self, start_id, end_id, limit):
+        """List up to limit user IDs from start_id to end_id inclusive, in ascending order"""
+        query = statement("""
+        SELECT id FROM tblUser
+        WHERE id >= :start_id AND id <= :end_id
+        ORDER BY id
+        LIMIT :limit;
+        """)
+        return [r['id'] for r in self.fetchall(query, start_id=start_id, end_id=end_id, limit=limit)]
+
     def create(self, first_name, last_name):
         """Create a new record in the database"""
-        query = text("""
+        query = statement("""
         INSERT INTO tblUser
             (first_name, last_name)
         VALUES
@@ -94,7 +169,7 @@ class UserDao(SqlBaseDao):
 
     def update(self, id, first_name, last_name):
         """Update a record in the database with new values"""
-        query = text("""
+        query = statement("""
         UPDATE tblUser SET
             first_name=:first_name,
             last_name=:last_name
@@ -110,25 +185,25 @@ class UserDao(SqlBaseDao):
 
     def delete(self, id):
         """Delete a record from the database for an ID"""
-        query = text("""
+        query = statement("""
         DELETE FROM tblUser WHERE id=:id
         """)
         result = self.execute(query, id=id)
         return result.rowcount > 0
 
     def list_all(self):
-        """Get all records from the database"""
-        query = text("""
+        """Iterate over all records in the database"""
+        query = statement("""
         SELECT id, first_name, last_name FROM tblUser;
         """)
-        return self.fetchall(query)
+        return self.iterate(query)
 
 
 class UserPreferenceDao(SqlBaseDao):
 
     def get_by_id(self, id):
         """Retrieve a record from the database by ID"""
-        query = text("""
+        query = statement("""
         SELECT id, user_id, ingredient_id, coefficient FROM tblUserPreference
         WHERE id=:id;
         """)
@@ -136,7 +211,7 @@ class UserPreferenceDao(SqlBaseDao):
 
     def get_by_user_ingredient(self, user_id, ingredient_id):
         """Retrieve a record from the database by ID"""
-        query = text("""
+        query = statement("""
         SELECT id, user_id, ingredient_id, coefficient FROM tblUserPreference
         WHERE user_id=:user_id AND ingredient_id=:ingredient_id;
         """)
@@ -144,7 +219,7 @@ class UserPreferenceDao(SqlBaseDao):
 
     def create(self, user_id, ingredient_id, coefficient):
         """Create a new record in the database"""
-        query = text("""
+        query = statement("""
         INSERT INTO tblUserPreference
             (user_id, ingredient_id, coefficient)
         VALUES
@@ -159,7 +234,7 @@ class UserPreferenceDao(SqlBaseDao):
 
     def update(self, id, user_id, ingredient_id, coefficient):
         """Update a record in the database with new values"""
-        query = text("""
+        query = statement("""
         UPDATE tblUserPreference SET
             user_id=:user_id,
             ingredient_id=:ingredient_id,
@@ -177,15 +252,15 @@ class UserPreferenceDao(SqlBaseDao):
 
     def delete(self, id):
         """Delete a record from the database for an ID"""
-        query = text("""
+        query = statement("""
         DELETE FROM tblUserPreference WHERE id=:id
         """)
         result = self.execute(query, id=id)
         return result.rowcount > 0
 
     def list_all_for_user(self, user_id):
-        """Get all records from the database"""
-        query = text("""
+        """List all of a user's records in the database"""
+        query = statement("""
         SELECT id, user_id, ingredient_id, coefficient FROM tblUserPreference
         WHERE user_id=:user_id;
         """)
@@ -194,11 +269,23 @@ class UserPreferenceDao(SqlBaseDao):
 
 class BreakfastIngredientDao(SqlBaseDao):
 
+    # The whole table is read to build the catalog, so skip building a dict for every row
+    ROW_FORMAT = 'record'
+
     def list_all(self):
-        """Get all ingredients for all breakfasts"""
+        """Iterate over all ingredients for all breakfasts"""
+
+        query = statement("""
+        SELECT breakfast_id, ingredient_id, coefficient FROM tblBreakfastIngredient;
+        """)
+
+        return self.iterate(query)
+
+    def list_all_columns(self):
+        """Get all ingredients for all breakfasts as arrays of breakfast IDs, ingredient IDs and coefficients"""
 
-        query = text("""
+        query = statement("""
         SELECT breakfast_id, ingredient_id, coefficient FROM tblBreakfastIngredient;
         """)
 
-        return self.fetchall(query)
+        return self.fetch_columns(query, (np.int64, np.int64, np.float64))
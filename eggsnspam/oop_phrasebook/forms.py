@@ -16,3 +16,12 @@ class UserPreferenceForm(Form):
     user_id = fields.IntegerField(u'User ID', [validators.required()])
     ingredient_id = fields.IntegerField(u'Ingredient ID', [validators.required()])
     coefficient = fields.FloatField(u'Coefficient', [validators.required()])
+
+
+class BatchRecommendationForm(Form):
+    """Form for requesting breakfast recommendations for many users at once."""
+
+    MAX_USERS = 1000
+
+    user_ids = fields.FieldList(fields.IntegerField(u'User ID', [validators.required()]),
+                                validators=[validators.Length(min=1, max=MAX_USERS)])
@@ -1,4 +1,8 @@
-from eggsnspam.common.recommendations import dot_product
+from eggsnspam.common.catalog import catalog_cache
+from eggsnspam.common.recommendation_cache import recommendation_cache
+from eggsnspam.common.recommendation_store import BaseRecommendationStore
+from eggsnspam.common.recommendations import score_breakfasts, score_breakfasts_many
+from eggsnspam.common.reference_data import reference_data_cache
 
 from .daos import BreakfastDao, IngredientDao, UserDao, UserPreferenceDao, BreakfastIngredientDao
 
@@ -36,8 +40,11 @@ class BreakfastModel(BaseModel):
     name = None
 
     def load_by_id(self, id):
-        """Load a model instance by ID"""
-        dao_results = self.dao.get_by_id(id)
+        """Load a model instance by ID, from the reference data snapshot if it is enabled"""
+        if reference_data_cache.enabled:
+            dao_results = reference_data_cache.get().breakfasts.get(id)
+        else:
+            dao_results = self.dao.get_by_id(id)
 
         if not dao_results:
             raise ValueError("No Breakfast with ID:{} found".format(id))
@@ -65,8 +72,11 @@ class IngredientModel(BaseModel):
     name = None
 
     def load_by_id(self, id):
-        """Load a model instance by ID"""
-        dao_results = self.dao.get_by_id(id)
+        """Load a model instance by ID, from the reference data snapshot if it is enabled"""
+        if reference_data_cache.enabled:
+            dao_results = reference_data_cache.get().ingredients.get(id)
+        else:
+            dao_results = self.dao.get_by_id(id)
 
         if not dao_results:
             raise ValueError("No Ingredient with ID:{} found".format(id))
@@ -159,16 +169,21 @@ class UserModel(BaseModel):
         if not self.id:
             return False
         if self.dao.delete(self.id):
+            recommendation_cache.invalidate('oop_phrasebook', self.id)
+            store = UserRecommendationStore()
+            if store.enabled:
+                store.delete(self.id)
             self.id = None
             return True
         else:
             return False
 
-    def get_recommendations(self, breakfast_ingredient_dao=None):
-        breakfasts = {}
-        breakfast_scores = {}
-        results = []
+    def get_recommendations(self, breakfast_ingredient_dao=None, **options):
+        """Get the user's best matching breakfasts.
 
+        options are passed on to score_breakfasts(), e.g. limit and min_score to only get the top `limit` breakfasts
+        scoring at least `min_score`.
+        """
         if breakfast_ingredient_dao is None:
             breakfast_ingredient_dao = BreakfastIngredientDao()
 
@@ -180,23 +195,13 @@ class UserModel(BaseModel):
             return []
 
         # Get all breakfasts and their ingredients
-        for bi in breakfast_ingredient_dao.list_all():
-            breakfasts.setdefault(bi['breakfast_id'], {})
-            breakfasts[bi['breakfast_id']][bi['ingredient_id']] = bi['coefficient']
-
-        # Use dot product to score similarity of breakfast ingredients and user's preferences
-        for breakfast, ingredients in breakfasts.items():
-            breakfast_scores[breakfast] = dot_product(ingredients, self.preferences)
+        catalog = catalog_cache.get(breakfast_ingredient_dao.list_all_columns)
 
-        # build the results object
-        for breakfast in breakfasts:
-            results.append({
-                'breakfast_id': breakfast,
-                'score': breakfast_scores[breakfast],
-            })
-
-        # sort the results by the dot product result
-        return sorted(results, reverse=True, key=lambda k: k['score'])
+        # Score the similarity of every breakfast's ingredients to the user's preferences, best match first, unless
+        # the results for the same preferences and catalog are cached
+        return recommendation_cache.get_or_score(
+            'oop_phrasebook', self.id, self.preferences, catalog, options,
+            lambda: score_breakfasts(catalog, self.preferences, **options))
 
 
 class UserPreferenceModel(BaseModel):
@@ -208,12 +213,22 @@ class UserPreferenceModel(BaseModel):
     ingredient_id = None
     coefficient = None
 
+    # The user, ingredient and coefficient as last loaded or saved, so stored recommendations can be updated by the
+    # change
+    _saved_user_id = None
+    _saved_ingredient_id = None
+    _saved_coefficient = None
+
     def delete(self):
         """Delete the model instance from the database"""
         if not self.id:
             return False
         if self.dao.delete(self.id):
             self.id = None
+            self._saved_user_id = self._saved_ingredient_id = self._saved_coefficient = None
+            # This may have been the user's last preference, and users without preferences get no recommendations,
+            # so the user is rescored in full rather than updated by the change
+            self._refresh_recommendations()
             return True
         else:
             return False
@@ -226,6 +241,7 @@ class UserPreferenceModel(BaseModel):
             raise ValueError("No UserPreference with ID:{} found".format(id))
 
         self.populate(dao_results)
+        self._remember_saved()
 
     def load_by_user_ingredient(self, user_id, ingredient_id):
         dao_results = self.dao.get_by_user_ingredient(user_id, ingredient_id)
@@ -235,6 +251,7 @@ class UserPreferenceModel(BaseModel):
                 user_id, ingredient_id))
 
         self.populate(dao_results)
+        self._remember_saved()
 
     def populate(self, data):
         """Populate the user model properties from a map of values"""
@@ -261,8 +278,48 @@ class UserPreferenceModel(BaseModel):
                                          ingredient_id=self.ingredient_id,
                                          coefficient=self.coefficient)
 
+        if is_success:
+            self._update_recommendations()
+            self._remember_saved()
+
         return is_success
 
+    def _remember_saved(self):
+        self._saved_user_id = self.user_id
+        self._saved_ingredient_id = self.ingredient_id
+        self._saved_coefficient = self.coefficient
+
+    def _coefficient_changes(self):
+        """Map each ingredient whose coefficient changed since the preference was last loaded or saved to the change"""
+        changes = {}
+        if self._saved_ingredient_id is not None:
+            changes[self._saved_ingredient_id] = -self._saved_coefficient
+        changes[self.ingredient_id] = changes.get(self.ingredient_id, 0) + self.coefficient
+        return changes
+
+    def _update_recommendations(self):
+        """Update the user's stored recommendations by the change in this preference"""
+        if self._saved_user_id is not None and self._saved_user_id != self.user_id:
+            # The preference moved to another user. It may have been the old user's last preference, or the new user
+            # may already have one for the ingredient, so both users are rescored in full
+            self._refresh_recommendations(self._saved_user_id)
+            self._refresh_recommendations()
+            return
+
+        recommendation_cache.invalidate('oop_phrasebook', self.user_id)
+        store = UserRecommendationStore()
+        if store.enabled:
+            store.apply_preference_changes(self.user_id, self._coefficient_changes())
+
+    def _refresh_recommendations(self, user_id=None):
+        """Rescore the user's, or another user's, stored recommendations after their preferences have changed"""
+        if user_id is None:
+            user_id = self.user_id
+        recommendation_cache.invalidate('oop_phrasebook', user_id)
+        store = UserRecommendationStore()
+        if store.enabled:
+            store.refresh(user_id)
+
     def to_dict(self):
         """Convert the model instance to a python dict."""
         return {
@@ -279,3 +336,30 @@ class UserPreferenceModel(BaseModel):
                     _validate_int(self.ingredient_id),
                     _validate_float(self.coefficient),
                     (0 <= self.coefficient <= 1)])
+
+
+class UserRecommendationStore(BaseRecommendationStore):
+    """Stores the recommendations UserModel.get_recommendations gives for each user."""
+
+    def __init__(self, dao=None, user_dao=None, breakfast_ingredient_dao=None):
+        super(UserRecommendationStore, self).__init__('oop_phrasebook', dao=dao)
+        self.user_dao = user_dao or UserDao()
+        self.breakfast_ingredient_dao = breakfast_ingredient_dao or BreakfastIngredientDao()
+
+    def load_catalog(self):
+        return catalog_cache.get(self.breakfast_ingredient_dao.list_all_columns)
+
+    def list_user_ids(self):
+        return [user['id'] for user in self.user_dao.list_all()]
+
+    def recommend_many(self, user_ids):
+        users = self.user_dao.get_by_ids_join_preferences(user_ids)
+
+        # Like UserModel.get_recommendations, users with no preferences get no recommendations
+        recommendations = {user['id']: [] for user in users}
+        users = [user for user in users if user['preferences']]
+        if users:
+            scored = score_breakfasts_many(self.load_catalog(), [user['preferences'] for user in users])
+            recommendations.update(zip([user['id'] for user in users], scored))
+
+        return recommendations
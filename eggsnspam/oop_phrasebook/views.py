@@ -1,11 +1,14 @@
 from flask import Blueprint, jsonify, request
 
 from .collections import BreakfastCollection, IngredientCollection, UserCollection, UserPreferenceCollection
-from .forms import UserForm, UserPreferenceForm
-from .models import BreakfastModel, IngredientModel, UserModel, UserPreferenceModel
+from .forms import BatchRecommendationForm, UserForm, UserPreferenceForm
+from .models import BreakfastModel, IngredientModel, UserModel, UserPreferenceModel, UserRecommendationStore
 
+from eggsnspam.common import admin_views
 from eggsnspam.common import healthcheck_views
 from eggsnspam.common import responses
+from eggsnspam.common.forms import IdListForm, RecommendationForm
+from eggsnspam.extensions import db
 
 
 oop_phrasebook = Blueprint('oop_phrasebook', __name__, url_prefix='/oop_phrasebook')
@@ -13,9 +16,16 @@ oop_phrasebook = Blueprint('oop_phrasebook', __name__, url_prefix='/oop_phrasebo
 
 @oop_phrasebook.route('/breakfast/', methods=["GET"])
 def list_breakfast():
-    """List all breakfasts currently in the database"""
+    """List all breakfasts currently in the database, or only the ones with the IDs given as ?ids=1,2,3"""
+    form = IdListForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
     breakfasts = BreakfastCollection()
-    breakfasts.load_all()
+    if form.ids.data:
+        breakfasts.load_by_ids(form.ids.data)
+    else:
+        breakfasts.load_all()
     return jsonify(breakfasts=[x.to_dict() for x in breakfasts.models])
 
 
@@ -34,9 +44,16 @@ def get_breakfast(breakfast_id):
 
 @oop_phrasebook.route('/ingredient/', methods=["GET"])
 def list_ingredient():
-    """List all ingredients currently in the database"""
+    """List all ingredients currently in the database, or only the ones with the IDs given as ?ids=1,2,3"""
+    form = IdListForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
     ingredients = IngredientCollection()
-    ingredients.load_all()
+    if form.ids.data:
+        ingredients.load_by_ids(form.ids.data)
+    else:
+        ingredients.load_all()
     return jsonify(ingredients=[x.to_dict() for x in ingredients.models])
 
 
@@ -55,9 +72,16 @@ def get_ingredient(ingredient_id):
 
 @oop_phrasebook.route('/user/', methods=["GET"])
 def list_user():
-    """List all users currently in the database"""
+    """List all users currently in the database, or only the ones with the IDs given as ?ids=1,2,3"""
+    form = IdListForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
     users = UserCollection()
-    users.load_all()
+    if form.ids.data:
+        users.load_by_ids(form.ids.data)
+    else:
+        users.load_all()
     return jsonify(users=[x.to_dict() for x in users.models])
 
 
@@ -87,6 +111,7 @@ def delete_user(user_id):
         return "Does not exist", 404
 
     if user.delete():
+        db.session.commit()
         return responses.object_deleted()
     else:
         return responses.server_error()
@@ -108,13 +133,41 @@ def get_user(user_id):
 @oop_phrasebook.route('/user/<int:user_id>/breakfast_recommendations', methods=["GET"])
 def get_user_breakfast_recs(user_id):
     """List all breakfasts currently in the database"""
+    form = RecommendationForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
+    store = UserRecommendationStore()
+    if store.enabled and form.plain_scores:
+        recommendations = store.get(user_id, limit=form.limit.data, min_score=form.min_score.data)
+        if recommendations is None:
+            return "Does not exist", 404
+        return jsonify({'breakfast_recs': recommendations})
+
     user = UserModel()
     try:
         user.load_by_id_with_preferences(user_id)
     except ValueError:
         return "Does not exist", 404
 
-    return jsonify({'breakfast_recs': user.get_recommendations()})
+    recommendations = user.get_recommendations(**form.scoring_options)
+    return jsonify({'breakfast_recs': recommendations})
+
+
+@oop_phrasebook.route('/user/breakfast_recommendations', methods=["POST"])
+def get_batch_breakfast_recs():
+    """Get breakfast recommendations for a list of users, scoring them all in one pass"""
+    options = RecommendationForm(request.args)
+    form = BatchRecommendationForm.from_json(request.get_json(force=True))
+    if not options.validate() or not form.validate():
+        return responses.invalid_request()
+
+    users = UserCollection()
+    users.load_by_ids_with_preferences(form.user_ids.data)
+    recommendations = users.get_recommendations(**options.scoring_options)
+
+    return jsonify({'user_breakfast_recs': [{'user_id': user.id, 'breakfast_recs': recs}
+                                            for user, recs in zip(users.models, recommendations)]})
 
 
 @oop_phrasebook.route('/user/<int:user_id>', methods=["PUT"])
@@ -217,6 +270,7 @@ def delete_user_preference(user_id, ingredient_id):
         return "Does not exist", 404
 
     if pref.delete():
+        db.session.commit()
         return responses.object_deleted()
     else:
         return responses.server_error()
@@ -225,3 +279,9 @@ def delete_user_preference(user_id, ingredient_id):
 oop_phrasebook.add_url_rule('/healthcheck', view_func=healthcheck_views.healthcheck)
 oop_phrasebook.add_url_rule('/healthcheck/up', view_func=healthcheck_views.healthcheck_up)
 oop_phrasebook.add_url_rule('/healthcheck/down', view_func=healthcheck_views.healthcheck_down)
+
+# Add admin endpoints
+oop_phrasebook.add_url_rule('/admin/reference_data/reload', view_func=admin_views.reload_reference_data,
+                            methods=["POST"])
+oop_phrasebook.add_url_rule('/admin/query_cache', view_func=admin_views.query_cache_stats)
+oop_phrasebook.add_url_rule('/admin/invalidation_bus', view_func=admin_views.invalidation_bus_stats)
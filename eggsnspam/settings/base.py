@@ -8,3 +8,64 @@ class BaseConfig(object):
 
     # This needs to be unique for each Flask app, and is used to coordinate deployments
     HEALTHCHECK_STATUS_FILE = "/tmp/eggsnspam_down"
+
+    # Seconds a worker keeps the breakfast ingredient catalog in memory before rescanning it. None keeps it until
+    # it is invalidated.
+    CATALOG_CACHE_TTL = 300
+
+    # How each worker stores the catalog's coefficients: 'float64', 'float32' or 'uint8' (8-bit quantized). The
+    # smaller types save memory but make scores slightly less precise; see BreakfastCatalog for the error bounds.
+    CATALOG_COEFFICIENT_STORAGE = 'float64'
+
+    # Directory to save the catalog in as a memory-mapped snapshot shared by every worker process. None keeps a
+    # separate copy in each worker.
+    CATALOG_SNAPSHOT_DIR = None
+
+    # Serve recommendations from tblUserRecommendation, rescoring users only when their preferences or the catalog
+    # change. Run `python -m eggsnspam.commands rebuild_recommendations` after changing the catalog.
+    RECOMMENDATION_STORE_ENABLED = False
+
+    # Where the simple_phrasebook example scores recommendations: 'python' scores the cached catalog with NumPy,
+    # 'sql' sums the products in the database and only reads back one row per breakfast
+    RECOMMENDATION_SCORING_MODE = 'python'
+
+    # How breakfasts are scored when a request doesn't ask for a strategy: 'dot_product' sums the products of the
+    # user's and breakfast's coefficients, and 'cosine' divides that by the length of both, so breakfasts with many
+    # ingredients aren't favored. Stored recommendations and the 'sql' scoring mode only support 'dot_product'; other
+    # strategies are always scored from the catalog.
+    RECOMMENDATION_SCORING_STRATEGY = 'dot_product'
+
+    # Where the recommendation and query caches keep their entries: 'local' keeps them in memory in each worker, and
+    # 'sqlite' keeps them in the SQLite file at CACHE_SQLITE_PATH, which every worker on the host shares
+    CACHE_BACKEND = 'local'
+    CACHE_SQLITE_PATH = '/tmp/eggsnspam_cache.db'
+
+    # Keep each user's computed recommendations in the CACHE_BACKEND, until their preferences or the catalog change.
+    # RECOMMENDATION_CACHE_SIZE is the most users to keep per cache and RECOMMENDATION_CACHE_TTL the most seconds to
+    # keep them for (None for no limit).
+    RECOMMENDATION_CACHE_ENABLED = False
+    RECOMMENDATION_CACHE_SIZE = 10000
+    RECOMMENDATION_CACHE_TTL = 300
+
+    # Serve the breakfast and ingredient endpoints from a snapshot of tblBreakfast and tblIngredient kept in memory
+    # in each worker. Every REFERENCE_DATA_REFRESH_INTERVAL seconds (None for never) a background thread rereads the
+    # tables and swaps in a new snapshot if they changed; POST to /<example>/admin/reference_data/reload to reload
+    # a worker's snapshot straight away.
+    REFERENCE_DATA_SNAPSHOT_ENABLED = False
+    REFERENCE_DATA_REFRESH_INTERVAL = 60
+
+    # Keep the results of the phrasebook DAOs' reads in the CACHE_BACKEND, until a DAO writes to a table they were
+    # read from: in the same worker with 'local', or in any worker on the host with 'sqlite'. QUERY_CACHE_SIZE is the
+    # most results to keep per cache and QUERY_CACHE_TTL the most seconds to keep them for (None for no limit), which
+    # bounds how long writes made elsewhere go unseen.
+    QUERY_CACHE_ENABLED = False
+    QUERY_CACHE_SIZE = 10000
+    QUERY_CACHE_TTL = 60
+
+    # Tell every worker on the host when another worker invalidates the catalog, the reference data snapshot, or an
+    # entry in a 'local' recommendation or query cache, by appending to the file at INVALIDATION_BUS_PATH. Workers
+    # check the file before each request. It is replaced with an empty file once it reaches INVALIDATION_BUS_MAX_SIZE
+    # bytes, which makes every worker drop everything it has cached.
+    INVALIDATION_BUS_ENABLED = False
+    INVALIDATION_BUS_PATH = '/tmp/eggsnspam_invalidations.log'
+    INVALIDATION_BUS_MAX_SIZE = 1024 * 1024
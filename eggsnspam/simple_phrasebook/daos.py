@@ -1,25 +1,72 @@
-from sqlalchemy.sql.expression import text
+import numpy as np
 
-from eggsnspam.common.daos import SqlBaseDao
+from eggsnspam.common.daos import SqlBaseDao, statement
 
 
 class BreakfastRecsDao(SqlBaseDao):
 
+    # The whole breakfast ingredient table is read to build the catalog, so skip building a dict for every row
+    ROW_FORMAT = 'record'
+
     def get_ingredient_preferences(self, user_id):
-        """Get a person's prefernces for each breakfast attribute"""
+        """Iterate over a person's prefernces for each breakfast attribute"""
 
-        query = text("""
+        query = statement("""
         SELECT ingredient_id, coefficient FROM tblUserPreference
         WHERE user_id=:user_id;
         """)
 
-        return self.fetchmany(query, user_id=user_id)
+        return self.iterate(query, user_id=user_id)
 
     def get_all_breakfast_ingredients(self):
-        """Get all ingredients for all breakfasts"""
+        """Iterate over all ingredients for all breakfasts"""
+
+        query = statement("""
+        SELECT breakfast_id, ingredient_id, coefficient FROM tblBreakfastIngredient;
+        """)
+
+        return self.iterate(query)
 
-        query = text("""
+    def get_all_breakfast_ingredient_columns(self):
+        """Get all ingredients for all breakfasts as arrays of breakfast IDs, ingredient IDs and coefficients"""
+
+        query = statement("""
         SELECT breakfast_id, ingredient_id, coefficient FROM tblBreakfastIngredient;
         """)
 
-        return self.fetchall(query)
+        return self.fetch_columns(query, (np.int64, np.int64, np.float64))
+
+    def get_breakfast_scores(self, user_id, limit=None, min_score=None):
+        """Score every breakfast against a user's preferences in the database, best match first.
+
+        Each breakfast's score is the sum of its ingredient coefficients times the user's coefficients for the same
+        ingredients, so only one aggregated row per breakfast is returned. Breakfasts sharing no ingredients with the
+        user score 0. Ties are broken by breakfast ID, like score_breakfasts(). Assumes a breakfast or user lists each
+        ingredient once.
+        """
+        score = 'COALESCE(SUM(tblBreakfastIngredient.coefficient * tblUserPreference.coefficient), 0.0)'
+        params = {'user_id': user_id}
+        having_clause = ''
+        limit_clause = ''
+        if min_score is not None:
+            having_clause = 'HAVING {} >= :min_score'.format(score)
+            params['min_score'] = min_score
+        if limit is not None:
+            limit_clause = 'LIMIT :limit'
+            params['limit'] = limit
+
+        query = statement("""
+        SELECT
+            tblBreakfastIngredient.breakfast_id as breakfast_id,
+            {score} as score
+        FROM tblBreakfastIngredient
+        LEFT OUTER JOIN tblUserPreference ON
+            tblUserPreference.ingredient_id = tblBreakfastIngredient.ingredient_id
+            AND tblUserPreference.user_id = :user_id
+        GROUP BY tblBreakfastIngredient.breakfast_id
+        {having_clause}
+        ORDER BY score DESC, tblBreakfastIngredient.breakfast_id
+        {limit_clause};
+        """.format(score=score, having_clause=having_clause, limit_clause=limit_clause))
+
+        return [row.to_dict() for row in self.fetchall(query, **params)]
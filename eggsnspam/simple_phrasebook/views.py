@@ -1,7 +1,10 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify, request
 from .daos import BreakfastRecsDao
 
-from eggsnspam.common.recommendations import dot_product
+from eggsnspam.common import responses
+from eggsnspam.common.catalog import catalog_cache
+from eggsnspam.common.forms import RecommendationForm
+from eggsnspam.common.recommendations import score_breakfasts
 
 simple_phrasebook = Blueprint('simple_phrasebook', __name__, url_prefix='/simple_phrasebook')
 
@@ -9,31 +12,24 @@ simple_phrasebook = Blueprint('simple_phrasebook', __name__, url_prefix='/simple
 @simple_phrasebook.route('/user/<int:user_id>/breakfast_recommendations', methods=["GET"])
 def get_breakfast_preferences(user_id):
     """Get a person's breakfast preferences"""
+    form = RecommendationForm(request.args)
+    if not form.validate():
+        return responses.invalid_request()
+
     dao = BreakfastRecsDao()
-    breakfasts = {}
-    breakfast_scores = {}
-    results = []
+
+    if current_app.config.get('RECOMMENDATION_SCORING_MODE') == 'sql' and form.plain_scores:
+        # Let the database join the user's preferences to the breakfasts and sum the products
+        results = dao.get_breakfast_scores(user_id, limit=form.limit.data, min_score=form.min_score.data)
+        return jsonify({'breakfast_recs': results})
 
     # Get all the user's ingredient preferences
     user_prefs = {i['ingredient_id']: i['coefficient'] for i in dao.get_ingredient_preferences(user_id)}
 
     # Get all breakfasts and their ingredients
-    for ingredient in dao.get_all_breakfast_ingredients():
-        breakfasts.setdefault(ingredient['breakfast_id'], {})
-        breakfasts[ingredient['breakfast_id']][ingredient['ingredient_id']] = ingredient['coefficient']
-
-    # Use dot product to score similarity of breakfast ingredients and user's preferences
-    for breakfast, ingredients in breakfasts.items():
-        breakfast_scores[breakfast] = dot_product(ingredients, user_prefs)
-
-    # build the results object
-    for breakfast in breakfasts:
-        results.append({
-            'breakfast_id': breakfast,
-            'score': breakfast_scores[breakfast],
-        })
-
-    # sort the results by the dot product result
-    results = sorted(results, reverse=True, key=lambda k: k['score'])
+    catalog = catalog_cache.get(dao.get_all_breakfast_ingredient_columns)
+
+    # Score the similarity of every breakfast's ingredients to the user's preferences, best match first
+    results = score_breakfasts(catalog, user_prefs, **form.scoring_options)
 
     return jsonify({'breakfast_recs': results})
@@ -33,3 +33,24 @@ CREATE TABLE IF NOT EXISTS 'tblUserPreference' (
     coefficient FLOAT, 
     PRIMARY KEY (id)
 );
+
+
+CREATE TABLE IF NOT EXISTS 'tblUserRecommendation' (
+    id INTEGER NOT NULL, 
+    namespace VARCHAR(32) NOT NULL, 
+    user_id INTEGER, 
+    breakfast_id INTEGER, 
+    score FLOAT, 
+    PRIMARY KEY (id)
+);
+
+CREATE INDEX IF NOT EXISTS 'ixUserRecommendation_user_score' ON 'tblUserRecommendation' (namespace, user_id, score DESC, breakfast_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS 'ixUserRecommendation_user_breakfast' ON 'tblUserRecommendation' (namespace, user_id, breakfast_id);
+
+CREATE TABLE IF NOT EXISTS 'tblUserRecommendationVersion' (
+    namespace VARCHAR(32) NOT NULL, 
+    user_id INTEGER NOT NULL, 
+    catalog_version VARCHAR(40) NOT NULL, 
+    PRIMARY KEY (namespace, user_id)
+);
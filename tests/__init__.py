@@ -1,6 +1,10 @@
 from flask.ext.testing import TestCase
 
 from eggsnspam import create_app
+from eggsnspam.common.catalog import catalog_cache
+from eggsnspam.common.query_cache import query_cache
+from eggsnspam.common.recommendation_cache import recommendation_cache
+from eggsnspam.common.reference_data import reference_data_cache
 from eggsnspam.extensions import db
 
 
@@ -10,6 +14,13 @@ class BaseTestCase(TestCase):
         super(BaseTestCase, self).setUp()
         self.client = self.app.test_client()
 
+        # The caches live for the whole process, so don't let one test's catalog, results, reference data or queries
+        # leak into the next
+        catalog_cache.invalidate()
+        recommendation_cache.clear()
+        reference_data_cache.invalidate()
+        query_cache.clear()
+
     def create_app(self):
         app = create_app()
         app.config['TESTING'] = True
@@ -0,0 +1,52 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from . import BaseTestCase
+from benchmarks.synthetic import write_database
+
+
+class SyntheticDatabaseTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SyntheticDatabaseTestCase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'benchmark.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super(SyntheticDatabaseTestCase, self).tearDown()
+
+    def count(self, conn, query):
+        return conn.execute(query).fetchone()[0]
+
+    def test_write_database(self):
+        """It fills every table with distinct ingredients per breakfast and user"""
+        write_database(self.path, 50, 8, 3, 20, 5, seed=1)
+
+        conn = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(self.count(conn, 'SELECT COUNT(*) FROM tblBreakfast'), 50)
+            self.assertEqual(self.count(conn, 'SELECT COUNT(*) FROM tblIngredient'), 8)
+            self.assertEqual(self.count(conn, 'SELECT COUNT(*) FROM tblUser'), 20)
+            self.assertEqual(self.count(conn, 'SELECT COUNT(DISTINCT breakfast_id || "-" || ingredient_id) '
+                                              'FROM tblBreakfastIngredient'), 150)
+            self.assertEqual(self.count(conn, 'SELECT COUNT(DISTINCT user_id || "-" || ingredient_id) '
+                                              'FROM tblUserPreferences'), 100)
+            self.assertEqual(self.count(conn, 'SELECT COUNT(*) FROM tblBreakfastIngredient '
+                                              'WHERE ingredient_id NOT BETWEEN 1 AND 8'), 0)
+        finally:
+            conn.close()
+
+    def test_write_database_is_seeded(self):
+        """It generates the same data for the same seed"""
+        query = 'SELECT breakfast_id, ingredient_id, coefficient FROM tblBreakfastIngredient ORDER BY 1, 2'
+        rows = []
+        for _ in range(2):
+            write_database(self.path, 30, 1000, 10, 5, 5, seed=2)
+            conn = sqlite3.connect(self.path)
+            rows.append(conn.execute(query).fetchall())
+            conn.close()
+        self.assertEqual(rows[0], rows[1])
+        self.assertTrue(rows[0])
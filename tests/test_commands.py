@@ -0,0 +1,104 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+from flask import _app_ctx_stack
+
+from . import BaseTestCase
+from .mixins import PhrasebookFixturedTestCase
+from eggsnspam import commands
+from eggsnspam.common.catalog import catalog_cache
+from eggsnspam.common.recommendation_store import RecommendationStoreDao
+from eggsnspam.extensions import db
+from eggsnspam.oop_orm.models import User
+from eggsnspam.oop_phrasebook.models import UserModel
+
+
+class RebuildRecommendationsTestCase(PhrasebookFixturedTestCase, BaseTestCase):
+
+    def setUp(self):
+        super(RebuildRecommendationsTestCase, self).setUp()
+        # The phrasebook fixtures don't include the tables only the ORM uses
+        db.create_all()
+
+    def test_rebuild_recommendations(self):
+        """It rebuilds every implementation's stored recommendations"""
+        parsed = commands.build_parser().parse_args(['rebuild_recommendations'])
+        parsed.func(parsed)
+
+        dao = RecommendationStoreDao()
+        for user_id in (1, 2, 3, 4):
+            user = UserModel()
+            user.load_by_id_with_preferences(user_id)
+            self.assertEqual(dao.get_for_user('oop_phrasebook', user_id)[1], user.get_recommendations())
+            self.assertEqual(dao.get_for_user('oop_orm', user_id)[1], User.query.get(user_id).get_recommendations())
+
+
+class ExportRecommendationsTestCase(PhrasebookFixturedTestCase, BaseTestCase):
+
+    def setUp(self):
+        super(ExportRecommendationsTestCase, self).setUp()
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        super(ExportRecommendationsTestCase, self).tearDown()
+
+    def export(self, *args):
+        """Run the export in this process and return the shard files it wrote"""
+        argv = ['export_recommendations', self.output_dir, '--workers', '1'] + list(args)
+        parsed = commands.build_parser().parse_args(argv)
+        parsed.func(parsed)
+        return [os.path.join(self.output_dir, name) for name in sorted(os.listdir(self.output_dir))]
+
+    def get_recommendations(self, user_id, limit=None):
+        user = UserModel()
+        user.load_by_id_with_preferences(user_id)
+        return user.get_recommendations(limit=limit)
+
+    def test_init_export_worker(self):
+        """It loads the catalog in a new worker without invalidating every other worker's"""
+        with mock.patch.object(commands, 'create_app', return_value=self.app), \
+                mock.patch('eggsnspam.common.catalog.invalidation_bus') as m_bus:
+            commands._init_export_worker()
+            _app_ctx_stack.top.pop()
+        self.assertFalse(m_bus.publish.called)
+        self.assertIsNotNone(catalog_cache._catalog)
+
+    def test_split_id_range(self):
+        """It splits IDs into contiguous ranges"""
+        self.assertEqual(commands.split_id_range(1, 10, 3), [(1, 4), (5, 8), (9, 10)])
+        self.assertEqual(commands.split_id_range(1, 2, 4), [(1, 1), (2, 2)])
+        self.assertEqual(commands.split_id_range(5, 5, 1), [(5, 5)])
+
+    def test_export_jsonl(self):
+        """It writes every user's recommendations, one JSON object per line"""
+        paths = self.export('--shards', '3', '--batch-size', '1')
+        self.assertEqual(len(paths), 2)
+
+        exported = []
+        for path in paths:
+            with open(path) as f:
+                exported.extend(json.loads(line) for line in f)
+
+        self.assertEqual([e['user_id'] for e in exported], [1, 2, 3, 4])
+        for e in exported:
+            self.assertEqual(e['breakfast_recs'], self.get_recommendations(e['user_id']))
+
+    def test_export_csv(self):
+        """It writes a CSV row per recommendation"""
+        paths = self.export('--format', 'csv', '--shards', '1', '--limit', '2')
+        self.assertEqual(len(paths), 1)
+
+        with open(paths[0]) as f:
+            rows = list(csv.DictReader(f))
+
+        # expect users without preferences to have no rows
+        self.assertEqual([(r['user_id'], r['rank']) for r in rows],
+                         [('1', '1'), ('1', '2'), ('2', '1'), ('2', '2'), ('3', '1'), ('3', '2')])
+        expected = self.get_recommendations(1, limit=2)
+        self.assertEqual([int(r['breakfast_id']) for r in rows[:2]], [r['breakfast_id'] for r in expected])
+        self.assertEqual([float(r['score']) for r in rows[:2]], [r['score'] for r in expected])
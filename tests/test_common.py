@@ -1,8 +1,17 @@
+import mock
+import numpy as np
+
+from sqlalchemy.engine import default
+from sqlalchemy.engine.result import BufferedRowResultProxy
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.sql.expression import text
 
 from . import BaseTestCase
-from eggsnspam.common.daos import SqlBaseDao
-from eggsnspam.common.recommendations import dot_product
+from eggsnspam.common.catalog import BreakfastCatalog
+from eggsnspam.common import daos
+from eggsnspam.common.daos import Record, SqlBaseDao, record_class, statement
+from eggsnspam.common.recommendations import (cosine_similarity, dot_product, explain_scores, score_breakfasts,
+                                              score_breakfasts_many, top_scores)
 from .mixins import BaseDaoFixturedTestCase
 
 
@@ -63,6 +72,126 @@ class SqlBaseDaoTestCase(BaseDaoFixturedTestCase, BaseTestCase):
         result = self.dao.fetchmany(query)
         self.assertEqual(len(result), 2)
 
+    def test_iterate(self):
+        """It yields every row a chunk at a time"""
+        query = text("""
+        SELECT id, name FROM tblExample
+        ORDER BY id
+        """)
+
+        # Expect every record to be yielded, however small the chunks
+        for chunk_size in (1, 2, 1000):
+            dao = SqlBaseDao(chunk_size=chunk_size)
+            self.assertEqual(list(dao.iterate(query)), [{'id': 1, 'name': 'Foo'},
+                                                        {'id': 2, 'name': 'Bar'},
+                                                        {'id': 3, 'name': 'Baz'}])
+
+        # Expect rows in the DAO's row format
+        query = 'SELECT id, name FROM tblExample ORDER BY id'
+        self.assertEqual(list(SqlBaseDao(row_format='tuple').iterate(query)), [(1, 'Foo'), (2, 'Bar'), (3, 'Baz')])
+        records = list(SqlBaseDao(row_format='record').iterate(query))
+        self.assertEqual([dict(r) for r in records], [{'id': 1, 'name': 'Foo'},
+                                                      {'id': 2, 'name': 'Bar'},
+                                                      {'id': 3, 'name': 'Baz'}])
+        self.assertIsInstance(records[0], Record)
+
+        # Expect the query not to run until the rows are asked for
+        rows = self.dao.iterate('SELECT id FROM tblMissing')
+        with self.assertRaises(OperationalError):
+            next(rows)
+
+    def test_fetch_columns(self):
+        """It reads each column into an array"""
+        query = 'SELECT id, name FROM tblExample ORDER BY id'
+
+        # Expect the same arrays however small the chunks
+        for chunk_size in (1, 2, 1000):
+            ids, names = SqlBaseDao(chunk_size=chunk_size).fetch_columns(query, (np.int64, object))
+            self.assertEqual(ids.dtype, np.int64)
+            self.assertEqual(ids.tolist(), [1, 2, 3])
+            self.assertEqual(names.tolist(), ['Foo', 'Bar', 'Baz'])
+
+        # Expect empty arrays of the right types if there are no rows
+        ids, names = self.dao.fetch_columns('SELECT id, name FROM tblExample WHERE id < 0', (np.int32, object))
+        self.assertEqual((ids.dtype, len(ids), len(names)), (np.int32, 0, 0))
+
+        # Expect a dtype for every column
+        self.assertRaises(ValueError, self.dao.fetch_columns, query, (np.int64,))
+
+    @mock.patch.object(default.DefaultExecutionContext, 'get_result_proxy',
+                       lambda context: BufferedRowResultProxy(context))
+    def test_fetch_columns_buffered(self):
+        """It reads the rows a result buffers ahead of its cursor, as with psycopg2's server-side cursors"""
+        ids, names = SqlBaseDao(chunk_size=2).fetch_columns('SELECT id, name FROM tblExample ORDER BY id',
+                                                            (np.int64, object))
+        self.assertEqual(ids.tolist(), [1, 2, 3])
+
+    def test_fetch_by_ids(self):
+        """It gets the rows for a list of IDs in the order asked for"""
+        query_format = 'SELECT id, name FROM tblExample WHERE id IN ({})'
+
+        # Expect IDs to be chunked, each row to be returned once, and missing IDs to be left out
+        self.dao.MAX_IN_CLAUSE_SIZE = 2
+        result = self.dao.fetch_by_ids(query_format, [3, -1, 1, 3])
+        self.assertEqual(result, [{'id': 3, 'name': 'Baz'}, {'id': 1, 'name': 'Foo'}])
+
+        self.assertEqual(self.dao.fetch_by_ids(query_format, []), [])
+
+        # Expect rows in any format to be looked up by the key column
+        self.assertEqual(SqlBaseDao(row_format='tuple').fetch_by_ids(query_format, [3, 1]), [(3, 'Baz'), (1, 'Foo')])
+        records = SqlBaseDao(row_format='record').fetch_by_ids('SELECT name, id FROM tblExample WHERE id IN ({})', [2])
+        self.assertEqual(records, [('Bar', 2)])
+        self.assertEqual(records[0]['id'], 2)
+
+    def test_statement(self):
+        """It builds each statement once and compiles it once per dialect"""
+        sql = "SELECT id, name FROM tblExample WHERE id=:id;"
+        query = statement(sql)
+        self.assertIs(statement(sql), query)
+        self.assertEqual(query.text, sql)
+
+        compiled_count = len(daos._compiled_statements)
+        self.assertDictEqual(self.dao.fetchone(query, id=1), {'id': 1, 'name': 'Foo'})
+        self.assertEqual(len(daos._compiled_statements), compiled_count + 1)
+
+        # expect the compiled statement to be reused
+        self.assertDictEqual(self.dao.fetchone(query, id=2), {'id': 2, 'name': 'Bar'})
+        self.assertEqual(len(daos._compiled_statements), compiled_count + 1)
+
+        # expect other queries not to be cached
+        self.dao.fetchone(text(sql), id=1)
+        self.assertEqual(len(daos._compiled_statements), compiled_count + 1)
+
+
+class RecordTestCase(BaseTestCase):
+
+    def test_record(self):
+        """It reads a tuple of values like a dict of columns"""
+        record = record_class(['breakfast_id', 'coefficient'])((3, 0.5))
+
+        self.assertEqual(record['breakfast_id'], 3)
+        self.assertEqual(record['coefficient'], 0.5)
+        self.assertEqual(record[1], 0.5)
+        self.assertEqual(record.get('coefficient'), 0.5)
+        self.assertEqual(record.get('name', 'Spam'), 'Spam')
+        self.assertRaises(KeyError, lambda: record['name'])
+        self.assertTrue('breakfast_id' in record)
+        self.assertFalse(3 in record)
+        self.assertEqual(record.keys(), ['breakfast_id', 'coefficient'])
+        self.assertEqual(record.items(), [('breakfast_id', 3), ('coefficient', 0.5)])
+        self.assertEqual(record.to_dict(), {'breakfast_id': 3, 'coefficient': 0.5})
+        self.assertEqual(dict(record), {'breakfast_id': 3, 'coefficient': 0.5})
+        self.assertEqual(record, (3, 0.5))
+        self.assertEqual(repr(record), 'Record(breakfast_id=3, coefficient=0.5)')
+
+        # expect one class for each set of columns
+        self.assertIs(type(record), record_class(('breakfast_id', 'coefficient')))
+        self.assertIsNot(type(record), record_class(('coefficient', 'breakfast_id')))
+
+    def test_unknown_row_format(self):
+        """It rejects a row format it doesn't know"""
+        self.assertRaises(ValueError, SqlBaseDao, row_format='list')
+
 
 class DotProductTestCase(BaseTestCase):
 
@@ -81,3 +210,192 @@ class DotProductTestCase(BaseTestCase):
 
         # expect dotproduct to = (foo(0) + bar(0.1) + baz(0.4))
         self.assertEqual(dot_product(d1, d2), 0.5)
+
+    def test_cosine_similarity(self):
+        """It gets the cosine of the angle between two dictionaries of values"""
+        self.assertAlmostEqual(cosine_similarity({'foo': 3, 'bar': 4}, {'foo': 1}), 0.6)
+        self.assertAlmostEqual(cosine_similarity({'foo': 0.1}, {'foo': 2}), 1.0)
+        self.assertEqual(cosine_similarity({'foo': 1}, {'bar': 1}), 0)
+
+        # expect no division by zero for an empty dictionary
+        self.assertEqual(cosine_similarity({}, {'foo': 1}), 0)
+
+
+class ScoreBreakfastsTestCase(BaseTestCase):
+
+    breakfast_ingredients = [
+        {'breakfast_id': 1, 'ingredient_id': 1, 'coefficient': 0.8},
+        {'breakfast_id': 1, 'ingredient_id': 2, 'coefficient': 0.8},
+        {'breakfast_id': 1, 'ingredient_id': 3, 'coefficient': 0.2},
+        {'breakfast_id': 2, 'ingredient_id': 1, 'coefficient': 0.0},
+        {'breakfast_id': 2, 'ingredient_id': 2, 'coefficient': 0.2},
+        {'breakfast_id': 2, 'ingredient_id': 3, 'coefficient': 0.9},
+        {'breakfast_id': 3, 'ingredient_id': 1, 'coefficient': 0.9},
+        {'breakfast_id': 3, 'ingredient_id': 2, 'coefficient': 0.5},
+        {'breakfast_id': 3, 'ingredient_id': 3, 'coefficient': 0.1},
+        {'breakfast_id': 4, 'ingredient_id': 4, 'coefficient': 1.0},
+    ]
+
+    def test_score_breakfasts(self):
+        """It scores and sorts every breakfast the same way as dot_product"""
+        catalog = BreakfastCatalog.from_rows(self.breakfast_ingredients)
+        preferences = {1: 0.8, 2: 0.4, 3: 0.6, 5: 1.0}
+
+        breakfasts = {}
+        for bi in self.breakfast_ingredients:
+            breakfasts.setdefault(bi['breakfast_id'], {})[bi['ingredient_id']] = bi['coefficient']
+
+        results = score_breakfasts(catalog, preferences)
+        self.assertEqual([r['breakfast_id'] for r in results], [1, 3, 2, 4])
+        for result in results:
+            self.assertEqual(result['score'], dot_product(breakfasts[result['breakfast_id']], preferences))
+
+    def test_score_breakfasts_ties(self):
+        """It keeps breakfasts with the same score in ID order"""
+        catalog = BreakfastCatalog.from_rows(self.breakfast_ingredients)
+        results = score_breakfasts(catalog, {})
+        self.assertEqual([r['breakfast_id'] for r in results], [1, 2, 3, 4])
+        self.assertEqual([r['score'] for r in results], [0, 0, 0, 0])
+
+    def test_score_breakfasts_limit(self):
+        """It only returns the top scoring breakfasts"""
+        catalog = BreakfastCatalog.from_rows(self.breakfast_ingredients)
+        preferences = {1: 0.8, 2: 0.4, 3: 0.6}
+
+        results = score_breakfasts(catalog, preferences, limit=2)
+        self.assertEqual([r['breakfast_id'] for r in results], [1, 3])
+
+        results = score_breakfasts(catalog, preferences, min_score=0.9)
+        self.assertEqual([r['breakfast_id'] for r in results], [1, 3])
+
+        results = score_breakfasts(catalog, preferences, limit=1, min_score=0.5)
+        self.assertEqual([r['breakfast_id'] for r in results], [1])
+
+        # expect a limit larger than the catalog to return everything
+        results = score_breakfasts(catalog, preferences, limit=10)
+        self.assertEqual([r['breakfast_id'] for r in results], [1, 3, 2, 4])
+
+    def test_score_breakfasts_sparse(self):
+        """It gives the same results as scoring and sorting the whole catalog"""
+        random = np.random.RandomState(42)
+        catalog = BreakfastCatalog.from_columns(random.randint(1, 200, 2000), random.randint(1, 100, 2000),
+                                                random.choice([0.0, 0.25, 0.5, 1.0], 2000))
+
+        for preferences in ({}, {7: 0.5}, {1: 0.2, 2: 1.0, 50: 0.1, 99: 0.3, 1000: 1.0}):
+            scores = catalog.score(preferences)
+            for limit in (None, 1, 5, 100, 1000):
+                for min_score in (None, 0, 0.1, 1.0):
+                    order = top_scores(scores, limit=limit, min_score=min_score)
+                    expected = [{'breakfast_id': breakfast_id, 'score': score} for breakfast_id, score in
+                                zip(catalog.breakfast_ids[order].tolist(), scores[order].tolist())]
+                    self.assertEqual(score_breakfasts(catalog, preferences, limit=limit, min_score=min_score),
+                                     expected)
+
+    def test_score_breakfasts_cosine(self):
+        """It scores breakfasts by cosine similarity, not favoring the ones with bigger coefficients"""
+        catalog = BreakfastCatalog.from_rows(self.breakfast_ingredients)
+        preferences = {1: 0.8, 2: 0.4, 3: 0.6, 5: 1.0}
+
+        breakfasts = {}
+        for bi in self.breakfast_ingredients:
+            breakfasts.setdefault(bi['breakfast_id'], {})[bi['ingredient_id']] = bi['coefficient']
+
+        results = score_breakfasts(catalog, preferences, strategy='cosine')
+        self.assertEqual([r['breakfast_id'] for r in results], [3, 1, 2, 4])
+        for result in results:
+            self.assertAlmostEqual(result['score'], cosine_similarity(breakfasts[result['breakfast_id']], preferences))
+
+        results = score_breakfasts(catalog, preferences, limit=2, min_score=0.5, strategy='cosine')
+        self.assertEqual([r['breakfast_id'] for r in results], [3, 1])
+
+        # expect the batch scoring to match
+        preferences_list = [preferences, {4: 0.1}, {}]
+        self.assertEqual(score_breakfasts_many(catalog, preferences_list, limit=3, strategy='cosine'),
+                         [score_breakfasts(catalog, p, limit=3, strategy='cosine') for p in preferences_list])
+
+    def test_score_breakfasts_explain(self):
+        """It lists the ingredients contributing most to each returned breakfast's score"""
+        catalog = BreakfastCatalog.from_rows(self.breakfast_ingredients)
+        preferences = {1: 0.8, 2: 0.4, 3: 0.6}
+
+        results = score_breakfasts(catalog, preferences, limit=2, explain=True)
+        self.assertEqual([r['breakfast_id'] for r in results], [1, 3])
+        self.assertEqual([c['ingredient_id'] for c in results[0]['contributions']], [1, 2, 3])
+        self.assertEqual([c['score'] for c in results[0]['contributions']], [0.8 * 0.8, 0.8 * 0.4, 0.2 * 0.6])
+        self.assertEqual([c['ingredient_id'] for c in results[1]['contributions']], [1, 2, 3])
+
+        # expect the contributions to add up to the score whatever the strategy
+        for strategy in ('dot_product', 'cosine'):
+            for result in score_breakfasts(catalog, preferences, strategy=strategy, explain=True):
+                self.assertAlmostEqual(sum(c['score'] for c in result['contributions']), result['score'])
+
+        # expect breakfasts scoring 0 to have no contributions
+        results = score_breakfasts(catalog, {4: 0.5}, explain=True)
+        self.assertEqual([r['contributions'] for r in results], [[{'ingredient_id': 4, 'score': 0.5}], [], [], []])
+
+        # expect the scores to be unchanged
+        self.assertEqual([{'breakfast_id': r['breakfast_id'], 'score': r['score']}
+                          for r in score_breakfasts(catalog, preferences, explain=True)],
+                         score_breakfasts(catalog, preferences))
+
+        # expect batch scoring to match
+        preferences_list = [preferences, {4: 0.1}, {}]
+        self.assertEqual(score_breakfasts_many(catalog, preferences_list, limit=2, explain=True),
+                         [score_breakfasts(catalog, p, limit=2, explain=True) for p in preferences_list])
+
+    def test_explain_scores(self):
+        """It keeps the biggest contributions, positive or negative"""
+        catalog = BreakfastCatalog.from_rows(self.breakfast_ingredients)
+        preferences = {1: 0.1, 2: -1.0, 3: 0.5}
+        rows, scores, products = catalog.score_sparse(preferences, return_products=True)
+
+        contributions = explain_scores(catalog, np.array([2, 0]), products, preferences, size=2)
+        self.assertEqual([[c['ingredient_id'] for c in row_contributions] for row_contributions in contributions],
+                         [[2, 1], [2, 3]])
+
+    def test_score_breakfasts_filters(self):
+        """It leaves out breakfasts using excluded ingredients or missing required ones"""
+        catalog = BreakfastCatalog.from_rows(self.breakfast_ingredients)
+        preferences = {1: 0.8, 2: 0.4, 3: 0.6}
+
+        def get_ids(**options):
+            return [r['breakfast_id'] for r in score_breakfasts(catalog, preferences, **options)]
+
+        # expect breakfast 2's coefficient of 0 for ingredient 1 not to count as using it
+        self.assertEqual(get_ids(exclude_ingredients=[1]), [2, 4])
+        self.assertEqual(get_ids(exclude_ingredients=[1], limit=1), [2])
+        self.assertEqual(get_ids(require_ingredients=[1]), [1, 3])
+        self.assertEqual(get_ids(require_ingredients=[1, 2], exclude_ingredients=[3]), [])
+        self.assertEqual(get_ids(require_ingredients=[4], min_score=0), [4])
+
+        # expect batch scoring to match
+        preferences_list = [preferences, {4: 0.1}, {}]
+        for options in ({'exclude_ingredients': [1]}, {'require_ingredients': [2], 'limit': 2}):
+            self.assertEqual(score_breakfasts_many(catalog, preferences_list, **options),
+                             [score_breakfasts(catalog, p, **options) for p in preferences_list])
+
+    def test_score_breakfasts_many(self):
+        """It scores many users at once, with the same results as scoring each of them"""
+        catalog = BreakfastCatalog.from_rows(self.breakfast_ingredients)
+        preferences_list = [{1: 0.8, 2: 0.4, 3: 0.6}, {4: 0.1}, {}]
+
+        results = score_breakfasts_many(catalog, preferences_list, limit=2, min_score=0)
+        self.assertEqual(results, [score_breakfasts(catalog, p, limit=2, min_score=0) for p in preferences_list])
+        self.assertEqual([r['breakfast_id'] for r in results[1]], [4, 1])
+
+
+class TopScoresTestCase(BaseTestCase):
+
+    def test_top_scores(self):
+        """It selects the indexes of the best scores the same way a full stable sort would"""
+        scores = np.array([0.5, 1.0, 0.5, 0.0, 0.5, 1.0])
+        full_sort = sorted(range(len(scores)), key=lambda i: -scores[i])
+
+        for limit in range(1, len(scores) + 1):
+            self.assertEqual(top_scores(scores, limit=limit).tolist(), full_sort[:limit])
+
+        self.assertEqual(top_scores(scores).tolist(), full_sort)
+        self.assertEqual(top_scores(scores, min_score=0.5).tolist(), [1, 5, 0, 2, 4])
+        self.assertEqual(top_scores(scores, limit=3, min_score=0.5).tolist(), [1, 5, 0])
+        self.assertEqual(top_scores(scores, min_score=2).tolist(), [])
+        self.assertEqual(top_scores(np.zeros(0), limit=3).tolist(), [])
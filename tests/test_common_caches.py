@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import mock
+
+from . import BaseTestCase
+from eggsnspam.common.caches import CacheBackend, LRUCache, SqliteCache, create_cache
+from eggsnspam.common.daos import record_class
+
+
+class LRUCacheTestCase(BaseTestCase):
+
+    def test_get(self):
+        """It returns cached values and counts hits and misses"""
+        cache = LRUCache(max_size=2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', 'default'), 'default')
+
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats(), {'size': 1, 'max_size': 2, 'hits': 1, 'misses': 2})
+
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+        cache.set('a', 1)
+        cache.clear()
+        self.assertEqual(cache.stats(), {'size': 0, 'max_size': 2, 'hits': 0, 'misses': 0})
+
+    def test_eviction(self):
+        """It evicts the least recently used key when full"""
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    @mock.patch('eggsnspam.common.caches.time')
+    def test_ttl(self, m_time):
+        """It expires keys after ttl seconds"""
+        cache = LRUCache(max_size=2, ttl=60)
+        m_time.time.return_value = 1000
+        cache.set('a', 1)
+
+        m_time.time.return_value = 1059
+        self.assertEqual(cache.get('a'), 1)
+
+        m_time.time.return_value = 1060
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class SqliteCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SqliteCacheTestCase, self).setUp()
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+        super(SqliteCacheTestCase, self).tearDown()
+
+    def test_get(self):
+        """It returns cached values and counts hits and misses"""
+        cache = SqliteCache(self.path, 'test', max_size=2)
+        self.assertIsNone(cache.get(('a', 1)))
+        self.assertEqual(cache.get(('a', 1), 'default'), 'default')
+
+        cache.set(('a', 1), [{'breakfast_id': 1, 'score': 0.5}])
+        self.assertEqual(cache.get(('a', 1)), [{'breakfast_id': 1, 'score': 0.5}])
+        self.assertEqual(cache.stats(), {'size': 1, 'max_size': 2, 'hits': 1, 'misses': 2})
+
+        cache.delete(('a', 1))
+        self.assertIsNone(cache.get(('a', 1)))
+
+        cache.set(('a', 1), 1)
+        cache.clear()
+        self.assertEqual(cache.stats(), {'size': 0, 'max_size': 2, 'hits': 0, 'misses': 0})
+
+        # expect names other than plain words to be refused, since they name a table
+        with self.assertRaises(ValueError):
+            SqliteCache(self.path, 'test; DROP TABLE', max_size=2)
+
+    def test_shared(self):
+        """It shares values between every cache opening the same file and name"""
+        cache = SqliteCache(self.path, 'test', max_size=2)
+        other_worker = SqliteCache(self.path, 'test', max_size=2)
+        other_cache = SqliteCache(self.path, 'other', max_size=2)
+
+        cache.set('a', record_class(('name', 'id'))(('a', 1)))
+        record = other_worker.get('a')
+        self.assertEqual(record['name'], 'a')
+        self.assertIsNone(other_cache.get('a'))
+
+        other_worker.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_connection(self):
+        """It opens one connection per process, shared by every thread, and another after a fork"""
+        cache = SqliteCache(self.path, 'test', max_size=2)
+        with mock.patch.object(SqliteCache, '_connect', wraps=cache._connect) as m_connect:
+            cache.set('a', 1)
+            thread = threading.Thread(target=cache.get, args=('a',))
+            thread.start()
+            thread.join()
+            self.assertEqual(cache.hits, 1)
+            self.assertEqual(m_connect.call_count, 1)
+
+            with mock.patch('eggsnspam.common.caches.os.getpid', return_value=-1):
+                self.assertEqual(cache.get('a'), 1)
+            self.assertEqual(m_connect.call_count, 2)
+
+    def test_eviction(self):
+        """It evicts the key stored longest ago when full"""
+        cache = SqliteCache(self.path, 'test', max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 3)
+        cache.set('c', 4)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 3)
+        self.assertEqual(cache.get('c'), 4)
+
+    @mock.patch('eggsnspam.common.caches.time')
+    def test_ttl(self, m_time):
+        """It expires keys after ttl seconds"""
+        cache = SqliteCache(self.path, 'test', max_size=2, ttl=60)
+        m_time.time.return_value = 1000
+        cache.set('a', 1)
+
+        m_time.time.return_value = 1059
+        self.assertEqual(cache.get('a'), 1)
+
+        m_time.time.return_value = 1060
+        self.assertIsNone(cache.get('a'))
+
+
+class CreateCacheTestCase(BaseTestCase):
+
+    def test_create_cache(self):
+        """It creates the backend CACHE_BACKEND names"""
+        self.assertIsInstance(create_cache('test', 10), LRUCache)
+        self.assertRaises(TypeError, CacheBackend, 10)
+
+        work_dir = tempfile.mkdtemp()
+        try:
+            self.app.config['CACHE_BACKEND'] = 'sqlite'
+            self.app.config['CACHE_SQLITE_PATH'] = os.path.join(work_dir, 'cache.db')
+            cache = create_cache('test', 10, ttl=60)
+            self.assertIsInstance(cache, SqliteCache)
+            self.assertEqual((cache.max_size, cache.ttl), (10, 60))
+        finally:
+            shutil.rmtree(work_dir)
+
+        self.app.config['CACHE_BACKEND'] = 'memcached'
+        with self.assertRaises(ValueError):
+            create_cache('test', 10)
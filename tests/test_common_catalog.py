@@ -0,0 +1,207 @@
+import mock
+import numpy as np
+
+from . import BaseTestCase
+from eggsnspam.common.catalog import BreakfastCatalog, CatalogCache
+from eggsnspam.common.daos import record_class
+
+
+BREAKFAST_INGREDIENTS = [
+    {'breakfast_id': 1, 'ingredient_id': 1, 'coefficient': 0.8},
+    {'breakfast_id': 1, 'ingredient_id': 2, 'coefficient': 0.2},
+    {'breakfast_id': 2, 'ingredient_id': 2, 'coefficient': 0.9},
+]
+
+
+class BreakfastCatalogTestCase(BaseTestCase):
+
+    def test_from_rows(self):
+        """It builds a sparse breakfast ingredient matrix"""
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+        self.assertEqual(len(catalog), 2)
+        self.assertEqual(catalog.breakfast_ids.tolist(), [1, 2])
+        self.assertEqual(catalog.ingredient_ids.tolist(), [1, 2])
+        self.assertEqual(catalog.indptr.tolist(), [0, 2, 3])
+        self.assertEqual(catalog.indices.tolist(), [0, 1, 1])
+        self.assertEqual(catalog.data.tolist(), [0.8, 0.2, 0.9])
+
+        # expect an empty catalog if there are no rows
+        self.assertEqual(len(BreakfastCatalog.from_rows([])), 0)
+
+    def test_from_rows_records(self):
+        """It builds the same catalog from records, whatever order their columns are in"""
+        record = record_class(['coefficient', 'breakfast_id', 'ingredient_id'])
+        records = [record((r['coefficient'], r['breakfast_id'], r['ingredient_id'])) for r in BREAKFAST_INGREDIENTS]
+        expected = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+
+        # expect records to be read across chunks
+        with mock.patch.object(BreakfastCatalog, 'RECORD_CHUNK_SIZE', 2):
+            catalog = BreakfastCatalog.from_rows(iter(records))
+        self.assertEqual(catalog.version, expected.version)
+        self.assertEqual(catalog.data.tolist(), [0.8, 0.2, 0.9])
+
+    def test_from_columns(self):
+        """It sorts by breakfast and ingredient, keeping the last coefficient for duplicates"""
+        catalog = BreakfastCatalog.from_columns([2, 1, 2, 1], [5, 3, 5, 4], [0.1, 0.2, 0.3, 0.4])
+        self.assertEqual(catalog.breakfast_ids.tolist(), [1, 2])
+        self.assertEqual(catalog.ingredient_ids.tolist(), [3, 4, 5])
+        self.assertEqual(catalog.indptr.tolist(), [0, 2, 3])
+        self.assertEqual(catalog.indices.tolist(), [0, 1, 2])
+        self.assertEqual(catalog.data.tolist(), [0.2, 0.4, 0.3])
+
+    def test_coefficient_storage(self):
+        """It stores coefficients compactly, with scores within the documented error bounds"""
+        random = np.random.RandomState(0)
+        columns = (random.randint(1, 100, 1000), random.randint(1, 50, 1000), random.rand(1000))
+        preferences = {i: random.rand() for i in range(1, 50, 3)}
+        catalog = BreakfastCatalog.from_columns(*columns)
+        scores = catalog.score(preferences)
+
+        for storage, dtype, error_bound in (('float32', np.float32, 2 ** -24), ('uint8', np.uint8, 1.0 / 510)):
+            compact = BreakfastCatalog.from_columns(*columns, coefficient_storage=storage)
+            self.assertEqual(compact.data.dtype, dtype)
+            self.assertLess(compact.nbytes, catalog.nbytes)
+
+            max_error = sum(preferences.values()) * error_bound
+            self.assertLessEqual(np.abs(compact.score(preferences) - scores).max(), max_error)
+            rows, sparse_scores = compact.score_sparse(preferences)
+            self.assertEqual(sparse_scores.tolist(), compact.score(preferences)[rows].tolist())
+
+        # expect quantized coefficients to be clipped to the range 0 to 1
+        quantized = BreakfastCatalog.from_columns([1, 1, 1], [1, 2, 3], [-0.5, 0.5, 2], coefficient_storage='uint8')
+        self.assertEqual(quantized.data.tolist(), [0, 128, 255])
+        self.assertAlmostEqual(quantized.score({1: 1, 2: 1, 3: 1})[0], 383 / 255.0)
+
+        self.assertRaises(ValueError, BreakfastCatalog.from_columns, [1], [1], [0.5], coefficient_storage='float16')
+
+    def test_inverse_norms(self):
+        """It computes one over the length of every breakfast's vector of coefficients"""
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+        np.testing.assert_allclose(catalog.inverse_norms, [(0.8 ** 2 + 0.2 ** 2) ** -0.5, 1 / 0.9])
+
+        # expect quantized coefficients to be scaled back first
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS, coefficient_storage='uint8')
+        np.testing.assert_allclose(catalog.inverse_norms, [(0.8 ** 2 + 0.2 ** 2) ** -0.5, 1 / 0.9], rtol=0.01)
+
+        # expect breakfasts with only zero coefficients to get 0 rather than infinity
+        catalog = BreakfastCatalog.from_columns([1, 2], [1, 1], [0.0, 0.5])
+        self.assertEqual(catalog.inverse_norms.tolist(), [0, 2])
+
+    def test_ingredient_column(self):
+        """It lists the breakfasts using an ingredient"""
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+        rows, coefficients = catalog.ingredient_column(2)
+        self.assertEqual(rows.tolist(), [0, 1])
+        self.assertEqual(coefficients.tolist(), [0.2, 0.9])
+        self.assertEqual(catalog.ingredient_column(99)[0].tolist(), [])
+
+    def test_ingredient_mask(self):
+        """It marks the breakfasts passing ingredient filters"""
+        catalog = BreakfastCatalog.from_columns([1, 1, 2, 2, 3], [1, 2, 1, 2, 3], [0.5, 0.5, 0.0, 0.5, 1.0])
+        self.assertEqual(catalog.ingredient_mask().tolist(), [True, True, True])
+        self.assertEqual(catalog.ingredient_mask(exclude_ingredients=[2]).tolist(), [False, False, True])
+        self.assertEqual(catalog.ingredient_mask(require_ingredients=[1, 2]).tolist(), [True, False, False])
+        self.assertEqual(catalog.ingredient_mask(require_ingredients=[2], exclude_ingredients=[1]).tolist(),
+                         [False, True, False])
+
+        # expect unknown ingredients to be used by no breakfasts
+        self.assertEqual(catalog.ingredient_mask(exclude_ingredients=[99]).tolist(), [True, True, True])
+        self.assertEqual(catalog.ingredient_mask(require_ingredients=[2, 99]).tolist(), [False, False, False])
+
+    def test_score_sparse(self):
+        """It scores only the breakfasts using one of the preferred ingredients"""
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+        rows, scores = catalog.score_sparse({1: 0.5, 2: -1, 99: 1})
+        self.assertEqual(rows.tolist(), [0, 1])
+        self.assertEqual(scores.tolist(), catalog.score({1: 0.5, 2: -1, 99: 1}).tolist())
+
+        rows, scores = catalog.score_sparse({1: 0.5})
+        self.assertEqual(rows.tolist(), [0])
+        self.assertEqual(scores.tolist(), [0.4])
+        self.assertEqual(catalog.score_sparse({})[0].tolist(), [])
+
+        # expect the products to be returned if asked for
+        rows, scores, (product_rows, ingredient_ids, products) = catalog.score_sparse({1: 0.5, 2: -1},
+                                                                                      return_products=True)
+        self.assertEqual(product_rows.tolist(), [0, 0, 1])
+        self.assertEqual(ingredient_ids.tolist(), [1, 2, 2])
+        self.assertEqual(products.tolist(), [0.4, -0.2, -0.9])
+        self.assertEqual([len(array) for array in catalog.score_sparse({}, return_products=True)[2]], [0, 0, 0])
+
+    def test_score(self):
+        """It scores every breakfast against a user's preferences"""
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+
+        # expect preferences for unknown ingredients to be ignored
+        np.testing.assert_allclose(catalog.score({1: 0.5, 2: 1, 99: 1}), [0.6, 0.9])
+        self.assertEqual(catalog.score({}).tolist(), [0, 0])
+        self.assertEqual(BreakfastCatalog.from_rows([]).score({1: 1}).tolist(), [])
+
+    def test_score_many(self):
+        """It scores many users at once, exactly as it scores each of them"""
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+        preferences_list = [{1: 0.5, 2: 1}, {}, {2: 0.3}]
+
+        scores = catalog.score_many(preferences_list)
+        self.assertEqual(scores.shape, (3, 2))
+        for row, preferences in enumerate(preferences_list):
+            self.assertEqual(scores[row].tolist(), catalog.score(preferences).tolist())
+
+        # expect the same scores when users are processed a few at a time
+        catalog.SCORE_CHUNK_SIZE = 1
+        self.assertEqual(catalog.score_many(preferences_list).tolist(), scores.tolist())
+
+        self.assertEqual(catalog.score_many([]).shape, (0, 2))
+
+
+class CatalogCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(CatalogCacheTestCase, self).setUp()
+        self.cache = CatalogCache()
+        self.loader = mock.MagicMock(return_value=BREAKFAST_INGREDIENTS)
+
+    def test_get(self):
+        """It loads the catalog once and then serves it from memory"""
+        catalog = self.cache.get(self.loader)
+        self.assertEqual(self.loader.call_count, 1)
+        self.assertEqual(catalog.breakfast_ids.tolist(), [1, 2])
+
+        # expect the same catalog to be returned without calling the loader again
+        self.assertIs(self.cache.get(self.loader), catalog)
+        self.assertEqual(self.loader.call_count, 1)
+
+    def test_get_columns(self):
+        """It builds the catalog from columns when the loader returns them"""
+        catalog = self.cache.get(lambda: ([1, 1, 2], [1, 2, 2], [0.8, 0.2, 0.9]))
+        self.assertEqual(catalog.version, BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS).version)
+
+    def test_invalidate(self):
+        """It reloads the catalog after it has been invalidated"""
+        catalog = self.cache.get(self.loader)
+        self.cache.invalidate()
+        self.assertIsNot(self.cache.get(self.loader), catalog)
+        self.assertEqual(self.loader.call_count, 2)
+
+    @mock.patch('eggsnspam.common.catalog.time.time')
+    def test_ttl(self, m_time):
+        """It reloads the catalog once it is older than CATALOG_CACHE_TTL"""
+        self.app.config['CATALOG_CACHE_TTL'] = 60
+        m_time.return_value = 1000
+        self.cache.get(self.loader)
+
+        # expect the cached catalog to be used within the TTL
+        m_time.return_value = 1059
+        self.cache.get(self.loader)
+        self.assertEqual(self.loader.call_count, 1)
+
+        # expect the catalog to be reloaded after the TTL
+        m_time.return_value = 1060
+        self.cache.get(self.loader)
+        self.assertEqual(self.loader.call_count, 2)
+
+        # expect the catalog to be kept indefinitely without a TTL
+        self.app.config['CATALOG_CACHE_TTL'] = None
+        m_time.return_value = 100000
+        self.cache.get(self.loader)
+        self.assertEqual(self.loader.call_count, 2)
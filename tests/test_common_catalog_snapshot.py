@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+
+import mock
+import numpy as np
+
+from . import BaseTestCase
+from eggsnspam.common import catalog_snapshot
+from eggsnspam.common.catalog import BreakfastCatalog, CatalogCache
+
+
+BREAKFAST_INGREDIENTS = [
+    {'breakfast_id': 1, 'ingredient_id': 1, 'coefficient': 0.8},
+    {'breakfast_id': 1, 'ingredient_id': 2, 'coefficient': 0.2},
+    {'breakfast_id': 2, 'ingredient_id': 2, 'coefficient': 0.9},
+]
+
+
+class CatalogSnapshotTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(CatalogSnapshotTestCase, self).setUp()
+        self.snapshot_dir = os.path.join(tempfile.mkdtemp(), 'snapshots')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.snapshot_dir))
+        super(CatalogSnapshotTestCase, self).tearDown()
+
+    def test_write_snapshot(self):
+        """It saves a catalog and opens it again memory-mapped"""
+        self.assertIsNone(catalog_snapshot.get_current_snapshot(self.snapshot_dir))
+
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+        path = catalog_snapshot.write_snapshot(catalog, self.snapshot_dir)
+        self.assertEqual(os.path.basename(path), catalog.version)
+        self.assertEqual(catalog_snapshot.get_current_snapshot(self.snapshot_dir)[0], path)
+
+        opened = BreakfastCatalog.open(path, version=catalog.version)
+        self.assertIsInstance(opened.data, np.memmap)
+        self.assertEqual(opened.version, catalog.version)
+        for name in BreakfastCatalog.ARRAY_NAMES:
+            self.assertEqual(getattr(opened, name).tolist(), getattr(catalog, name).tolist())
+        self.assertEqual(opened.score({1: 0.5, 2: 1}).tolist(), catalog.score({1: 0.5, 2: 1}).tolist())
+
+        # expect an empty catalog to round trip too
+        empty = BreakfastCatalog.from_rows([])
+        path = catalog_snapshot.write_snapshot(empty, self.snapshot_dir)
+        self.assertEqual(len(BreakfastCatalog.open(path)), 0)
+
+    def test_write_snapshot_versions(self):
+        """It points the current snapshot at the newest version and removes old ones"""
+        catalogs = [BreakfastCatalog.from_rows([dict(row, coefficient=i) for row in BREAKFAST_INGREDIENTS])
+                    for i in range(4)]
+        for catalog in catalogs:
+            catalog_snapshot.write_snapshot(catalog, self.snapshot_dir)
+
+        path, written_at = catalog_snapshot.get_current_snapshot(self.snapshot_dir)
+        self.assertEqual(os.path.basename(path), catalogs[-1].version)
+        self.assertEqual(len([name for name in os.listdir(self.snapshot_dir) if not name.startswith('.')]),
+                         catalog_snapshot.KEEP_OLD_SNAPSHOTS + 2)
+
+        # expect writing the same catalog again to reuse its snapshot
+        catalog_snapshot.write_snapshot(catalogs[-1], self.snapshot_dir)
+        self.assertEqual(catalog_snapshot.get_current_snapshot(self.snapshot_dir)[0], path)
+
+    def test_write_snapshot_fails(self):
+        """It removes what it had written when saving a snapshot fails"""
+        catalog = BreakfastCatalog.from_rows(BREAKFAST_INGREDIENTS)
+        with mock.patch.object(BreakfastCatalog, 'save', side_effect=IOError("No space left on device")):
+            with self.assertRaises(IOError):
+                catalog_snapshot.write_snapshot(catalog, self.snapshot_dir)
+        self.assertEqual(os.listdir(self.snapshot_dir), [])
+        self.assertIsNone(catalog_snapshot.get_current_snapshot(self.snapshot_dir))
+
+    def test_catalog_cache(self):
+        """It shares one snapshot between processes, only scanning the table when there isn't a usable one"""
+        self.app.config['CATALOG_SNAPSHOT_DIR'] = self.snapshot_dir
+        loader = mock.Mock(return_value=BREAKFAST_INGREDIENTS)
+
+        catalog = CatalogCache().get(loader)
+        self.assertEqual(loader.call_count, 1)
+        self.assertIsInstance(catalog.data, np.memmap)
+
+        # expect another process to start from the snapshot
+        other_catalog = CatalogCache().get(loader)
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(other_catalog.version, catalog.version)
+
+        # expect a process which changed the catalog to write a new snapshot
+        cache = CatalogCache()
+        cache.invalidate()
+        loader.return_value = BREAKFAST_INGREDIENTS[:2]
+        new_catalog = cache.get(loader)
+        self.assertEqual(loader.call_count, 2)
+        self.assertEqual(len(new_catalog), 1)
+        self.assertEqual(CatalogCache().get(loader).version, new_catalog.version)
+
+        # expect another process told about the change to open the new snapshot, unless it was written before the
+        # change or the process can't tell when the change happened
+        written_at = catalog_snapshot.get_current_snapshot(self.snapshot_dir)[1]
+        other_cache = CatalogCache()
+        other_cache._drop(written_at - 1)
+        self.assertEqual(other_cache.get(loader).version, new_catalog.version)
+        self.assertEqual(loader.call_count, 2)
+        other_cache._drop(written_at + 1)
+        other_cache.get(loader)
+        self.assertEqual(loader.call_count, 3)
+        other_cache._drop()
+        other_cache.get(loader)
+        self.assertEqual(loader.call_count, 4)
+
+        # expect a snapshot older than CATALOG_CACHE_TTL to be replaced
+        self.app.config['CATALOG_CACHE_TTL'] = 0
+        CatalogCache().get(loader)
+        self.assertEqual(loader.call_count, 5)
@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from . import BaseTestCase
+from .mixins import PhrasebookFixturedTestCase
+from .utils import AssertNumQueries
+from eggsnspam.common.invalidation import InvalidationBus
+from eggsnspam.common.reference_data import reference_data_cache
+from eggsnspam.extensions import db
+from eggsnspam.oop_phrasebook.daos import UserDao, UserPreferenceDao
+
+
+class BusTestCase(BaseTestCase):
+    """Enables the bus, with its file in a temporary directory"""
+
+    def setUp(self):
+        super(BusTestCase, self).setUp()
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, 'invalidations.log')
+        self.app.config['INVALIDATION_BUS_ENABLED'] = True
+        self.app.config['INVALIDATION_BUS_PATH'] = self.path
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+        super(BusTestCase, self).tearDown()
+
+    def publish_from_other_worker(self, topic, key=None):
+        with mock.patch('eggsnspam.common.invalidation.os.getpid', return_value=-1):
+            InvalidationBus().publish(topic, key)
+
+
+class InvalidationBusTestCase(BusTestCase):
+
+    def test_poll(self):
+        """It passes messages published by other workers to the handlers subscribed to their topic"""
+        bus = InvalidationBus()
+        catalog_handler, user_handler = mock.Mock(), mock.Mock()
+        bus.subscribe('catalog', catalog_handler)
+        bus.subscribe('users', user_handler)
+        bus.poll()
+
+        self.publish_from_other_worker('catalog')
+        self.publish_from_other_worker('users', ['oop_orm', 1])
+        bus.poll()
+        catalog_handler.assert_called_once_with(None)
+        user_handler.assert_called_once_with(('oop_orm', 1))
+
+        # expect a worker's own messages not to be passed back to it
+        bus.publish('catalog')
+        bus.poll()
+        self.assertEqual(catalog_handler.call_count, 1)
+        self.assertEqual(bus.stats(), {'published': 1, 'received': 2, 'resets': 0,
+                                       'position': os.path.getsize(self.path)})
+
+    def test_partial_line(self):
+        """It leaves a line which is still being written for the next poll"""
+        bus = InvalidationBus()
+        handler = mock.Mock()
+        bus.subscribe('catalog', handler)
+        bus.poll()
+
+        with open(self.path, 'ab') as f:
+            f.write(b'[-1,"catalog",')
+        bus.poll()
+        self.assertFalse(handler.called)
+
+        with open(self.path, 'ab') as f:
+            f.write(b'1]\n')
+        bus.poll()
+        handler.assert_called_once_with(1)
+
+    def test_replace(self):
+        """It replaces a full file, and tells the handlers everything may have changed when it has been replaced"""
+        self.app.config['INVALIDATION_BUS_MAX_SIZE'] = 1
+        bus = InvalidationBus()
+        handler = mock.Mock()
+        bus.subscribe('catalog', handler)
+        bus.poll()
+
+        self.publish_from_other_worker('catalog', 1)
+        bus.poll()
+        handler.assert_called_once_with(1)
+
+        inode = os.stat(self.path).st_ino
+        self.publish_from_other_worker('catalog', 2)
+        self.assertNotEqual(os.stat(self.path).st_ino, inode)
+        bus.poll()
+        handler.assert_called_with(None)
+        self.assertEqual(bus.stats()['resets'], 1)
+
+    def test_disabled(self):
+        """It neither publishes nor polls while the bus is disabled"""
+        self.app.config['INVALIDATION_BUS_ENABLED'] = False
+        bus = InvalidationBus()
+        bus.publish('catalog')
+        bus.poll()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.client.get('/oop_orm/admin/invalidation_bus').status_code, 400)
+
+
+class CacheInvalidationTestCase(PhrasebookFixturedTestCase, BusTestCase):
+
+    def read_messages(self):
+        with open(self.path) as f:
+            return [json.loads(line)[1:] for line in f]
+
+    def test_publish(self):
+        """It publishes the phrasebook DAOs' writes to workers with their own query and recommendation caches"""
+        self.app.config['QUERY_CACHE_ENABLED'] = True
+        self.app.config['RECOMMENDATION_CACHE_ENABLED'] = True
+        UserPreferenceDao().create(1, 3, 0.5)
+        response = self.client.delete('/oop_phrasebook/user/1/preference/3')
+        self.assertEqual(response.status_code, 204)
+        self.assertIn(['tables', 'tbluserpreference'], self.read_messages())
+        self.assertIn(['recommendations', ['oop_phrasebook', 1]], self.read_messages())
+
+        # expect nothing to be published for a cache the workers share
+        os.remove(self.path)
+        self.app.config['CACHE_BACKEND'] = 'sqlite'
+        self.app.config['CACHE_SQLITE_PATH'] = os.path.join(self.work_dir, 'cache.db')
+        UserDao().create("Eve", "Example")
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_receive(self):
+        """It drops what other workers have invalidated before serving the next request"""
+        self.app.config['QUERY_CACHE_ENABLED'] = True
+        self.app.config['REFERENCE_DATA_SNAPSHOT_ENABLED'] = True
+        self.client.get('/oop_phrasebook/user/1')
+        self.client.get('/oop_phrasebook/breakfast/1')
+
+        self.publish_from_other_worker('tables', 'tbluser')
+        self.publish_from_other_worker('reference_data')
+        self.assertEqual(self.client.get('/oop_phrasebook/admin/invalidation_bus').status_code, 200)
+        self.assertIsNone(reference_data_cache.stats()['version'])
+        with AssertNumQueries(db.session, 1):
+            UserDao().get_by_id(1)
@@ -0,0 +1,136 @@
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from . import BaseTestCase
+from .mixins import PhrasebookFixturedTestCase
+from .utils import AssertNumQueries
+from eggsnspam.common.daos import statement
+from eggsnspam.common.query_cache import QueryCache, query_cache, statement_tables
+from eggsnspam.extensions import db
+from eggsnspam.oop_phrasebook.daos import BreakfastDao, UserDao, UserPreferenceDao
+
+
+class StatementTablesTestCase(BaseTestCase):
+
+    def test_statement_tables(self):
+        """It finds the tables some SQL reads or writes"""
+        self.assertEqual(statement_tables("""
+        SELECT tblUser.id FROM tblUser
+        LEFT OUTER JOIN "tblUserPreference" ON tblUser.id = tblUserPreference.user_id
+        WHERE tblUser.id=:id;
+        """), (('tbluser', 'tbluserpreference'), False))
+        self.assertEqual(statement_tables("INSERT INTO tblUser (first_name) VALUES (:first_name)"),
+                         (('tbluser',), True))
+        self.assertEqual(statement_tables("update tblUser SET first_name=:first_name"), (('tbluser',), True))
+        self.assertEqual(statement_tables("DELETE FROM tblUserPreference WHERE id=:id"),
+                         (('tbluserpreference',), True))
+
+
+class QueryCacheTestCase(PhrasebookFixturedTestCase, BaseTestCase):
+
+    def setUp(self):
+        super(QueryCacheTestCase, self).setUp()
+        self.app.config['QUERY_CACHE_ENABLED'] = True
+
+    def test_fetch(self):
+        """It serves repeated reads from the cache until a DAO writes to a table they read"""
+        user_dao = UserDao()
+        user = user_dao.get_by_id_join_preferences(1)
+        preferences = UserPreferenceDao().list_all_for_user(1)
+        with AssertNumQueries(db.session, 0):
+            self.assertEqual(user_dao.get_by_id_join_preferences(1), user)
+            self.assertEqual(UserPreferenceDao().list_all_for_user(1), preferences)
+
+        # expect other bind parameters to be fetched separately
+        self.assertNotEqual(user_dao.get_by_id_join_preferences(2), user)
+
+        # expect writes to other tables to keep the result
+        BreakfastDao().execute(statement("UPDATE tblBreakfast SET name='Waffles' WHERE id=2"))
+        with AssertNumQueries(db.session, 0):
+            user_dao.get_by_id_join_preferences(1)
+
+        # expect a write to a table the result read from to drop it
+        UserPreferenceDao().create(1, 3, 0.5)
+        self.assertEqual(user_dao.get_by_id_join_preferences(1)['preferences'][3], 0.5)
+        # expect the size to count the three results and the generations of the three tables written or read
+        self.assertEqual(query_cache.stats(), {'size': 6, 'max_size': 10000, 'hits': 3, 'misses': 4,
+                                               'hit_rate': 3 / 7.0, 'invalidations': 2})
+
+    def test_commit(self):
+        """It drops results read while a write was uncommitted once it commits or rolls back"""
+        fetch = mock.Mock(return_value=[{'id': 1}])
+        for end_transaction in (db.session.commit, db.session.rollback):
+            UserDao().execute(statement("UPDATE tblUser SET first_name='Zed' WHERE id=1"))
+
+            # expect a read by another connection before the commit, which still sees the old rows, to be refetched
+            query_cache.get_or_fetch(('users',), ('tbluser',), fetch)
+            query_cache.get_or_fetch(('users',), ('tbluser',), fetch)
+            calls = fetch.call_count
+            end_transaction()
+            query_cache.get_or_fetch(('users',), ('tbluser',), fetch)
+            self.assertEqual(fetch.call_count, calls + 1)
+
+        # expect the pending tables to be forgotten once they have been invalidated again
+        db.session.commit()
+        query_cache.get_or_fetch(('users',), ('tbluser',), fetch)
+        self.assertEqual(fetch.call_count, 4)
+
+    def test_orm_writes(self):
+        """It drops results read from the tables the ORM writes to"""
+        self.assertNotEqual(UserDao().get_by_id(1)['first_name'], 'Zed')
+        response = self.client.put('/oop_orm/user/1', data=json.dumps({'first_name': 'Zed', 'last_name': 'Example'}),
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserDao().get_by_id(1)['first_name'], 'Zed')
+
+    def test_size(self):
+        """It keeps at most QUERY_CACHE_SIZE results"""
+        self.app.config['QUERY_CACHE_SIZE'] = 2
+        user_dao = UserDao()
+        for user_id in (1, 2, 3, 1):
+            user_dao.get_by_id(user_id)
+        self.assertEqual(query_cache.stats()['size'], 2)
+        self.assertEqual(query_cache.stats()['misses'], 4)
+
+    def test_disabled(self):
+        """It always queries the database when the cache is disabled"""
+        self.app.config['QUERY_CACHE_ENABLED'] = False
+        UserDao().get_by_id(1)
+        with AssertNumQueries(db.session, 1):
+            UserDao().get_by_id(1)
+
+        # expect the stats endpoint to refuse while the cache is disabled
+        self.assertEqual(self.client.get('/oop_phrasebook/admin/query_cache').status_code, 400)
+
+    def test_query_cache_stats(self):
+        """It reports the cache's hit rate"""
+        for i in range(4):
+            UserDao().get_by_id(1)
+        response = self.client.get('/oop_orm/admin/query_cache')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['hit_rate'], 0.75)
+
+    def test_shared(self):
+        """It shares results and table generations between workers using the sqlite backend"""
+        work_dir = tempfile.mkdtemp()
+        try:
+            self.app.config['CACHE_BACKEND'] = 'sqlite'
+            self.app.config['CACHE_SQLITE_PATH'] = os.path.join(work_dir, 'cache.db')
+            other_worker = QueryCache()
+            fetch = mock.Mock(return_value=[{'id': 1}])
+
+            self.assertEqual(query_cache.get_or_fetch(('users',), ('tbluser',), fetch), [{'id': 1}])
+            self.assertEqual(other_worker.get_or_fetch(('users',), ('tbluser',), fetch), [{'id': 1}])
+            self.assertEqual(fetch.call_count, 1)
+
+            # expect a write in one worker to drop the result in the other
+            UserDao().create("Eve", "Example")
+            other_worker.get_or_fetch(('users',), ('tbluser',), fetch)
+            self.assertEqual(fetch.call_count, 2)
+        finally:
+            query_cache.clear()
+            shutil.rmtree(work_dir)
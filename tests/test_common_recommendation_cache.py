@@ -0,0 +1,81 @@
+import mock
+
+from . import BaseTestCase
+from .mixins import PhrasebookFixturedTestCase
+from eggsnspam.common.recommendation_cache import preference_version, recommendation_cache
+from eggsnspam.common.recommendations import score_breakfasts
+from eggsnspam.oop_phrasebook.models import UserModel, UserPreferenceModel
+
+
+class RecommendationCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(RecommendationCacheTestCase, self).setUp()
+        self.app.config['RECOMMENDATION_CACHE_ENABLED'] = True
+        self.catalog = mock.Mock(version='v1')
+
+    def test_preference_version(self):
+        """It fingerprints preferences regardless of their order"""
+        self.assertEqual(preference_version({1: 0.5, 2: 0.1}), preference_version({2: 0.1, 1: 0.5}))
+        self.assertNotEqual(preference_version({1: 0.5, 2: 0.1}), preference_version({1: 0.5, 2: 0.2}))
+
+    def test_get_or_score(self):
+        """It only scores a user again when their preferences, the catalog or the options change"""
+        score = mock.Mock(side_effect=lambda: [{'breakfast_id': 1, 'score': 0.5}])
+
+        def get(preferences, limit=None):
+            return recommendation_cache.get_or_score('test', 1, preferences, self.catalog, {'limit': limit}, score)
+
+        self.assertEqual(get({1: 0.5}), [{'breakfast_id': 1, 'score': 0.5}])
+        get({1: 0.5})
+        self.assertEqual(score.call_count, 1)
+
+        get({1: 0.5}, limit=1)
+        self.assertEqual(score.call_count, 2)
+
+        get({1: 0.6})
+        self.assertEqual(score.call_count, 3)
+
+        self.catalog.version = 'v2'
+        get({1: 0.6})
+        self.assertEqual(score.call_count, 4)
+
+        recommendation_cache.invalidate('test', 1)
+        get({1: 0.6})
+        self.assertEqual(score.call_count, 5)
+        self.assertEqual(recommendation_cache.stats(), {'size': 1, 'max_size': 10000, 'hits': 1, 'misses': 5})
+
+    def test_disabled(self):
+        """It always scores when the cache is disabled"""
+        self.app.config['RECOMMENDATION_CACHE_ENABLED'] = False
+        score = mock.Mock(return_value=[])
+        for i in range(2):
+            recommendation_cache.get_or_score('test', 1, {}, self.catalog, {}, score)
+        self.assertEqual(score.call_count, 2)
+
+
+class UserRecommendationCacheTestCase(PhrasebookFixturedTestCase, BaseTestCase):
+
+    def setUp(self):
+        super(UserRecommendationCacheTestCase, self).setUp()
+        self.app.config['RECOMMENDATION_CACHE_ENABLED'] = True
+
+    def get_recommendations(self, user_id):
+        user = UserModel()
+        user.load_by_id_with_preferences(user_id)
+        return user.get_recommendations()
+
+    @mock.patch('eggsnspam.oop_phrasebook.models.score_breakfasts', wraps=score_breakfasts)
+    def test_get_recommendations(self, m_score_breakfasts):
+        """It reuses a user's results until they change a preference"""
+        expected = self.get_recommendations(1)
+        self.assertEqual(self.get_recommendations(1), expected)
+        self.assertEqual(m_score_breakfasts.call_count, 1)
+
+        pref = UserPreferenceModel()
+        pref.load_by_user_ingredient(1, 3)
+        pref.coefficient = 0.0
+        pref.save()
+
+        self.assertNotEqual(self.get_recommendations(1), expected)
+        self.assertEqual(m_score_breakfasts.call_count, 2)
@@ -0,0 +1,198 @@
+import json
+
+import mock
+
+from . import BaseTestCase
+from .mixins import PhrasebookFixturedTestCase
+from eggsnspam.common.recommendation_store import BaseRecommendationStore, RecommendationStoreDao
+from eggsnspam.extensions import db
+from eggsnspam.oop_phrasebook.daos import UserDao, UserPreferenceDao
+from eggsnspam.oop_phrasebook.models import UserModel, UserPreferenceModel, UserRecommendationStore
+
+
+class RecommendationStoreDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
+
+    def setUp(self):
+        super(RecommendationStoreDaoTestCase, self).setUp()
+        self.dao = RecommendationStoreDao()
+
+    def test_replace_for_user(self):
+        """It stores and reads back a user's recommendations"""
+        self.assertIsNone(self.dao.get_for_user('oop_phrasebook', 1))
+
+        self.dao.replace_for_user('oop_phrasebook', 1, 'v1', [{'breakfast_id': 3, 'score': 0.9},
+                                                              {'breakfast_id': 1, 'score': 0.5},
+                                                              {'breakfast_id': 2, 'score': 0.5}])
+        version, recommendations = self.dao.get_for_user('oop_phrasebook', 1)
+        self.assertEqual(version, 'v1')
+        self.assertEqual([r['breakfast_id'] for r in recommendations], [3, 1, 2])
+        self.assertEqual(recommendations[0]['score'], 0.9)
+
+        # expect limit and min_score to be applied in the query
+        self.assertEqual(self.dao.get_for_user('oop_phrasebook', 1, limit=2)[1],
+                         [{'breakfast_id': 3, 'score': 0.9}, {'breakfast_id': 1, 'score': 0.5}])
+        self.assertEqual(self.dao.get_for_user('oop_phrasebook', 1, min_score=0.6)[1],
+                         [{'breakfast_id': 3, 'score': 0.9}])
+        self.assertEqual(self.dao.get_for_user('oop_phrasebook', 1, min_score=1)[1], [])
+
+        # expect replacing the recommendations to drop the old ones
+        self.dao.replace_for_user('oop_phrasebook', 1, 'v2', [])
+        self.assertEqual(self.dao.get_for_user('oop_phrasebook', 1), ('v2', []))
+
+    def test_add_to_scores(self):
+        """It adds to some of a user's stored scores"""
+        self.dao.replace_for_user('oop_phrasebook', 1, 'v1', [{'breakfast_id': 3, 'score': 0.9},
+                                                              {'breakfast_id': 1, 'score': 0.5}])
+        self.dao.add_to_scores('oop_phrasebook', 1, [(1, 0.5), (2, 1.0)])
+        self.assertEqual(self.dao.get_for_user('oop_phrasebook', 1), ('v1', [{'breakfast_id': 1, 'score': 1.0},
+                                                                             {'breakfast_id': 3, 'score': 0.9}]))
+
+    def test_delete_for_user(self):
+        """It deletes a user's recommendations"""
+        self.dao.replace_for_user('oop_phrasebook', 1, 'v1', [{'breakfast_id': 3, 'score': 0.9}])
+        self.dao.replace_for_user('oop_phrasebook', 2, 'v1', [{'breakfast_id': 3, 'score': 0.1}])
+        self.dao.delete_for_user('oop_phrasebook', 1)
+        self.assertIsNone(self.dao.get_for_user('oop_phrasebook', 1))
+        self.assertEqual(self.dao.get_for_user('oop_phrasebook', 2), ('v1', [{'breakfast_id': 3, 'score': 0.1}]))
+
+    def test_namespaces(self):
+        """It keeps each implementation's recommendations for the same user apart"""
+        self.dao.replace_for_user('oop_phrasebook', 1, 'v1', [{'breakfast_id': 3, 'score': 0.9}])
+        self.assertIsNone(self.dao.get_for_user('oop_orm', 1))
+
+        self.dao.replace_for_user('oop_orm', 1, 'v2', [{'breakfast_id': 2, 'score': 0.0}])
+        self.dao.add_to_scores('oop_orm', 1, [(2, 0.5)])
+        self.assertEqual(self.dao.get_for_user('oop_phrasebook', 1), ('v1', [{'breakfast_id': 3, 'score': 0.9}]))
+        self.assertEqual(self.dao.get_for_user('oop_orm', 1), ('v2', [{'breakfast_id': 2, 'score': 0.5}]))
+
+        self.dao.delete_for_user('oop_orm', 1)
+        self.assertIsNone(self.dao.get_for_user('oop_orm', 1))
+        self.assertEqual(self.dao.get_for_user('oop_phrasebook', 1)[0], 'v1')
+
+
+class UserRecommendationStoreTestCase(PhrasebookFixturedTestCase, BaseTestCase):
+
+    def setUp(self):
+        super(UserRecommendationStoreTestCase, self).setUp()
+        self.app.config['RECOMMENDATION_STORE_ENABLED'] = True
+        self.store = UserRecommendationStore()
+
+    def get_recommendations(self, user_id):
+        """Get a user's recommendations without the store"""
+        user = UserModel()
+        user.load_by_id_with_preferences(user_id)
+        return user.get_recommendations()
+
+    def test_get(self):
+        """It scores a user once, then reads their recommendations from the store"""
+        expected = self.get_recommendations(1)
+        self.assertEqual(self.store.get(1), expected)
+
+        with mock.patch.object(UserRecommendationStore, 'recommend_many') as m_recommend_many:
+            self.assertEqual(self.store.get(1), expected)
+            self.assertEqual(self.store.get(1, limit=1), expected[:1])
+            self.assertFalse(m_recommend_many.called)
+
+        # expect users without preferences to have no recommendations, and unknown users to return None
+        self.assertEqual(self.store.get(4), [])
+        self.assertIsNone(self.store.get(0))
+
+    def test_abstract(self):
+        """It needs an implementation to tell it how to score users"""
+        self.assertRaises(TypeError, BaseRecommendationStore, 'oop_phrasebook')
+
+    def test_get_stale(self):
+        """It rescores a user whose recommendations were stored against another catalog"""
+        self.store.dao.replace_for_user('oop_phrasebook', 1, 'old-catalog', [{'breakfast_id': 3, 'score': 0.9}])
+        self.assertEqual(self.store.get(1, limit=2, min_score=1), self.get_recommendations(1)[:1])
+        self.assertEqual(self.store.dao.get_for_user('oop_phrasebook', 1)[0], self.store.load_catalog().version)
+
+    def test_rebuild_all(self):
+        """It stores recommendations for every user"""
+        self.assertEqual(self.store.rebuild_all(), 4)
+        for user_id in (1, 2, 3, 4):
+            self.assertEqual(self.store.dao.get_for_user('oop_phrasebook', user_id)[1],
+                             self.get_recommendations(user_id))
+
+    def test_preference_changes(self):
+        """It rescores a user when their preferences change"""
+        self.store.get(4)
+
+        pref = UserPreferenceModel()
+        pref.populate({'user_id': 4, 'ingredient_id': 3, 'coefficient': 1.0})
+        pref.save()
+        self.assertEqual(self.store.dao.get_for_user('oop_phrasebook', 4)[1], self.get_recommendations(4))
+        self.assertEqual(self.store.dao.get_for_user('oop_phrasebook', 4)[1][0], {'breakfast_id': 2, 'score': 0.9})
+
+        pref.delete()
+        self.assertEqual(self.store.dao.get_for_user('oop_phrasebook', 4)[1], [])
+
+    def test_apply_preference_changes(self):
+        """It updates the stored scores of the breakfasts using a changed ingredient without rescoring the user"""
+        self.store.get(1)
+
+        pref = UserPreferenceModel()
+        pref.load_by_user_ingredient(1, 3)
+        pref.coefficient = 0.0
+        with mock.patch.object(UserRecommendationStore, 'recommend_many') as m_recommend_many:
+            pref.save()
+            self.assertFalse(m_recommend_many.called)
+
+        stored = self.store.dao.get_for_user('oop_phrasebook', 1)[1]
+        expected = self.get_recommendations(1)
+        self.assertEqual([r['breakfast_id'] for r in stored], [1, 3, 2])
+        self.assertEqual([r['breakfast_id'] for r in stored], [r['breakfast_id'] for r in expected])
+        for stored_rec, expected_rec in zip(stored, expected):
+            self.assertAlmostEqual(stored_rec['score'], expected_rec['score'])
+
+    def test_apply_preference_changes_stale(self):
+        """It rescores a user in full if their stored recommendations can't be updated"""
+        self.store.dao.replace_for_user('oop_phrasebook', 1, 'old-catalog', [{'breakfast_id': 3, 'score': 0.9}])
+        self.store.apply_preference_changes(1, {3: -0.6})
+        self.assertEqual(self.store.dao.get_for_user('oop_phrasebook', 1)[1], self.get_recommendations(1))
+
+    def test_move_preference(self):
+        """It updates both users' stored recommendations when a preference moves to another user"""
+        self.store.get(1)
+        self.store.get(2)
+
+        pref = UserPreferenceModel()
+        pref.load_by_user_ingredient(1, 1)
+        pref.user_id = 2
+        with mock.patch('eggsnspam.oop_phrasebook.models.recommendation_cache') as m_cache:
+            pref.save()
+        m_cache.invalidate.assert_any_call('oop_phrasebook', 1)
+        m_cache.invalidate.assert_any_call('oop_phrasebook', 2)
+
+        for user_id in (1, 2):
+            stored = self.store.dao.get_for_user('oop_phrasebook', user_id)[1]
+            expected = self.get_recommendations(user_id)
+            self.assertEqual([r['breakfast_id'] for r in stored], [r['breakfast_id'] for r in expected])
+            for stored_rec, expected_rec in zip(stored, expected):
+                self.assertAlmostEqual(stored_rec['score'], expected_rec['score'])
+
+    def test_view(self):
+        """It serves recommendations from the store"""
+        url = "/oop_phrasebook/user/{}/breakfast_recommendations"
+        expected = self.get_recommendations(1)
+
+        response = self.client.get(url.format(1) + "?limit=2", content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['breakfast_recs'], expected[:2])
+        self.assertEqual(self.store.dao.get_for_user('oop_phrasebook', 1)[1], expected)
+
+        response = self.client.get(url.format(0), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_deletes(self):
+        """It keeps what the delete views delete whether or not the store is enabled"""
+        for enabled, user_id in ((False, 1), (True, 2)):
+            self.app.config['RECOMMENDATION_STORE_ENABLED'] = enabled
+            response = self.client.delete("/oop_phrasebook/user/{}/preference/3".format(user_id))
+            self.assertEqual(response.status_code, 204)
+            response = self.client.delete("/oop_phrasebook/user/{}".format(user_id))
+            self.assertEqual(response.status_code, 204)
+
+            db.session.rollback()
+            self.assertIsNone(UserPreferenceDao().get_by_user_ingredient(user_id, 3))
+            self.assertIsNone(UserDao().get_by_id(user_id))
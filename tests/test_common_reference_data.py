@@ -0,0 +1,123 @@
+import json
+
+import mock
+
+from . import BaseTestCase
+from .mixins import PhrasebookFixturedTestCase
+from .utils import AssertNumQueries
+from eggsnspam.common.reference_data import ReferenceData, ReferenceDataCache, reference_data_cache
+from eggsnspam.extensions import db
+
+
+class ReferenceDataTestCase(PhrasebookFixturedTestCase, BaseTestCase):
+
+    def rename_breakfast(self, id, name):
+        db.session.connection().execute("UPDATE tblBreakfast SET name=? WHERE id=?", name, id)
+
+    def test_load(self):
+        """It indexes the breakfasts and ingredients by ID"""
+        data = ReferenceData.load()
+        self.assertEqual(data.breakfasts[2], {'id': 2, 'name': 'Pancakes'})
+        self.assertEqual(data.ingredients[3], {'id': 3, 'name': 'Cantelope'})
+        self.assertEqual([row['id'] for row in data.get_breakfasts()], [1, 2, 3])
+
+        # expect rows for a list of IDs in that order, once each, leaving out missing IDs
+        self.assertEqual(data.get_ingredients([3, 1, 3, -1]),
+                         [{'id': 3, 'name': 'Cantelope'}, {'id': 1, 'name': 'Eggs'}])
+
+        # expect the version to only change with the rows
+        self.assertEqual(ReferenceData.load().version, data.version)
+        self.rename_breakfast(2, 'Waffles')
+        self.assertNotEqual(ReferenceData.load().version, data.version)
+
+    @mock.patch('eggsnspam.common.reference_data.threading.Thread')
+    @mock.patch('eggsnspam.common.reference_data.time.time')
+    def test_refresh_in_background(self, m_time, m_thread):
+        """It starts one background refresh once the snapshot is due, serving the old snapshot meanwhile"""
+        self.app.config['REFERENCE_DATA_REFRESH_INTERVAL'] = 60
+        cache = ReferenceDataCache()
+        m_time.return_value = 1000
+        data = cache.get()
+
+        m_time.return_value = 1059
+        self.assertIs(cache.get(), data)
+        self.assertFalse(m_thread.called)
+
+        m_time.return_value = 1060
+        self.assertIs(cache.get(), data)
+        self.assertIs(cache.get(), data)
+        self.assertEqual(m_thread.call_count, 1)
+        self.assertTrue(m_thread.return_value.start.called)
+
+        # expect no refreshes without an interval
+        self.app.config['REFERENCE_DATA_REFRESH_INTERVAL'] = None
+        cache = ReferenceDataCache()
+        cache.get()
+        m_time.return_value = 100000
+        cache.get()
+        self.assertEqual(m_thread.call_count, 1)
+
+    def test_refresh(self):
+        """It only replaces the snapshot when the tables have changed"""
+        cache = ReferenceDataCache()
+        data = cache.get()
+        self.assertFalse(cache.refresh())
+        self.assertIs(cache.get(), data)
+
+        self.rename_breakfast(2, 'Waffles')
+        self.assertTrue(cache.refresh())
+        self.assertEqual(cache.get().breakfasts[2]['name'], 'Waffles')
+
+    def test_reload(self):
+        """It reloads the snapshot straight away, and after it has been invalidated"""
+        cache = ReferenceDataCache()
+        data = cache.get()
+        self.assertIsNot(cache.reload(), data)
+
+        self.rename_breakfast(2, 'Waffles')
+        cache.invalidate()
+        self.assertEqual(cache.stats()['version'], None)
+        self.assertEqual(cache.get().breakfasts[2]['name'], 'Waffles')
+        self.assertEqual(cache.stats(), {'version': cache.get().version, 'breakfasts': 3, 'ingredients': 3})
+
+
+class ReferenceDataViewsTestCase(PhrasebookFixturedTestCase, BaseTestCase):
+
+    def setUp(self):
+        super(ReferenceDataViewsTestCase, self).setUp()
+        self.app.config['REFERENCE_DATA_SNAPSHOT_ENABLED'] = True
+
+    def get_json(self, url):
+        response = self.client.get(url, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)
+
+    def test_no_queries(self):
+        """It serves the breakfast and ingredient endpoints without querying the database once loaded"""
+        reference_data_cache.get()
+        with AssertNumQueries(db.session, 0):
+            for example in ('oop_phrasebook', 'oop_orm'):
+                self.assertEqual(self.get_json('/{}/breakfast/1'.format(example)), {'id': 1, 'name': 'Eggs and Spam'})
+                self.assertEqual(self.get_json('/{}/ingredient/?ids=3,1'.format(example))['ingredients'],
+                                 [{'id': 3, 'name': 'Cantelope'}, {'id': 1, 'name': 'Eggs'}])
+                self.assertEqual(len(self.get_json('/{}/breakfast/'.format(example))['breakfasts']), 3)
+                self.assertEqual(self.client.get('/{}/ingredient/-1'.format(example)).status_code, 404)
+
+        self.assertEqual(self.get_json('/oop_phrasebook/ingredient/')['ingredients'][1], {'id': 2, 'name': 'Spam'})
+        self.assertEqual(self.get_json('/oop_orm/ingredient/')['ingredients'][1], {'id': 2})
+
+    def test_reload_reference_data(self):
+        """It reloads the snapshot when an operator asks it to"""
+        self.assertEqual(self.get_json('/oop_orm/breakfast/2')['name'], 'Pancakes')
+        db.session.connection().execute("UPDATE tblBreakfast SET name='Waffles' WHERE id=2")
+        self.assertEqual(self.get_json('/oop_orm/breakfast/2')['name'], 'Pancakes')
+
+        response = self.client.post('/oop_phrasebook/admin/reference_data/reload')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['breakfasts'], 3)
+        self.assertEqual(self.get_json('/oop_orm/breakfast/2')['name'], 'Waffles')
+
+        # expect a 400 error while the snapshot is disabled
+        self.app.config['REFERENCE_DATA_SNAPSHOT_ENABLED'] = False
+        response = self.client.post('/oop_orm/admin/reference_data/reload')
+        self.assertEqual(response.status_code, 400)
@@ -1,7 +1,10 @@
+import mock
+
 from factories.oop_orm_factories import (BreakfastFactory, IngredientFactory, UserFactory,
                                          UserPreferenceFactory, BreakfastIngredientFactory)
 
 from eggsnspam.extensions import db
+from eggsnspam.oop_orm import models
 
 from . import BaseTestCase
 from .mixins import OrmTestCase
@@ -32,9 +35,9 @@ class UserTestCase(OrmTestCase, BaseTestCase):
 
         # expect a single recommendation with no breakfasts
         ingredient = IngredientFactory.create()
-        BreakfastIngredientFactory(breakfast=breakfast,
-                                   ingredient=ingredient,
-                                   coefficient=1)
+        breakfast_ingredient = BreakfastIngredientFactory(breakfast=breakfast,
+                                                          ingredient=ingredient,
+                                                          coefficient=1)
         self.assertEqual(len(user.get_recommendations()), 1)
         self.assertDictEqual(user.get_recommendations()[0], {'breakfast_id': breakfast.id, 'score': 0.0})
 
@@ -54,6 +57,11 @@ class UserTestCase(OrmTestCase, BaseTestCase):
         self.assertDictEqual(user.get_recommendations()[0], {'breakfast_id': breakfast.id, 'score': 1})
         self.assertDictEqual(user.get_recommendations()[1], {'breakfast_id': breakfast_2.id, 'score': 0.1})
 
+        # expect changes to a breakfast's ingredients to invalidate the cached catalog
+        breakfast_ingredient.coefficient = 0.5
+        db.session.flush()
+        self.assertDictEqual(user.get_recommendations()[0], {'breakfast_id': breakfast.id, 'score': 0.5})
+
 
 class UserPreferenceTestCase(OrmTestCase, BaseTestCase):
 
@@ -84,6 +92,15 @@ class BreakfastTestCase(OrmTestCase, BaseTestCase):
         breakfast = BreakfastFactory.build(**attrs)
         self.assertDictEqual(breakfast.to_dict(), attrs)
 
+    def test_get_by_ids(self):
+        """It gets the breakfasts for a list of IDs, a chunk at a time"""
+        breakfasts = [BreakfastFactory.create() for _ in range(3)]
+        ids = [breakfasts[2].id, -1, breakfasts[0].id, breakfasts[1].id, breakfasts[2].id]
+
+        with mock.patch.object(models.Breakfast, 'MAX_IN_CLAUSE_SIZE', 2):
+            self.assertEqual(models.Breakfast.get_by_ids(ids), [breakfasts[2], breakfasts[0], breakfasts[1]])
+        self.assertEqual(models.Breakfast.get_by_ids([]), [])
+
 
 class IngredientTestCase(OrmTestCase, BaseTestCase):
 
@@ -7,7 +7,7 @@ from eggsnspam.extensions import db
 from eggsnspam.oop_orm import models
 
 from . import BaseTestCase
-from .mixins import HealthViewTestCaseMixin, OrmTestCase
+from .mixins import HealthViewTestCaseMixin, OrmTestCase, SqlFixturedTestCase
 from .utils import AssertNumQueries
 
 
@@ -43,6 +43,21 @@ class BreakfastTestCase(OrmTestCase, BaseTestCase):
         for breakfast in response_data['breakfasts']:
             self.assertIn(breakfast['id'], breakfast_ids)
 
+    def test_list_breakfasts_by_ids(self):
+        """It lists the breakfasts with the IDs asked for in full, with one query"""
+        ids = [BreakfastFactory(name=name).id for name in ('eggs', 'spam', 'toast')]
+
+        with AssertNumQueries(db.session, 1):
+            response = self.client.get("/oop_orm/breakfast/?ids={},{},-1".format(ids[2], ids[0]),
+                                       content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual(response_data['breakfasts'], [{'id': ids[2], 'name': 'toast'}, {'id': ids[0], 'name': 'eggs'}])
+
+        # expect a 400 error for an invalid list of IDs
+        response = self.client.get("/oop_orm/breakfast/?ids=eggs")
+        self.assertEqual(response.status_code, 400)
+
     def test_get_breakfast(self):
         """It gets a breakfast object in the database"""
 
@@ -60,6 +75,18 @@ class BreakfastTestCase(OrmTestCase, BaseTestCase):
         self.assertEqual(breakfast.name, response_data['name'])
         self.assertEqual(breakfast.id, response_data['id'])
 
+    def test_get_breakfast_from_reference_data(self):
+        """It reloads the reference data snapshot once a new breakfast is flushed"""
+        self.app.config['REFERENCE_DATA_SNAPSHOT_ENABLED'] = True
+        response = self.client.get("/oop_orm/breakfast/1", content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+        breakfast = BreakfastFactory(name="eggs")
+        db.session.flush()
+        response = self.client.get("/oop_orm/breakfast/{}".format(breakfast.id), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {'id': breakfast.id, 'name': 'eggs'})
+
 
 class IngredientTestCase(OrmTestCase, BaseTestCase):
 
@@ -275,8 +302,30 @@ class UserTestCase(OrmTestCase, BaseTestCase):
         self.assertTrue('breakfast_id' in response_data['breakfast_recs'][0])
         self.assertTrue('score' in response_data['breakfast_recs'][0])
 
+        # expect only the top recommendations to be returned when a limit is given
+        response = self.client.get(url + "?limit=2", content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual([r['breakfast_id'] for r in response_data['breakfast_recs']],
+                         [breakfasts[0].id, breakfasts[2].id])
+
+        response = self.client.get(url + "?min_score=1", content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual([r['breakfast_id'] for r in response_data['breakfast_recs']], [breakfasts[0].id])
+
+        # expect invalid options to be rejected
+        response = self.client.get(url + "?limit=-1", content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class UserPreferencesTestCase(SqlFixturedTestCase, OrmTestCase, BaseTestCase):
 
-class UserPreferencesTestCase(OrmTestCase, BaseTestCase):
+    # The recommendation store's tables have no models, so create them from the table definitions. The tables with
+    # models already exist by then, so they are left alone.
+    sql_fixtures = [
+        'eggsnspam/table_defs/eggsnspam.sqlite3.sql',
+    ]
 
     list_url_template = "/oop_orm/user/{user_id}/preference/"
     detail_url_template = "/oop_orm/user/{user_id}/preference/{ingredient_id}"
@@ -438,3 +487,39 @@ class UserPreferencesTestCase(OrmTestCase, BaseTestCase):
         self.assertEqual(response.status_code, 204)
         self.assertIsNone(db.session.query(models.UserPreference).get(
             (self.user.id, user_preference.ingredient_id)))
+
+    def test_preference_changes_update_store(self):
+        """It updates the user's stored recommendations as their preferences change"""
+        self.app.config['RECOMMENDATION_STORE_ENABLED'] = True
+        store = models.UserRecommendationStore()
+
+        ingredient = IngredientFactory.create()
+        BreakfastIngredientFactory.create(ingredient=ingredient, coefficient=.5)
+        BreakfastIngredientFactory.create(ingredient=ingredient, coefficient=.25)
+        UserPreferenceFactory.create(user=self.user, ingredient=ingredient, coefficient=.2)
+        db.session.commit()
+        store.get(self.user.id)
+
+        def assert_stored_scores_match():
+            # Updated scores can differ from a full rescore by rounding, which can reorder breakfasts that tie
+            stored = {r['breakfast_id']: r['score'] for r in store.dao.get_for_user('oop_orm', self.user.id)[1]}
+            expected = {r['breakfast_id']: r['score'] for r in self.user.get_recommendations()}
+            self.assertEqual(sorted(stored), sorted(expected))
+            for breakfast_id, score in expected.items():
+                self.assertAlmostEqual(stored[breakfast_id], score)
+
+        url = self.detail_url_template.format(user_id=self.user.id, ingredient_id=ingredient.id)
+        response = self.client.put(url, content_type='application/json', data=json.dumps({"coefficient": .9}))
+        self.assertEqual(response.status_code, 200)
+        assert_stored_scores_match()
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        assert_stored_scores_match()
+
+        # expect recommendations the oop_phrasebook store holds for the same user ID to be left alone
+        store.dao.replace_for_user('oop_phrasebook', self.user.id, 'v1', [{'breakfast_id': 1, 'score': 1.08}])
+        store.delete(self.user.id)
+        self.assertIsNone(store.dao.get_for_user('oop_orm', self.user.id))
+        self.assertEqual(store.dao.get_for_user('oop_phrasebook', self.user.id)[1],
+                         [{'breakfast_id': 1, 'score': 1.08}])
@@ -18,14 +18,14 @@ class BreakfastCollectionTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         self.assertEqual(breakfast.id, 1)
         self.assertEqual(breakfast.name, 'Karma')
 
-    @mock.patch('eggsnspam.oop_phrasebook.daos.SqlBaseDao.fetchall')
-    def test_load_all(self, m_fetchall):
+    @mock.patch('eggsnspam.oop_phrasebook.daos.SqlBaseDao.iterate')
+    def test_load_all(self, m_iterate):
         """It gets all the breakfasts from the database"""
-        m_fetchall.return_value = [{'id': 1, 'name': 'Argyle'},
-                                   {'id': 2, 'name': 'Benedict'}]
+        m_iterate.return_value = [{'id': 1, 'name': 'Argyle'},
+                                  {'id': 2, 'name': 'Benedict'}]
         breakfast_collection = BreakfastCollection()
         self.assertTrue(breakfast_collection.load_all())
-        self.assertTrue(m_fetchall.called)
+        self.assertTrue(m_iterate.called)
         self.assertEqual(len(breakfast_collection.models), 2)
         self.assertEqual(breakfast_collection.models[0].id, 1)
         self.assertEqual(breakfast_collection.models[1].id, 2)
@@ -41,14 +41,14 @@ class IngredientCollectionTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         self.assertEqual(ingredient.id, 1)
         self.assertEqual(ingredient.name, 'Karma')
 
-    @mock.patch('eggsnspam.oop_phrasebook.daos.SqlBaseDao.fetchall')
-    def test_load_all(self, m_fetchall):
+    @mock.patch('eggsnspam.oop_phrasebook.daos.SqlBaseDao.iterate')
+    def test_load_all(self, m_iterate):
         """It gets all the ingredients from the database"""
-        m_fetchall.return_value = [{'id': 1, 'name': 'Argyle'},
-                                   {'id': 2, 'name': 'Benedict'}]
+        m_iterate.return_value = [{'id': 1, 'name': 'Argyle'},
+                                  {'id': 2, 'name': 'Benedict'}]
         ingredient_collection = IngredientCollection()
         self.assertTrue(ingredient_collection.load_all())
-        self.assertTrue(m_fetchall.called)
+        self.assertTrue(m_iterate.called)
         self.assertEqual(len(ingredient_collection.models), 2)
         self.assertEqual(ingredient_collection.models[0].id, 1)
         self.assertEqual(ingredient_collection.models[1].id, 2)
@@ -65,18 +65,47 @@ class UserCollectionTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         self.assertEqual(user.first_name, 'Karma')
         self.assertEqual(user.last_name, 'Kabana')
 
-    @mock.patch('eggsnspam.oop_phrasebook.daos.SqlBaseDao.fetchall')
-    def test_load_all(self, m_fetchall):
+    @mock.patch('eggsnspam.oop_phrasebook.daos.SqlBaseDao.iterate')
+    def test_load_all(self, m_iterate):
         """It gets all the Users from the database"""
-        m_fetchall.return_value = [{'id': 1, 'first_name': 'Argyle', 'last_name': 'Armani'},
-                                   {'id': 2, 'first_name': 'Benedict', 'last_name': 'Bernardo'}]
+        m_iterate.return_value = [{'id': 1, 'first_name': 'Argyle', 'last_name': 'Armani'},
+                                  {'id': 2, 'first_name': 'Benedict', 'last_name': 'Bernardo'}]
         user_collection = UserCollection()
         self.assertTrue(user_collection.load_all())
-        self.assertTrue(m_fetchall.called)
+        self.assertTrue(m_iterate.called)
         self.assertEqual(len(user_collection.models), 2)
         self.assertEqual(user_collection.models[0].id, 1)
         self.assertEqual(user_collection.models[1].id, 2)
 
+    def test_load_by_ids_with_preferences(self):
+        """It gets many users and their preferences from the database"""
+        user_collection = UserCollection()
+        self.assertTrue(user_collection.load_by_ids_with_preferences([2, 4]))
+        self.assertEqual([u.id for u in user_collection.models], [2, 4])
+        self.assertDictEqual(user_collection.models[0].preferences, {1: 0.9, 2: 0.3, 3: 0.1})
+        self.assertDictEqual(user_collection.models[1].preferences, {})
+
+    def test_get_recommendations(self):
+        """It gets recommended breakfasts for every user at once"""
+        user_collection = UserCollection()
+        user_collection.load_by_ids_with_preferences([1, 4, 2])
+        recommendations = user_collection.get_recommendations()
+
+        # expect each user to get the same recommendations as they would on their own
+        self.assertEqual(len(recommendations), 3)
+        self.assertEqual(recommendations[0], user_collection.models[0].get_recommendations())
+        self.assertEqual(recommendations[1], [])
+        self.assertEqual(recommendations[2], user_collection.models[2].get_recommendations())
+
+        recommendations = user_collection.get_recommendations(limit=1)
+        self.assertEqual([r['breakfast_id'] for r in recommendations[0]], [1])
+        self.assertEqual([r['breakfast_id'] for r in recommendations[2]], [1])
+
+        # expect a value error if preferences have not been loaded
+        user_collection.load_all()
+        with self.assertRaises(ValueError):
+            user_collection.get_recommendations()
+
 
 class UserPreferenceCollectionTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
@@ -17,9 +17,15 @@ class BreakfastDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         result = self.dao.get_by_id(-1)
         self.assertEqual(result, None)
 
+    def test_get_by_ids(self):
+        """It gets the records for a list of IDs"""
+        result = self.dao.get_by_ids([3, -1, 1])
+        self.assertEqual([r['id'] for r in result], [3, 1])
+        self.assertDictEqual(result[1], {'id': 1, 'name': 'Eggs and Spam'})
+
     def test_list_all(self):
         """It gets all records from the database"""
-        result = self.dao.list_all()
+        result = list(self.dao.list_all())
         self.assertEqual(len(result), 3)
         self.assertDictEqual(result[0], {'id': 1, 'name': 'Eggs and Spam'})
 
@@ -39,7 +45,7 @@ class IngredientDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
     def test_list_all(self):
         """It gets all records from the database"""
-        result = self.dao.list_all()
+        result = list(self.dao.list_all())
         self.assertEqual(len(result), 3)
         self.assertDictEqual(result[0], {'id': 1, 'name': 'Eggs'})
 
@@ -57,6 +63,13 @@ class UserDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         result = self.dao.get_by_id(-1)
         self.assertEqual(result, None)
 
+    def test_get_by_ids(self):
+        """It gets the records for a list of IDs"""
+        result = self.dao.get_by_ids([2, 1])
+        self.assertEqual([r['id'] for r in result], [2, 1])
+        self.assertDictEqual(result[1], {'id': 1, 'first_name': 'Adam', 'last_name': 'Anderson'})
+        self.assertEqual(self.dao.get_by_ids([-1]), [])
+
     def test_create(self):
         """It creates a new record"""
         result = self.dao.create(first_name='Darma', last_name='Dallas')
@@ -82,7 +95,7 @@ class UserDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
     def test_list_all(self):
         """It gets all records from the database"""
-        result = self.dao.list_all()
+        result = list(self.dao.list_all())
         self.assertEqual(len(result), 4)
         self.assertDictEqual(result[0], {'id': 1, 'first_name': 'Adam', 'last_name': 'Anderson'})
 
@@ -106,6 +119,38 @@ class UserDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         self.assertEqual(result['preferences'][2], 0.4)
         self.assertEqual(result['preferences'][3], 0.6)
 
+    def test_get_by_ids_join_preferences(self):
+        """It gets many users and all of their ingredient preferences"""
+
+        # expect users to come back in the order they were asked for, skipping ones that do not exist
+        result = self.dao.get_by_ids_join_preferences([4, 0, 1, 2, 1])
+        self.assertEqual([r['id'] for r in result], [4, 1, 2])
+        self.assertEqual(result[0]['preferences'], {})
+        self.assertDictEqual(result[1]['preferences'], {1: 0.8, 2: 0.4, 3: 0.6})
+        self.assertDictEqual(result[2]['preferences'], {1: 0.9, 2: 0.3, 3: 0.1})
+        self.assertEqual(result[2]['first_name'], 'Betty')
+
+        # expect long lists of IDs to be split across several queries
+        self.dao.MAX_IN_CLAUSE_SIZE = 2
+        result = self.dao.get_by_ids_join_preferences([1, 2, 3, 4])
+        self.assertEqual([r['id'] for r in result], [1, 2, 3, 4])
+        self.assertDictEqual(result[2]['preferences'], {1: 0.8, 2: 0.9, 3: 0.8})
+
+        self.assertEqual(self.dao.get_by_ids_join_preferences([]), [])
+
+    def test_get_id_range(self):
+        """It gets the lowest and highest user IDs"""
+        self.assertEqual(self.dao.get_id_range(), (1, 4))
+        for user_id in (1, 2, 3, 4):
+            self.dao.delete(user_id)
+        self.assertIsNone(self.dao.get_id_range())
+
+    def test_list_ids_between(self):
+        """It lists the user IDs in a range, a page at a time"""
+        self.assertEqual(self.dao.list_ids_between(2, 4, limit=10), [2, 3, 4])
+        self.assertEqual(self.dao.list_ids_between(2, 4, limit=2), [2, 3])
+        self.assertEqual(self.dao.list_ids_between(5, 10, limit=10), [])
+
 
 class UserPreferenceDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
@@ -134,7 +179,7 @@ class UserPreferenceDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
     def test_list_all_for_user(self):
         """It gets all records from the database"""
-        result = self.dao.list_all_for_user(1)
+        result = list(self.dao.list_all_for_user(1))
         self.assertEqual(len(result), 3)
         self.assertDictEqual(result[0], {'coefficient': 0.8, 'ingredient_id': 1, 'user_id': 1, 'id': 1})
 
@@ -165,6 +210,14 @@ class BreakfastIngredientTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
     def test_list_all(self):
         """It gets all records from the database"""
-        result = self.dao.list_all()
+        result = list(self.dao.list_all())
         self.assertEqual(len(result), 9)
-        self.assertDictEqual(result[0], {u'breakfast_id': 1, u'coefficient': 0.8, u'ingredient_id': 1})
+        self.assertDictEqual(dict(result[0]), {u'breakfast_id': 1, u'coefficient': 0.8, u'ingredient_id': 1})
+
+    def test_list_all_columns(self):
+        """It gets all records from the database as columns"""
+        breakfast_ids, ingredient_ids, coefficients = self.dao.list_all_columns()
+        rows = [dict(r) for r in self.dao.list_all()]
+        self.assertEqual(breakfast_ids.tolist(), [r['breakfast_id'] for r in rows])
+        self.assertEqual(ingredient_ids.tolist(), [r['ingredient_id'] for r in rows])
+        self.assertEqual(coefficients.tolist(), [r['coefficient'] for r in rows])
@@ -214,17 +214,11 @@ class UserModelTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         user.last_name = 'Kabana'
 
         mock_dao = mock.MagicMock()
-        mock_dao.list_all.return_value = [
-            {u'breakfast_id': 1, u'ingredient_id': 1, u'coefficient': 0.8},
-            {u'breakfast_id': 1, u'ingredient_id': 2, u'coefficient': 0.8},
-            {u'breakfast_id': 1, u'ingredient_id': 3, u'coefficient': 0.2},
-            {u'breakfast_id': 2, u'ingredient_id': 1, u'coefficient': 0.0},
-            {u'breakfast_id': 2, u'ingredient_id': 2, u'coefficient': 0.2},
-            {u'breakfast_id': 2, u'ingredient_id': 3, u'coefficient': 0.9},
-            {u'breakfast_id': 3, u'ingredient_id': 1, u'coefficient': 0.9},
-            {u'breakfast_id': 3, u'ingredient_id': 2, u'coefficient': 0.5},
-            {u'breakfast_id': 3, u'ingredient_id': 3, u'coefficient': 0.1}
-        ]
+        mock_dao.list_all_columns.return_value = (
+            [1, 1, 1, 2, 2, 2, 3, 3, 3],
+            [1, 2, 3, 1, 2, 3, 1, 2, 3],
+            [0.8, 0.8, 0.2, 0.0, 0.2, 0.9, 0.9, 0.5, 0.1],
+        )
 
         # Expect a value error if we have not loaded recommendations
         with self.assertRaises(ValueError):
@@ -246,6 +240,10 @@ class UserModelTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         self.assertEqual(recommendations[2]['breakfast_id'], 3)
         self.assertEqual(recommendations[2]['score'], 0.25)
 
+        # expect the breakfast catalog to be served from memory once it has been loaded
+        user.get_recommendations(breakfast_ingredient_dao=mock_dao)
+        self.assertFalse(mock_dao.list_all_columns.called)
+
 
 class UserPreferenceModelTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
@@ -46,6 +46,24 @@ class BreakfastTestCase(BaseTestCase):
         for breakfast in response_data['breakfasts']:
             self.assertIn(breakfast['id'], breakfast_ids)
 
+    @mock.patch('eggsnspam.oop_phrasebook.daos.BreakfastDao.list_all')
+    @mock.patch('eggsnspam.oop_phrasebook.daos.BreakfastDao.get_by_ids')
+    def test_list_breakfasts_by_ids(self, m_get_by_ids, m_list_all):
+        """It lists only the breakfasts with the IDs asked for"""
+        m_get_by_ids.return_value = [{'id': 3, 'name': 'Pancakes'}, {'id': 1, 'name': 'Eggs'}]
+
+        response = self.client.get("/oop_phrasebook/breakfast/?ids=3,1,7",
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(m_get_by_ids.call_args[0][0], (3, 1, 7))
+        self.assertFalse(m_list_all.called)
+        response_data = json.loads(response.data)
+        self.assertEqual(response_data['breakfasts'], m_get_by_ids.return_value)
+
+        # expect a 400 error for an invalid list of IDs
+        response = self.client.get("/oop_phrasebook/breakfast/?ids=one,two")
+        self.assertEqual(response.status_code, 400)
+
     @mock.patch('eggsnspam.oop_phrasebook.daos.BreakfastDao.get_by_id')
     def test_get_breakfast(self, m_get_by_id):
         """It lists all the breakfasts in the database"""
@@ -206,23 +224,17 @@ class UserTestCase(BaseTestCase):
         self.assertEqual(response_data['first_name'], mocked_user_data['first_name'])
         self.assertEqual(response_data['last_name'], mocked_user_data['last_name'])
 
-    @mock.patch('eggsnspam.oop_phrasebook.daos.BreakfastIngredientDao.list_all')
+    @mock.patch('eggsnspam.oop_phrasebook.daos.BreakfastIngredientDao.list_all_columns')
     @mock.patch('eggsnspam.oop_phrasebook.daos.UserDao.get_by_id_join_preferences')
-    def test_breakfast_recommendations(self, m_get_by_id_join_preferences, m_list_all):
+    def test_breakfast_recommendations(self, m_get_by_id_join_preferences, m_list_all_columns):
         """It returns the recommended breakfasts for a user"""
 
         # Expect a 404 resposne code if the user does not exist
-        m_list_all.return_value = [
-            {u'breakfast_id': 1, u'ingredient_id': 1, u'coefficient': 0.8},
-            {u'breakfast_id': 1, u'ingredient_id': 2, u'coefficient': 0.8},
-            {u'breakfast_id': 1, u'ingredient_id': 3, u'coefficient': 0.2},
-            {u'breakfast_id': 2, u'ingredient_id': 1, u'coefficient': 0.0},
-            {u'breakfast_id': 2, u'ingredient_id': 2, u'coefficient': 0.2},
-            {u'breakfast_id': 2, u'ingredient_id': 3, u'coefficient': 0.9},
-            {u'breakfast_id': 3, u'ingredient_id': 1, u'coefficient': 0.9},
-            {u'breakfast_id': 3, u'ingredient_id': 2, u'coefficient': 0.5},
-            {u'breakfast_id': 3, u'ingredient_id': 3, u'coefficient': 0.1}
-        ]
+        m_list_all_columns.return_value = (
+            [1, 1, 1, 2, 2, 2, 3, 3, 3],
+            [1, 2, 3, 1, 2, 3, 1, 2, 3],
+            [0.8, 0.8, 0.2, 0.0, 0.2, 0.9, 0.9, 0.5, 0.1],
+        )
 
         m_get_by_id_join_preferences.return_value = None
         response = self.client.get("/oop_phrasebook/user/0/breakfast_recommendations",
@@ -250,6 +262,52 @@ class UserTestCase(BaseTestCase):
         self.assertTrue('breakfast_id' in response_data['breakfast_recs'][0])
         self.assertTrue('score' in response_data['breakfast_recs'][0])
 
+        # expect only the top recommendations to be returned when a limit is given
+        response = self.client.get("/oop_phrasebook/user/1/breakfast_recommendations?limit=2&min_score=0.7",
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual([r['breakfast_id'] for r in response_data['breakfast_recs']], [1])
+
+        # expect invalid options to be rejected
+        response = self.client.get("/oop_phrasebook/user/1/breakfast_recommendations?limit=none",
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch('eggsnspam.oop_phrasebook.daos.BreakfastIngredientDao.list_all_columns')
+    @mock.patch('eggsnspam.oop_phrasebook.daos.UserDao.get_by_ids_join_preferences')
+    def test_batch_breakfast_recommendations(self, m_get_by_ids_join_preferences, m_list_all_columns):
+        """It returns the recommended breakfasts for many users at once"""
+        url = "/oop_phrasebook/user/breakfast_recommendations"
+        m_list_all_columns.return_value = ([1, 1, 2, 2], [1, 2, 2, 3], [0.8, 0.8, 0.2, 0.9])
+        m_get_by_ids_join_preferences.return_value = [
+            {'id': 1, 'first_name': 'Adam', 'last_name': 'Anderson', 'preferences': {1: 0.5}},
+            {'id': 2, 'first_name': 'Betty', 'last_name': 'Blevins', 'preferences': {}},
+            {'id': 3, 'first_name': 'Carl', 'last_name': 'Cadigan', 'preferences': {3: 1.0}},
+        ]
+
+        response = self.client.post(url + "?limit=1",
+                                    content_type='application/json',
+                                    data=json.dumps({'user_ids': [1, 2, 3, 4]}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(m_get_by_ids_join_preferences.call_args[0][0], [1, 2, 3, 4])
+        response_data = json.loads(response.data)
+
+        # expect users who do not exist to be left out, and users without preferences to get no recommendations
+        self.assertEqual(response_data['user_breakfast_recs'], [
+            {'user_id': 1, 'breakfast_recs': [{'breakfast_id': 1, 'score': 0.4}]},
+            {'user_id': 2, 'breakfast_recs': []},
+            {'user_id': 3, 'breakfast_recs': [{'breakfast_id': 2, 'score': 0.9}]},
+        ])
+
+        # expect a 400 error if no users or an invalid list of users is given
+        response = self.client.post(url, content_type='application/json', data=json.dumps({'user_ids': []}))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, content_type='application/json', data=json.dumps({'user_ids': ['one']}))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, content_type='application/json', data=json.dumps({}))
+        self.assertEqual(response.status_code, 400)
+
     @mock.patch('eggsnspam.oop_phrasebook.daos.UserDao.get_by_id')
     @mock.patch('eggsnspam.oop_phrasebook.daos.UserDao.update')
     def test_update_user(self, m_update, m_get_by_id):
@@ -11,15 +11,43 @@ class BreakfastRecsDaoTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
     def test_get_ingredient_preferences(self):
         """It gets a user's ingredient preferences"""
-        prefs = self.dao.get_ingredient_preferences(1)
+        prefs = list(self.dao.get_ingredient_preferences(1))
         self.assertEqual(len(prefs), 3)
         self.assertTrue('coefficient' in prefs[0].keys())
         self.assertTrue('ingredient_id' in prefs[0].keys())
 
+        # expect preferences not to be cut off at MAX_RESULTS_SIZE
+        self.dao.MAX_RESULTS_SIZE = 2
+        self.dao.chunk_size = 2
+        self.assertEqual(len(list(self.dao.get_ingredient_preferences(1))), 3)
+
     def test_get_all_breakfast_ingredients(self):
         """It gets all breakfasts for all ingredients"""
-        ingredients = self.dao.get_all_breakfast_ingredients()
+        ingredients = list(self.dao.get_all_breakfast_ingredients())
         self.assertEqual(len(ingredients), 9)
         self.assertTrue('coefficient' in ingredients[0].keys())
         self.assertTrue('ingredient_id' in ingredients[0].keys())
         self.assertTrue('breakfast_id' in ingredients[0].keys())
+
+    def test_get_all_breakfast_ingredient_columns(self):
+        """It gets all breakfasts for all ingredients as columns"""
+        breakfast_ids, ingredient_ids, coefficients = self.dao.get_all_breakfast_ingredient_columns()
+        ingredients = list(self.dao.get_all_breakfast_ingredients())
+        self.assertEqual(len(breakfast_ids), 9)
+        self.assertEqual(list(zip(breakfast_ids.tolist(), ingredient_ids.tolist(), coefficients.tolist())),
+                         [(i['breakfast_id'], i['ingredient_id'], i['coefficient']) for i in ingredients])
+
+    def test_get_breakfast_scores(self):
+        """It scores breakfasts in the database, best match first"""
+        scores = self.dao.get_breakfast_scores(1)
+        self.assertEqual([s['breakfast_id'] for s in scores], [1, 3, 2])
+        for score, expected in zip(scores, [1.08, 0.98, 0.62]):
+            self.assertAlmostEqual(score['score'], expected)
+
+        self.assertEqual([s['breakfast_id'] for s in self.dao.get_breakfast_scores(1, limit=2)], [1, 3])
+        self.assertEqual([s['breakfast_id'] for s in self.dao.get_breakfast_scores(1, min_score=1)], [1])
+
+        # expect breakfasts sharing no ingredients with the user to score 0, tied in ID order
+        self.assertEqual(self.dao.get_breakfast_scores(0), [{'breakfast_id': 1, 'score': 0.0},
+                                                            {'breakfast_id': 2, 'score': 0.0},
+                                                            {'breakfast_id': 3, 'score': 0.0}])
@@ -9,20 +9,14 @@ from .mixins import PhrasebookFixturedTestCase
 class BreakfastTestCase(PhrasebookFixturedTestCase, BaseTestCase):
 
     @mock.patch('eggsnspam.simple_phrasebook.daos.BreakfastRecsDao.get_ingredient_preferences')
-    @mock.patch('eggsnspam.simple_phrasebook.daos.BreakfastRecsDao.get_all_breakfast_ingredients')
-    def test_breakfast_recommendations(self, m_get_all_breakfast_ingredients, m_get_ingredient_preferences):
+    @mock.patch('eggsnspam.simple_phrasebook.daos.BreakfastRecsDao.get_all_breakfast_ingredient_columns')
+    def test_breakfast_recommendations(self, m_get_all_breakfast_ingredient_columns, m_get_ingredient_preferences):
         """It returns the recommended breakfasts for a user"""
-        m_get_all_breakfast_ingredients.return_value = [
-            {'breakfast_id': 1, 'ingredient_id': 1, 'coefficient': 0.8},
-            {'breakfast_id': 1, 'ingredient_id': 2, 'coefficient': 0.8},
-            {'breakfast_id': 1, 'ingredient_id': 3, 'coefficient': 0.2},
-            {'breakfast_id': 2, 'ingredient_id': 1, 'coefficient': 0.0},
-            {'breakfast_id': 2, 'ingredient_id': 2, 'coefficient': 0.2},
-            {'breakfast_id': 2, 'ingredient_id': 3, 'coefficient': 0.9},
-            {'breakfast_id': 3, 'ingredient_id': 1, 'coefficient': 0.9},
-            {'breakfast_id': 3, 'ingredient_id': 2, 'coefficient': 0.5},
-            {'breakfast_id': 3, 'ingredient_id': 3, 'coefficient': 0.1}
-        ]
+        m_get_all_breakfast_ingredient_columns.return_value = (
+            [1, 1, 1, 2, 2, 2, 3, 3, 3],
+            [1, 2, 3, 1, 2, 3, 1, 2, 3],
+            [0.8, 0.8, 0.2, 0.0, 0.2, 0.9, 0.9, 0.5, 0.1],
+        )
 
         m_get_ingredient_preferences.return_value = [
             {'ingredient_id': 1, 'coefficient': 0.8},
@@ -38,3 +32,104 @@ class BreakfastTestCase(PhrasebookFixturedTestCase, BaseTestCase):
         self.assertEqual(len(response_data['breakfast_recs']), 3)
         self.assertTrue('breakfast_id' in response_data['breakfast_recs'][0])
         self.assertTrue('score' in response_data['breakfast_recs'][0])
+
+    def test_breakfast_recommendations_limit(self):
+        """It returns only the top recommended breakfasts for a user"""
+        url = "/simple_phrasebook/user/1/breakfast_recommendations"
+
+        response = self.client.get(url + "?limit=2", content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual([r['breakfast_id'] for r in response_data['breakfast_recs']], [1, 3])
+
+        response = self.client.get(url + "?limit=2&min_score=1", content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual([r['breakfast_id'] for r in response_data['breakfast_recs']], [1])
+
+        # expect invalid options to be rejected
+        self.assertEqual(self.client.get(url + "?limit=0").status_code, 400)
+        self.assertEqual(self.client.get(url + "?limit=ten").status_code, 400)
+        self.assertEqual(self.client.get(url + "?min_score=high").status_code, 400)
+
+    def test_breakfast_recommendations_sql(self):
+        """It scores breakfasts in the database when configured to, with the same results"""
+        url = "/simple_phrasebook/user/{}/breakfast_recommendations{}"
+
+        for user_id in (1, 2, 0):
+            for query_string in ("", "?limit=2", "?min_score=0.9"):
+                self.app.config['RECOMMENDATION_SCORING_MODE'] = 'python'
+                expected = json.loads(self.client.get(url.format(user_id, query_string)).data)['breakfast_recs']
+
+                self.app.config['RECOMMENDATION_SCORING_MODE'] = 'sql'
+                with mock.patch('eggsnspam.simple_phrasebook.daos.BreakfastRecsDao.'
+                                'get_all_breakfast_ingredient_columns') as m_get_all_breakfast_ingredient_columns:
+                    response = self.client.get(url.format(user_id, query_string))
+                    self.assertFalse(m_get_all_breakfast_ingredient_columns.called)
+                self.assertEqual(response.status_code, 200)
+
+                results = json.loads(response.data)['breakfast_recs']
+                self.assertEqual([r['breakfast_id'] for r in results], [r['breakfast_id'] for r in expected])
+                for result, expected_result in zip(results, expected):
+                    self.assertAlmostEqual(result['score'], expected_result['score'])
+
+    def test_breakfast_recommendations_strategy(self):
+        """It scores breakfasts with the requested strategy, or the configured one"""
+        url = "/simple_phrasebook/user/1/breakfast_recommendations"
+
+        response = self.client.get(url + "?strategy=cosine", content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['breakfast_recs']
+        self.assertEqual([r['breakfast_id'] for r in results], [3, 1, 2])
+        self.assertTrue(all(0 < r['score'] <= 1 for r in results))
+
+        self.app.config['RECOMMENDATION_SCORING_STRATEGY'] = 'cosine'
+        self.assertEqual(json.loads(self.client.get(url).data)['breakfast_recs'], results)
+        response = self.client.get(url + "?strategy=dot_product")
+        self.assertEqual([r['breakfast_id'] for r in json.loads(response.data)['breakfast_recs']], [1, 3, 2])
+
+        # expect the catalog to be used for strategies the database can't score
+        self.app.config['RECOMMENDATION_SCORING_MODE'] = 'sql'
+        self.assertEqual(json.loads(self.client.get(url).data)['breakfast_recs'], results)
+
+        # expect unknown strategies to be rejected
+        self.assertEqual(self.client.get(url + "?strategy=magic").status_code, 400)
+
+    def test_breakfast_recommendations_explain(self):
+        """It lists the ingredients contributing most to each breakfast's score when asked to"""
+        url = "/simple_phrasebook/user/1/breakfast_recommendations"
+
+        response = self.client.get(url + "?limit=1&explain=1", content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['breakfast_recs']
+        self.assertEqual(results[0]['breakfast_id'], 1)
+        self.assertEqual([c['ingredient_id'] for c in results[0]['contributions']], [1, 2, 3])
+        self.assertAlmostEqual(sum(c['score'] for c in results[0]['contributions']), results[0]['score'])
+
+        # expect the database to leave the explaining to the catalog
+        self.app.config['RECOMMENDATION_SCORING_MODE'] = 'sql'
+        self.assertEqual(json.loads(self.client.get(url + "?limit=1&explain=1").data)['breakfast_recs'], results)
+
+        response = self.client.get(url + "?limit=1&explain=0", content_type='application/json')
+        self.assertNotIn('contributions', json.loads(response.data)['breakfast_recs'][0])
+
+    def test_breakfast_recommendations_filters(self):
+        """It only recommends breakfasts passing the ingredient filters"""
+        url = "/simple_phrasebook/user/1/breakfast_recommendations"
+
+        def get_ids(query_string):
+            response = self.client.get(url + query_string, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            return [r['breakfast_id'] for r in json.loads(response.data)['breakfast_recs']]
+
+        self.assertEqual(get_ids("?exclude_ingredients=1"), [2])
+        self.assertEqual(get_ids("?require_ingredients=2,3"), [1, 3, 2])
+        self.assertEqual(get_ids("?require_ingredients=1&exclude_ingredients=3"), [])
+
+        # expect the database to leave the filtering to the catalog
+        self.app.config['RECOMMENDATION_SCORING_MODE'] = 'sql'
+        self.assertEqual(get_ids("?exclude_ingredients=1"), [2])
+
+        # expect invalid lists of ingredients to be rejected
+        self.assertEqual(self.client.get(url + "?exclude_ingredients=eggs").status_code, 400)
+        self.assertEqual(self.client.get(url + "?require_ingredients=1,,2").status_code, 400)